@@ -0,0 +1,162 @@
+import os
+import re
+import asyncio
+from typing import Dict, Any, Iterator, Optional, Tuple, TYPE_CHECKING
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+
+if TYPE_CHECKING:
+    # Sólo para anotaciones: los servicios (PyMuPDF, NumPy) se importan en el lifespan de app.main
+    from app.services.data_core.viewer import DocumentViewer
+
+router = APIRouter()
+
+# Las páginas y el PDF de un hash no cambian nunca: el navegador puede reutilizarlos
+CACHE_CONTROL = "private, max-age=86400"
+PDF_CHUNK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def get_viewer(request: Request) -> "DocumentViewer":
+    """
+    Servicio de páginas creado en el arranque de la app (ver lifespan en app.main).
+    """
+    return request.app.state.viewer
+
+
+def _get_document(viewer: "DocumentViewer", document_id: str) -> Dict[str, Any]:
+    record = viewer.document(document_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Documento no encontrado")
+    return record
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
+async def _run(viewer_call, *args):
+    """
+    Render y extracción de texto fuera del event loop (PyMuPDF libera el GIL al rasterizar).
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, viewer_call, *args)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/documents/{document_id}/pages/{page_number}/image")
+async def get_page_image(document_id: str, page_number: int, request: Request,
+                         dpi: Optional[int] = Query(None, description="Resolución del render (36-300)."),
+                         viewer: "DocumentViewer" = Depends(get_viewer)):
+    """
+    Imagen PNG de una página (numeración del documento original) con ETag y caché en disco.
+    """
+    record = _get_document(viewer, document_id)
+    dpi = viewer.clamp_dpi(dpi)
+    try:
+        etag = viewer.etag(record, viewer.page_index(record, page_number), dpi)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    data = await _run(viewer.render_page, record, page_number, dpi)
+    return Response(content=data, media_type="image/png", headers=headers)
+
+
+@router.get("/documents/{document_id}/pages/{page_number}/text")
+async def get_page_text(document_id: str, page_number: int, viewer: "DocumentViewer" = Depends(get_viewer)):
+    """
+    Texto de una página y sus dimensiones en puntos PDF.
+    """
+    record = _get_document(viewer, document_id)
+    return await _run(viewer.page_text, record, page_number)
+
+
+@router.get("/documents/{document_id}/pages/{page_number}/highlights")
+async def get_page_highlights(document_id: str, page_number: int,
+                              text: str = Query(..., description="Fragmento citado (text_snippet)."),
+                              viewer: "DocumentViewer" = Depends(get_viewer)):
+    """
+    Rectángulos a resaltar para el fragmento citado, en puntos PDF (escalar por dpi / 72).
+    """
+    record = _get_document(viewer, document_id)
+    return await _run(viewer.highlights, record, page_number, text)
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Rango de bytes (inclusive) de una cabecera Range de un solo tramo.
+
+    Returns:
+        tuple | None: (inicio, fin) o None si la cabecera no se entiende (se sirve completo).
+
+    Raises:
+        ValueError: Si el rango no es satisfacible.
+    """
+    match = _RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        # Sufijo: los últimos N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _iter_file(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(PDF_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@router.get("/documents/{document_id}/file")
+def get_document_file(document_id: str, request: Request, viewer: "DocumentViewer" = Depends(get_viewer)):
+    """
+    PDF saneado del documento con soporte de Range (peticiones parciales de visores tipo
+    pdf.js), If-Range y ETag.
+    """
+    record = _get_document(viewer, document_id)
+    path = record["local_path"]
+    size = os.path.getsize(path)
+    etag = viewer.etag(record)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": CACHE_CONTROL}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    headers["Content-Length"] = str(length)
+    headers["Content-Disposition"] = f'inline; filename="{document_id}.pdf"'
+    if byte_range is not None:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(_iter_file(path, start, length), status_code=206 if byte_range else 200,
+                             media_type="application/pdf", headers=headers)
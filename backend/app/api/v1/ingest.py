@@ -1,39 +1,234 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Header, Depends, Request
 from fastapi.responses import StreamingResponse
-import shutil
+from typing import Optional, TYPE_CHECKING
+import aiofiles
+import asyncio
+import hashlib
+import json
 from pathlib import Path
+from uuid import uuid4
 import os
 
-from app.services.data_core.engine import DataCoreEngine
+from app.services.data_core.bulk import resolve_import_directory
+
+if TYPE_CHECKING:
+    # Sólo para anotaciones: los servicios (PyMuPDF, NumPy) se importan en el lifespan de app.main
+    from app.services.data_core.bulk import BulkIngestor
+    from app.services.data_core.jobs.manager import JobManager
 
 router = APIRouter()
-engine = DataCoreEngine()
 
 TEMP_DIR = Path("./data/temp")
-TEMP_DIR.mkdir(parents=True, exist_ok=True)
 
-@router.post("/upload")
-async def ingest_document(file: UploadFile = File(...)):
+# Límites de subida (configurables por entorno)
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_MB", "1024")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+
+# Ingestas masivas en curso: el loop sólo guarda referencias débiles a sus tareas
+_bulk_tasks: "set[asyncio.Task]" = set()
+
+
+def get_jobs(request: Request) -> "JobManager":
     """
-    Endpoint de ingesta con Streaming de Logs.
+    Gestor de jobs de ingesta creado en el arranque de la app (ver lifespan en app.main).
     """
-    print(f"DEBUG: Received upload request for {file.filename}")
-    
-    # Guardar temporalmente el archivo subido
-    temp_path = TEMP_DIR / file.filename
-    
+    return request.app.state.jobs
+
+
+def get_bulk(request: Request) -> "BulkIngestor":
+    return request.app.state.bulk
+
+
+async def _save_upload(file: UploadFile, dest: Path) -> tuple[int, str]:
+    """
+    Copia el archivo subido a disco en bloques acotados, calculando el SHA-256 al vuelo.
+
+    Returns:
+        tuple: (tamaño en bytes, hash SHA-256 hexadecimal).
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    async with aiofiles.open(dest, "wb") as buffer:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_UPLOAD_SIZE:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"El archivo excede el tamaño máximo permitido ({MAX_UPLOAD_SIZE // (1024 * 1024)} MB)"
+                )
+            sha256.update(chunk)
+            await buffer.write(chunk)
+    return size, sha256.hexdigest()
+
+
+async def _receive_upload(file: UploadFile) -> tuple[Path, str, str]:
+    """
+    Guarda el archivo subido en TEMP_DIR (nombre único para evitar colisiones).
+
+    Returns:
+        tuple: (ruta temporal, nombre original, hash SHA-256).
+    """
+    original_name = Path(file.filename or "documento.pdf").name
+    TEMP_DIR.mkdir(parents=True, exist_ok=True)
+    temp_path = TEMP_DIR / f"{uuid4().hex}_{original_name}"
+
     try:
-        # Write file asynchronously
-        content = await file.read()
-        with open(temp_path, "wb") as buffer:
-            buffer.write(content)
-        print(f"DEBUG: File saved to {temp_path}")
+        size, content_hash = await _save_upload(file, temp_path)
+        print(f"DEBUG: File saved to {temp_path} ({size} bytes, sha256={content_hash[:12]})")
+    except HTTPException:
+        temp_path.unlink(missing_ok=True)
+        raise
     except Exception as e:
+        temp_path.unlink(missing_ok=True)
         print(f"ERROR: Failed to save file: {e}")
         raise HTTPException(status_code=500, detail=f"Error saving temp file: {e}")
+    finally:
+        await file.close()
+    return temp_path, original_name, content_hash
+
+
+def _job_summary(job: dict) -> dict:
+    """
+    Vista pública de un job (sin el estado interno del pipeline).
+    """
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "original_name": job["original_name"],
+        "record_id": job["record_id"],
+        "error": job["error"],
+        "created": job["created"],
+        "updated": job["updated"],
+    }
+
+
+def _check_project(jobs: "JobManager", project_id: Optional[str]):
+    if project_id and (jobs.projects is None or jobs.projects.store.get(project_id) is None):
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+
+
+@router.post("/upload")
+async def ingest_document(file: UploadFile = File(...), project_id: Optional[str] = Form(None),
+                          jobs: "JobManager" = Depends(get_jobs)):
+    """
+    Endpoint de ingesta con Streaming de Logs.
+
+    El procesamiento corre como job en segundo plano: si el cliente se desconecta, la
+    ingesta continúa y su progreso puede consultarse en /jobs/{job_id}. Con `project_id`,
+    el documento se ingesta en el Store D y se agrega a ese proyecto.
+    """
+    print(f"DEBUG: Received upload request for {file.filename}")
+    _check_project(jobs, project_id)
+    temp_path, original_name, content_hash = await _receive_upload(file)
+    job = jobs.submit(str(temp_path), original_name, content_hash=content_hash, project_id=project_id)
+
+    async def stream_logs():
+        async for _, line in jobs.events(job["id"]):
+            yield line
+
+    return StreamingResponse(stream_logs(), media_type="text/plain", headers={"X-Job-Id": job["id"]})
+
+
+@router.post("/jobs", status_code=202)
+async def create_job(file: UploadFile = File(...), project_id: Optional[str] = Form(None),
+                     jobs: "JobManager" = Depends(get_jobs)):
+    """
+    Encola la ingesta de un documento (opcionalmente para un proyecto) y responde de
+    inmediato con el ID del job.
+    """
+    print(f"DEBUG: Received job request for {file.filename}")
+    _check_project(jobs, project_id)
+    temp_path, original_name, content_hash = await _receive_upload(file)
+    job = jobs.submit(str(temp_path), original_name, content_hash=content_hash, project_id=project_id)
+    return _job_summary(job)
+
+
+@router.get("/jobs")
+def list_jobs(limit: int = 50, offset: int = 0, status: Optional[str] = None,
+              jobs: "JobManager" = Depends(get_jobs)):
+    return [_job_summary(job) for job in jobs.list(limit=limit, offset=offset, status=status)]
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str, jobs: "JobManager" = Depends(get_jobs)):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    summary = _job_summary(job)
+    summary["completed_stages"] = job["state"].get("completed_stages", [])
+    summary["record"] = job["state"].get("record")
+    return summary
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, last_event_id: Optional[int] = Header(None),
+                     jobs: "JobManager" = Depends(get_jobs)):
+    """
+    Logs del job como Server-Sent Events. Admite reconexión con el header Last-Event-ID.
+    """
+    if jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+
+    async def stream_events():
+        async for seq, line in jobs.events(job_id, after=last_event_id or 0):
+            yield f"id: {seq}\ndata: {line.rstrip()}\n\n"
+        job = jobs.get(job_id)
+        yield f"event: end\ndata: {json.dumps(_job_summary(job))}\n\n"
+
+    return StreamingResponse(stream_events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.post("/bulk")
+async def bulk_ingest(file: Optional[UploadFile] = File(None), directory: Optional[str] = Form(None),
+                      bulk: "BulkIngestor" = Depends(get_bulk)):
+    """
+    Ingesta masiva de un ZIP subido o de un directorio del servidor (relativo a BULK_IMPORT_ROOT).
+
+    Responde con un stream NDJSON: una línea por archivo procesado y una línea final con el
+    resumen del lote. La ingesta continúa aunque el cliente se desconecte.
+    """
+    if (file is None) == (directory is None):
+        raise HTTPException(status_code=400, detail="Indique un archivo ZIP o un directorio, no ambos")
+
+    temp_path = None
+    if file is not None:
+        temp_path, _, _ = await _receive_upload(file)
+        source = temp_path
+    else:
+        try:
+            source = resolve_import_directory(directory)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run():
+        try:
+            async for summary in bulk.run(source):
+                await queue.put(json.dumps(summary, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"ERROR: Bulk ingest failed: {e}")
+            await queue.put(json.dumps({"error": str(e)}, ensure_ascii=False) + "\n")
+        finally:
+            if temp_path is not None:
+                temp_path.unlink(missing_ok=True)
+            await queue.put(None)
+
+    # La ingesta corre como tarea propia: cerrar la respuesta no la cancela
+    task = asyncio.get_running_loop().create_task(run())
+    _bulk_tasks.add(task)
+    task.add_done_callback(_bulk_tasks.discard)
+
+    async def stream_summaries():
+        while True:
+            line = await queue.get()
+            if line is None:
+                break
+            yield line
 
-    # Iniciar generador de logs
-    return StreamingResponse(
-        engine.process_document(str(temp_path), file.filename),
-        media_type="text/plain"
-    )
+    return StreamingResponse(stream_summaries(), media_type="application/x-ndjson")
@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+
+from app.services.data_core.observability import metrics, traces, startup
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Métricas en formato de exposición de Prometheus (latencias por etapa, caché, tokens).
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/traces")
+def get_traces(limit: int = 50, kind: Optional[str] = None, request_id: Optional[str] = None):
+    """
+    Trazas recientes (ingest, query, http) con sus etapas, de la más nueva a la más antigua.
+    """
+    return traces.recent(limit=limit, kind=kind, request_id=request_id)
+
+
+@router.get("/startup")
+def get_startup():
+    """
+    Tiempos del arranque del proceso por fase (import, servicios, warm-up).
+    """
+    return startup.as_dict()
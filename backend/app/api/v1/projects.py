@@ -0,0 +1,173 @@
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Sólo para anotaciones: los servicios se crean en el lifespan de app.main
+    from app.services.data_core.projects.manager import ProjectManager
+
+router = APIRouter()
+
+
+def get_projects(request: Request) -> "ProjectManager":
+    """
+    Gestor de proyectos creado en el arranque de la app (ver lifespan en app.main).
+    """
+    return request.app.state.projects
+
+
+class ProjectRequest(BaseModel):
+    id: str = Field(..., min_length=1, max_length=128, description="ID del proyecto.")
+    name: Optional[str] = Field(None, description="Nombre visible del proyecto.")
+
+
+class DocumentsRequest(BaseModel):
+    document_ids: List[str] = Field(..., min_length=1, description="Documentos ya ingestados a agregar.")
+
+
+class SnapshotRequest(BaseModel):
+    name: str = Field(..., min_length=1, max_length=128, description="Nombre del snapshot.")
+
+
+def _project_summary(projects: "ProjectManager", project: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": project["id"],
+        "name": project["name"],
+        "version": project["head"],
+        "manifest": project["manifest"],
+        "documents": len(projects.store.manifest(project["manifest"])),
+        "created": project["created"],
+        "updated": project["updated"],
+    }
+
+
+def _get_project(projects: "ProjectManager", project_id: str) -> Dict[str, Any]:
+    project = projects.store.get(project_id)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    return project
+
+
+@router.post("/projects", status_code=201)
+def create_project(request: ProjectRequest, projects: "ProjectManager" = Depends(get_projects)):
+    project = projects.store.create(request.id, request.name)
+    if project is None:
+        raise HTTPException(status_code=409, detail="El proyecto ya existe")
+    return _project_summary(projects, project)
+
+
+@router.get("/projects")
+def list_projects(limit: int = 100, offset: int = 0, projects: "ProjectManager" = Depends(get_projects)):
+    return [_project_summary(projects, p) for p in projects.store.list(limit=limit, offset=offset)]
+
+
+@router.get("/projects/{project_id}")
+def get_project(project_id: str, projects: "ProjectManager" = Depends(get_projects)):
+    """
+    Proyecto con los documentos de su versión vigente.
+    """
+    project = _get_project(projects, project_id)
+    registry = projects.engine.registry
+    documents = []
+    for doc_id, digest in sorted(projects.store.manifest(project["manifest"]).items()):
+        record = registry.get(doc_id) or {}
+        documents.append({
+            "id": doc_id,
+            "clean_hash": digest,
+            "original_name": record.get("original_name"),
+            "code": (record.get("metadata") or {}).get("code"),
+        })
+    return {**_project_summary(projects, project), "document_list": documents}
+
+
+@router.delete("/projects/{project_id}")
+def delete_project(project_id: str, projects: "ProjectManager" = Depends(get_projects)):
+    """
+    Elimina el proyecto. Sus documentos propios se borran en la siguiente recolección de
+    basura si ningún otro proyecto los referencia.
+    """
+    if not projects.store.delete(project_id):
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    return {"deleted": project_id}
+
+
+@router.post("/projects/{project_id}/documents")
+def add_documents(project_id: str, request: DocumentsRequest, projects: "ProjectManager" = Depends(get_projects)):
+    """
+    Agrega documentos ya ingestados al proyecto (por referencia, sin copiar archivos).
+    """
+    _get_project(projects, project_id)
+    records = []
+    for doc_id in request.document_ids:
+        record = projects.engine.registry.get(doc_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail=f"Documento no encontrado: {doc_id}")
+        records.append(record)
+    project = projects.add_documents(project_id, records)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    return _project_summary(projects, project)
+
+
+@router.delete("/projects/{project_id}/documents/{document_id}")
+def remove_document(project_id: str, document_id: str, projects: "ProjectManager" = Depends(get_projects)):
+    project = projects.remove_documents(project_id, [document_id])
+    if project is None:
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    return _project_summary(projects, project)
+
+
+@router.get("/projects/{project_id}/versions")
+def list_versions(project_id: str, limit: int = 50, projects: "ProjectManager" = Depends(get_projects)):
+    _get_project(projects, project_id)
+    return projects.store.versions(project_id, limit=limit)
+
+
+@router.post("/projects/{project_id}/snapshots", status_code=201)
+def create_snapshot(project_id: str, request: SnapshotRequest, projects: "ProjectManager" = Depends(get_projects)):
+    """
+    Congela la versión vigente del proyecto (sólo metadatos, sin copiar documentos).
+    """
+    try:
+        snapshot = projects.store.snapshot(project_id, request.name)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Proyecto no encontrado")
+    return snapshot
+
+
+@router.get("/projects/{project_id}/snapshots")
+def list_snapshots(project_id: str, projects: "ProjectManager" = Depends(get_projects)):
+    _get_project(projects, project_id)
+    return projects.store.snapshots(project_id)
+
+
+@router.delete("/projects/{project_id}/snapshots/{name}")
+def delete_snapshot(project_id: str, name: str, projects: "ProjectManager" = Depends(get_projects)):
+    if not projects.store.delete_snapshot(project_id, name):
+        raise HTTPException(status_code=404, detail="Snapshot no encontrado")
+    return {"deleted": name}
+
+
+@router.post("/projects/{project_id}/snapshots/{name}/restore")
+def restore_snapshot(project_id: str, name: str, projects: "ProjectManager" = Depends(get_projects)):
+    """
+    Restaura el contenido de un snapshot como una versión nueva del proyecto.
+    """
+    project = projects.store.restore(project_id, name)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Proyecto o snapshot no encontrado")
+    return _project_summary(projects, project)
+
+
+@router.post("/projects/gc")
+async def collect_garbage(grace_seconds: Optional[float] = None, projects: "ProjectManager" = Depends(get_projects)):
+    """
+    Ejecuta la recolección de basura de proyectos sin esperar al ciclo periódico.
+    """
+    loop = asyncio.get_running_loop()
+    if grace_seconds is None:
+        return await loop.run_in_executor(None, projects.collect_garbage)
+    return await loop.run_in_executor(None, projects.collect_garbage, grace_seconds)
@@ -0,0 +1,67 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Optional, TYPE_CHECKING
+import json
+
+from app.services.data_core.models.schema import CoreResponse
+
+if TYPE_CHECKING:
+    # Sólo para anotaciones: los servicios (PyMuPDF, NumPy) se importan en el lifespan de app.main
+    from app.services.data_core.router.engine import DataCoreRouter
+
+router = APIRouter()
+
+
+def get_query_router(request: Request) -> "DataCoreRouter":
+    """
+    Router del Data Core creado en el arranque de la app (ver lifespan en app.main).
+    """
+    return request.app.state.query_router
+
+
+class QueryRequest(BaseModel):
+    query: str = Field(..., description="Pregunta del usuario.")
+    project_context: Optional[Dict[str, Any]] = Field(None, description="Contexto del proyecto activo.")
+    stores: Optional[List[str]] = Field(None, description="Stores a consultar (por defecto se infieren).")
+    top_k: Optional[int] = Field(None, ge=1, le=50, description="Resultados por Store (por defecto ROUTER_TOP_K).")
+
+
+@router.post("/query", response_model=CoreResponse)
+async def query(request: QueryRequest, query_router: "DataCoreRouter" = Depends(get_query_router)):
+    """
+    Consulta al Data Core con respuesta completa.
+    """
+    return await query_router.route_query(
+        request.query, project_context=request.project_context, stores=request.stores, top_k=request.top_k
+    )
+
+
+@router.post("/query/stream")
+async def query_stream(request: QueryRequest, http_request: Request,
+                       query_router: "DataCoreRouter" = Depends(get_query_router)):
+    """
+    Consulta en streaming: primero las citas, luego los fragmentos de la respuesta y al final
+    la metadata (confianza, intención, tiempos), o un frame `error` si la consulta falla.
+
+    Formato NDJSON por defecto; Server-Sent Events si el cliente envía `Accept: text/event-stream`.
+    """
+    use_sse = "text/event-stream" in http_request.headers.get("accept", "")
+    frames = query_router.stream_query(
+        request.query, project_context=request.project_context, stores=request.stores, top_k=request.top_k
+    )
+
+    async def encode():
+        try:
+            async for frame in frames:
+                payload = json.dumps(frame, ensure_ascii=False)
+                if use_sse:
+                    yield f"event: {frame['type']}\ndata: {payload}\n\n"
+                else:
+                    yield payload + "\n"
+        finally:
+            # Al desconectarse el cliente se cierra la generación en curso
+            await frames.aclose()
+
+    media_type = "text/event-stream" if use_sse else "application/x-ndjson"
+    return StreamingResponse(encode(), media_type=media_type, headers={"Cache-Control": "no-cache"})
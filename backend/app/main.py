@@ -1,14 +1,87 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import Dict, Any, Optional
-import io
 
-# Importar Router de Ingesta
-from app.api.v1 import ingest
+# Importar Routers de la API
+from app.api.v1 import ingest, query, observability, documents, projects
+from app.services.data_core.observability import metrics, new_request_id, request_id_var, startup
+
+startup.add("import", time.perf_counter() - _IMPORT_STARTED)
+
+
+def _warm_up(query_router) -> None:
+    """
+    Prepara lo que pagaría la primera petición: SDK de Gemini y modelos, clasificador e
+    índices de búsqueda.
+    """
+    from app.services.data_core import clients
+
+    with startup.phase("warmup"):
+        timings = clients.warm_up()
+        timings.update(query_router.warm_up())
+    print("DEBUG: Warm-up " + ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Crea los servicios compartidos del proceso (motor de ingesta, proyectos, jobs, ingesta
+    masiva, Router y visor de páginas) una sola vez al arrancar, retoma los jobs
+    interrumpidos, lanza la recolección de basura de proyectos y, opcionalmente,
+    precalienta SDKs e índices.
+
+    Las variables de `.env` se cargan aquí, antes de importar los servicios que las leen.
+    """
+    load_dotenv()
+    # Warm-up al arrancar: "0" (no), "1" (antes de aceptar tráfico) o "background" (en paralelo)
+    startup_warmup = os.getenv("STARTUP_WARMUP", "0")
+
+    from app.services.data_core.bulk import BulkIngestor
+    from app.services.data_core.engine import DataCoreEngine
+    from app.services.data_core.jobs.manager import JobManager
+    from app.services.data_core.projects.manager import ProjectManager, PROJECT_GC_INTERVAL
+    from app.services.data_core.router.engine import DataCoreRouter
+    from app.services.data_core.viewer import DocumentViewer
 
-app = FastAPI(title="BIM-AI Data Core API", version="1.0.0")
+    with startup.phase("services"):
+        engine = DataCoreEngine()
+        app.state.engine = engine
+        app.state.projects = ProjectManager(engine)
+        app.state.jobs = JobManager(engine, projects=app.state.projects)
+        app.state.bulk = BulkIngestor(engine)
+        app.state.query_router = DataCoreRouter()
+        app.state.viewer = DocumentViewer(engine.registry)
+
+    # Retomar jobs de ingesta interrumpidos por un reinicio
+    with startup.phase("resume_jobs"):
+        app.state.jobs.resume_pending()
+
+    loop = asyncio.get_running_loop()
+    if startup_warmup == "1":
+        await loop.run_in_executor(None, _warm_up, app.state.query_router)
+    startup.ready()
+    if startup_warmup == "background":
+        loop.run_in_executor(None, _warm_up, app.state.query_router)
+
+    # Recolección de basura de proyectos (blobs y documentos sin referencias)
+    gc_task = asyncio.create_task(app.state.projects.run_gc()) if PROJECT_GC_INTERVAL > 0 else None
+
+    yield
+
+    if gc_task is not None:
+        gc_task.cancel()
+    engine.cpu_executor.shutdown(wait=False, cancel_futures=True)
+    engine.io_executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="BIM-AI Data Core API", version="1.0.0", lifespan=lifespan)
 
 # Configurar CORS para permitir peticiones desde el Frontend (Vite)
 app.add_middleware(
@@ -21,6 +94,35 @@ app.add_middleware(
 
 # Registrar Routers
 app.include_router(ingest.router, prefix="/api/v1", tags=["Ingestion"])
+app.include_router(query.router, prefix="/api/v1", tags=["Query"])
+app.include_router(observability.router, prefix="/api/v1", tags=["Observability"])
+app.include_router(documents.router, prefix="/api/v1", tags=["Documents"])
+app.include_router(projects.router, prefix="/api/v1", tags=["Projects"])
+# Ruta estándar para el scraping de Prometheus
+app.add_api_route("/metrics", observability.get_metrics, methods=["GET"], include_in_schema=False)
+
+
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """
+    Asigna un request ID (o respeta X-Request-ID) y mide la latencia de cada petición.
+    """
+    request_id = request.headers.get("x-request-id") or new_request_id()
+    token = request_id_var.set(request_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.observe("http_request_seconds", time.perf_counter() - started,
+                        method=request.method, path=path, status=status)
+        request_id_var.reset(token)
+
 
 @app.get("/")
 def health_check():
@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import zipfile
+from pathlib import Path
+from typing import Dict, Any, AsyncGenerator, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+# Archivos procesados en paralelo durante una ingesta masiva
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", "8"))
+# Raíz permitida para importar directorios del servidor vía API
+BULK_IMPORT_ROOT = Path(os.getenv("BULK_IMPORT_ROOT", "./data/import"))
+BULK_TEMP_DIR = Path(os.getenv("BULK_TEMP_DIR", "./data/temp"))
+# Documentos indexados por escritura del índice (cada lote reescribe la generación vectorial una vez)
+BULK_INDEX_BATCH = int(os.getenv("BULK_INDEX_BATCH", "256"))
+
+# Etapas previas al registro; se ejecutan por archivo en paralelo
+_PREPARE_STAGES = ("dedupe", "sanitize", "upload", "tag")
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _extract_entry(archive: zipfile.ZipFile, info: zipfile.ZipInfo, dest: Path) -> str:
+    """
+    Copia una entrada del ZIP a disco en bloques, calculando el SHA-256 al vuelo.
+    """
+    sha256 = hashlib.sha256()
+    with archive.open(info) as src, open(dest, "wb") as out:
+        while True:
+            chunk = src.read(_COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            out.write(chunk)
+    return sha256.hexdigest()
+
+
+def iter_zip(zip_path: Path) -> Iterator[Tuple[str, Any]]:
+    """
+    Entradas PDF de un ZIP como (nombre, entrada), sin extraer el archivo completo.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                continue
+            yield info.filename, (archive, info)
+
+
+def iter_directory(directory: Path) -> Iterator[Tuple[str, Any]]:
+    """
+    PDFs de un directorio (recursivo) como (ruta relativa, ruta absoluta), en orden estable.
+    """
+    for path in sorted(directory.rglob("*")):
+        if path.is_file() and path.suffix.lower() == ".pdf":
+            yield str(path.relative_to(directory)), path
+
+
+class BulkIngestor:
+    """
+    Ingesta masiva de un ZIP o un directorio.
+
+    Las entradas se leen de a una (un ZIP nunca se extrae completo): como máximo
+    `concurrency` archivos están en disco y en proceso a la vez. Cada archivo recorre
+    sanitización → subida → etiquetado en paralelo con los demás, los duplicados se
+    descartan por hash (contra el registro y dentro del mismo lote) y todos los registros
+    nuevos se escriben en una sola transacción antes de indexarlos por lotes de
+    BULK_INDEX_BATCH documentos.
+    """
+
+    def __init__(self, engine, concurrency: int = BULK_CONCURRENCY, temp_dir: Path = BULK_TEMP_DIR):
+        self.engine = engine
+        self.concurrency = concurrency
+        self.temp_dir = Path(temp_dir)
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+
+    async def run(self, source: Path) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Ingesta todos los PDFs de `source` (ZIP o directorio).
+
+        Yields:
+            dict: Un resumen por archivo (`file`, `status`, ...) a medida que termina, y al
+            final un resumen del lote con `summary`.
+        """
+        source = Path(source)
+        if source.is_dir():
+            entries, from_zip = iter_directory(source), False
+        elif zipfile.is_zipfile(source):
+            entries, from_zip = iter_zip(source), True
+        else:
+            raise ValueError(f"{source} no es un directorio ni un archivo ZIP")
+
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results: asyncio.Queue = asyncio.Queue()
+        seen_hashes: Dict[str, str] = {}
+        clean_owners: Dict[str, asyncio.Future] = {}
+        prepared: List[Dict[str, Any]] = []
+        counts = {"files": 0, "ready": 0, "duplicate": 0, "failed": 0}
+
+        async def prepare(name: str, file_path: Path, content_hash: str, temp: bool):
+            try:
+                state = {"file_path": str(file_path), "original_filename": Path(name).name, "content_hash": content_hash}
+                summary = await self._prepare(state, clean_owners)
+                summary["file"] = name
+                if summary["status"] == "ready":
+                    prepared.append(state)
+                await results.put(summary)
+            finally:
+                if temp:
+                    file_path.unlink(missing_ok=True)
+                semaphore.release()
+
+        async def produce():
+            tasks = []
+            for name, entry in entries:
+                # Leer la siguiente entrada sólo cuando hay un hueco en el pipeline
+                await semaphore.acquire()
+                counts["files"] += 1
+                try:
+                    if from_zip:
+                        file_path = self.temp_dir / f"{uuid4().hex}_{Path(name).name}"
+                        content_hash = await loop.run_in_executor(
+                            self.engine.cpu_executor, _extract_entry, entry[0], entry[1], file_path
+                        )
+                    else:
+                        file_path = entry
+                        content_hash = await loop.run_in_executor(self.engine.cpu_executor, self.engine._hash_file, file_path)
+                except Exception as e:
+                    semaphore.release()
+                    await results.put({"file": name, "status": "failed", "error": str(e)})
+                    continue
+
+                if content_hash in seen_hashes:
+                    if from_zip:
+                        file_path.unlink(missing_ok=True)
+                    semaphore.release()
+                    await results.put({"file": name, "status": "duplicate", "duplicate_of": seen_hashes[content_hash]})
+                    continue
+                seen_hashes[content_hash] = name
+                tasks.append(asyncio.create_task(prepare(name, file_path, content_hash, from_zip)))
+            await asyncio.gather(*tasks)
+            await results.put(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                summary = await results.get()
+                if summary is None:
+                    break
+                if summary["status"] in counts:
+                    counts[summary["status"]] += 1
+                yield summary
+        finally:
+            if not producer.done():
+                producer.cancel()
+        await producer
+
+        # Un solo commit para todos los registros nuevos del lote
+        records = [self.engine.build_record(state) for state in prepared]
+        inserted = await loop.run_in_executor(None, self.engine.registry.insert_many, records) if records else 0
+        print(f"DEBUG: Bulk ingest registered {inserted} of {len(records)} documents in one transaction")
+
+        to_index, indexed = [], 0
+        for state, record in zip(prepared, records):
+            # Si otra subida idéntica se registró en paralelo, INSERT OR IGNORE la descartó
+            stored = self.engine.registry.get(record["id"])
+            if stored is None:
+                continue
+            if state.get("reused_from"):
+                # Contenido sanitizado ya indexado
+                indexed += 1
+            else:
+                to_index.append(stored)
+        for start in range(0, len(to_index), BULK_INDEX_BATCH):
+            indexed += await self._index_batch(to_index[start:start + BULK_INDEX_BATCH])
+
+        yield {
+            "summary": {
+                **counts,
+                "registered": inserted,
+                "indexed": indexed,
+                "elapsed_s": round(time.perf_counter() - started, 3),
+            }
+        }
+
+    async def _index_batch(self, records: List[Dict[str, Any]]) -> int:
+        """
+        Fragmenta los documentos en paralelo y los indexa juntos (ver HybridIndex.add_documents).
+        Devuelve cuántos se indexaron.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def chunk(record: Dict[str, Any]):
+            try:
+                return record, await loop.run_in_executor(self.engine.cpu_executor, self.engine._chunk_document, record)
+            except Exception as e:
+                print(f"ERROR: Bulk chunking failed for {record['original_name']}: {e}")
+                return record, None
+
+        chunked = [(record, chunks) for record, chunks in await asyncio.gather(*(chunk(r) for r in records))
+                   if chunks is not None]
+        try:
+            await loop.run_in_executor(self.engine.cpu_executor, self.engine._index_documents, chunked)
+        except Exception as e:
+            print(f"ERROR: Bulk indexing failed for {len(chunked)} documents: {e}")
+            return 0
+        for record, _ in chunked:
+            await loop.run_in_executor(self.engine.io_executor, self.engine._invalidate_answer_cache, record)
+        print(f"DEBUG: Bulk ingest indexed {len(chunked)} documents in one batch")
+        return len(chunked)
+
+    async def _prepare(self, state: Dict[str, Any], clean_owners: Dict[str, asyncio.Future]) -> Dict[str, Any]:
+        """
+        Etapas previas al registro para un archivo. Devuelve su resumen.
+        """
+        owner: Optional[asyncio.Future] = None
+        try:
+            for stage in _PREPARE_STAGES:
+                async for line in self.engine.run_stage(stage, state):
+                    if line.startswith("WARN"):
+                        print(f"{line.strip()} ({state['original_filename']})")
+                if state.get("finished"):
+                    record = state["record"]
+                    return {"status": "duplicate", "duplicate_of": record["original_name"], "record_id": record["id"]}
+
+                if stage == "sanitize" and not state.get("reused_from"):
+                    # Dos archivos del lote con la misma salida sanitizada: sólo uno sube y etiqueta
+                    owner = clean_owners.get(state["clean_hash"])
+                    if owner is not None:
+                        cached = await owner
+                        Path(state["clean_path"]).unlink(missing_ok=True)
+                        state.update(cached, reused_from="batch")
+                        owner = None
+                    else:
+                        owner = clean_owners[state["clean_hash"]] = asyncio.get_running_loop().create_future()
+
+            if owner is not None:
+                owner.set_result({
+                    "clean_path": state["clean_path"],
+                    "gemini_file": state["gemini_file"],
+                    "metadata": state["metadata"],
+                })
+            metadata = state["metadata"] or {}
+            return {
+                "status": "ready",
+                "record_id": state.setdefault("record_id", str(uuid4())),
+                "content_hash": state["content_hash"],
+                "reused": bool(state.get("reused_from")),
+                "code": metadata.get("code"),
+                "category": metadata.get("category"),
+            }
+        except Exception as e:
+            if owner is not None and not owner.done():
+                owner.set_exception(e)
+            return {"status": "failed", "error": str(e)}
+
+
+def resolve_import_directory(directory: str, root: Path = BULK_IMPORT_ROOT) -> Path:
+    """
+    Valida que un directorio pedido vía API esté dentro de BULK_IMPORT_ROOT.
+    """
+    root = root.resolve()
+    path = (root / directory).resolve()
+    if path != root and root not in path.parents:
+        raise ValueError("El directorio debe estar dentro de BULK_IMPORT_ROOT")
+    if not path.is_dir():
+        raise ValueError(f"Directorio no encontrado: {directory}")
+    return path
+
+
+async def _main(source: str, concurrency: int):
+    from dotenv import load_dotenv
+
+    # Igual que el lifespan de app.main: .env antes de importar el motor
+    load_dotenv()
+    from app.services.data_core.engine import DataCoreEngine
+
+    ingestor = BulkIngestor(DataCoreEngine(), concurrency=concurrency)
+    async for summary in ingestor.run(Path(source)):
+        print(json.dumps(summary, ensure_ascii=False), flush=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ingesta masiva de un ZIP o directorio de PDFs")
+    parser.add_argument("source", help="Archivo ZIP o directorio con PDFs")
+    parser.add_argument("--concurrency", type=int, default=BULK_CONCURRENCY, help="Archivos en paralelo")
+    args = parser.parse_args()
+    if not Path(args.source).exists():
+        sys.exit(f"No existe: {args.source}")
+    asyncio.run(_main(args.source, args.concurrency))
@@ -0,0 +1,67 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Iterable
+
+# Modelos de Gemini por uso
+SYNTHESIS_MODEL = os.getenv("GEMINI_SYNTHESIS_MODEL", "gemini-1.5-pro")
+TAGGER_MODEL = os.getenv("GEMINI_TAGGER_MODEL", "gemini-1.5-flash")
+
+_genai = None
+_models: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def genai_module():
+    """
+    SDK de Gemini (google.generativeai), importado y configurado en el primer uso.
+
+    El import cuesta cerca de un segundo (arrastra los clientes gRPC), así que no se hace al
+    cargar la app sino cuando se necesita por primera vez o durante el warm-up.
+    """
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                started = time.perf_counter()
+                import google.generativeai as genai
+
+                api_key = os.getenv("GOOGLE_API_KEY")
+                if api_key:
+                    genai.configure(api_key=api_key)
+                print(f"DEBUG: google.generativeai loaded in {time.perf_counter() - started:.2f}s")
+                _genai = genai
+    return _genai
+
+
+def get_model(name: str):
+    """
+    Instancia compartida de `GenerativeModel` por nombre de modelo. Los modelos no guardan
+    estado entre llamadas, así que un mismo objeto sirve a todas las peticiones del proceso.
+    """
+    model = _models.get(name)
+    if model is None:
+        genai = genai_module()
+        with _lock:
+            model = _models.get(name)
+            if model is None:
+                model = _models[name] = genai.GenerativeModel(name)
+    return model
+
+
+def warm_up(models: Iterable[str] = (SYNTHESIS_MODEL, TAGGER_MODEL)) -> Dict[str, float]:
+    """
+    Importa el SDK y crea los modelos de antemano (sin llamadas a la API).
+
+    Returns:
+        dict: Segundos por paso.
+    """
+    timings = {}
+    started = time.perf_counter()
+    genai_module()
+    timings["genai_import"] = time.perf_counter() - started
+    for name in models:
+        started = time.perf_counter()
+        get_model(name)
+        timings[f"model:{name}"] = time.perf_counter() - started
+    return timings
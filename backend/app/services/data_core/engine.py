@@ -1,176 +1,368 @@
 import os
 import json
 import time
+import hashlib
 import asyncio
 import fitz  # PyMuPDF
-import google.generativeai as genai
 from pathlib import Path
-from typing import Dict, Any, Generator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, AsyncGenerator, Awaitable, Callable, List, Optional, Tuple
 from uuid import uuid4
-from dotenv import load_dotenv
-from app.services.data_core.librarian.sanitizer import clean_document
-
-# Cargar variables de entorno
-load_dotenv()
+from app.services.data_core.librarian.chunker import chunk_pages
+from app.services.data_core.librarian.density import PageDensityCache
+from app.services.data_core.librarian.layout import LayoutTemplateCache
+from app.services.data_core.librarian.sanitizer import clean_document_to_path
+from app.services.data_core.librarian.tagger import TagCache, tag_document
+from app.services.data_core.librarian.uploader import GeminiUploader, FakeFilesAPI
+from app.services.data_core.registry.store import DocumentRegistry
+from app.services.data_core.index.hybrid import get_search_index
+from app.services.data_core.router.cache import get_answer_cache, code_tag, document_tag
+from app.services.data_core.projects.store import get_project_store
+from app.services.data_core.observability import Trace, metrics
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 LOCAL_STORAGE_PATH = Path(os.getenv("LOCAL_STORAGE_PATH", "./data/storage"))
-REGISTRY_PATH = Path(os.getenv("REGISTRY_PATH", "./data/registry.json"))
+REGISTRY_PATH = Path(os.getenv("REGISTRY_PATH", "./data/registry.json"))  # Registro JSON heredado (sólo migración)
+REGISTRY_DB_PATH = Path(os.getenv("REGISTRY_DB_PATH", "./data/registry.db"))
+# Store por defecto cuando el etiquetado no determina uno (Contexto de Proyecto)
+DEFAULT_STORE_TYPE = "D"
+# Pools por tipo de etapa: CPU (sanitización, hashing, indexación) vs I/O (Gemini)
+SANITIZE_CONCURRENCY = int(os.getenv("SANITIZE_CONCURRENCY", str(os.cpu_count() or 2)))
+GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", "8"))
 
-# Configurar Gemini
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
+# Etapas del pipeline de ingesta, en orden
+PIPELINE_STAGES = ("dedupe", "sanitize", "upload", "tag", "register", "index")
 
 class DataCoreEngine:
     def __init__(self):
         # Asegurar directorios
         LOCAL_STORAGE_PATH.mkdir(parents=True, exist_ok=True)
-        if not REGISTRY_PATH.exists():
-            with open(REGISTRY_PATH, "w") as f:
-                json.dump({}, f)
+        self.registry = DocumentRegistry(REGISTRY_DB_PATH)
+        self.layout_cache = LayoutTemplateCache(self.registry)
+        self.density_cache = PageDensityCache(self.registry)
+        self.tag_cache = TagCache(self.registry)
+        self.index = get_search_index()
+        # Documentos propios de proyectos (no se reutilizan para subidas de otro origen)
+        self.projects = get_project_store()
+        self.cpu_executor = ThreadPoolExecutor(max_workers=SANITIZE_CONCURRENCY, thread_name_prefix="ingest-cpu")
+        self.io_executor = ThreadPoolExecutor(max_workers=GEMINI_CONCURRENCY, thread_name_prefix="ingest-io")
+        # Sin API Key las subidas van al Files API simulado
+        self.uploader = GeminiUploader(None if GOOGLE_API_KEY else FakeFilesAPI())
+        # Migración única desde el registry.json heredado
+        if REGISTRY_PATH.exists():
+            self.registry.migrate_from_json(REGISTRY_PATH)
 
-    def _load_registry(self) -> Dict:
-        try:
-            with open(REGISTRY_PATH, "r") as f:
-                return json.load(f)
-        except Exception:
-            return {}
+    def _find_record(self, field: str, value: Optional[str], corpus_only: bool = False) -> Optional[Dict]:
+        """
+        Busca un registro existente por un campo de hash (content_hash o clean_hash). Con
+        `corpus_only` se omiten los documentos propios de proyectos.
+        """
+        exclude = self.projects.owned_documents() if corpus_only else ()
+        return self.registry.find_one(field, value, exclude)
+
+    def _adopt_record(self, record: Dict) -> bool:
+        """
+        Pasa al corpus común un documento propio de un proyecto que se sube de nuevo sin
+        proyecto: deja de estar oculto y la recolección de basura ya no lo elimina.
+        """
+        if record["id"] not in self.projects.owned_documents():
+            return False
+        self.projects.forget_owned(record["id"])
+        return True
 
-    def _save_registry(self, data: Dict):
-        with open(REGISTRY_PATH, "w") as f:
-            json.dump(data, f, indent=2)
+    @staticmethod
+    def _hash_file(file_path, chunk_size: int = 1024 * 1024) -> str:
+        """
+        Calcula el SHA-256 de un archivo leyendo en bloques.
+        """
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
 
-    async def process_document(self, file_path: str, original_filename: str) -> Generator[str, None, None]:
+    async def process_document(self, file_path: str, original_filename: str, content_hash: Optional[str] = None,
+                               state: Optional[Dict[str, Any]] = None,
+                               on_stage_complete: Optional[Callable[[str, Dict[str, Any]], Awaitable[None]]] = None) -> AsyncGenerator[str, None]:
         """
         Generador asíncrono que emite logs del proceso de ingesta.
+
+        El pipeline se ejecuta por etapas (PIPELINE_STAGES). Cada etapa guarda sus resultados en
+        `state`, de modo que un estado persistido permite reanudar desde la última etapa completada.
+
+        Args:
+            file_path: Ruta al archivo temporal subido.
+            original_filename: Nombre original del archivo.
+            content_hash: SHA-256 del archivo original si ya fue calculado durante la subida.
+            state: Estado de una ejecución previa (para reanudar); se actualiza en sitio.
+            on_stage_complete: Callback invocado al terminar cada etapa con (etapa, estado).
         """
-        loop = asyncio.get_running_loop()
+        state = state if state is not None else {}
+        state.setdefault("file_path", str(file_path))
+        state.setdefault("original_filename", original_filename)
+        state.setdefault("content_hash", content_hash)
+        completed = state.setdefault("completed_stages", [])
+        trace = Trace("ingest", original_filename, resumed=bool(completed))
         print(f"DEBUG: Starting process_document for {original_filename}")
         try:
-            yield f"START: Iniciando procesamiento de {original_filename}\n"
-            
-            # 1. Sanitización Local
-            print("DEBUG: Starting sanitization")
-            yield "STEP: Sanitizando documento (recorte de headers/footers)...\n"
-            # Ejecutar tarea bloqueante en thread pool
-            clean_pdf_path = await loop.run_in_executor(None, self._sanitize_document, file_path)
-            print(f"DEBUG: Sanitization complete. Path: {clean_pdf_path}")
-            yield f"INFO: Documento limpio guardado en {clean_pdf_path.name}\n"
-
-            # 2. Subida a Gemini
-            print("DEBUG: Starting Gemini upload")
-            yield "STEP: Subiendo a Gemini File Search...\n"
-            if not GOOGLE_API_KEY:
-                print("DEBUG: No API Key, mocking upload")
-                yield "WARN: No API Key found. Skipping Gemini upload (Mock Mode).\n"
-                gemini_file = {"name": "mock-gemini-id", "uri": "mock-uri"}
+            if completed:
+                yield f"INFO: Reanudando procesamiento de {original_filename} tras la etapa {completed[-1]}\n"
             else:
-                # Ejecutar tarea bloqueante en thread pool
-                gemini_file = await loop.run_in_executor(None, self._upload_to_gemini, clean_pdf_path)
-                print("DEBUG: Gemini upload complete")
-                yield "INFO: Archivo subido exitosamente a Gemini.\n"
-
-            # 3. Tagging (Clasificación)
-            print("DEBUG: Starting Tagging")
-            yield "STEP: Analizando contenido con IA (Tagging)...\n"
-            # Ejecutar tarea bloqueante en thread pool
-            metadata = await loop.run_in_executor(None, self._tag_document, clean_pdf_path)
-            print(f"DEBUG: Tagging complete: {metadata}")
-            yield f"INFO: Clasificado como {metadata.get('category')} - {metadata.get('code')}\n"
-
-            # 4. Registro
-            print("DEBUG: Registering in DB")
-            yield "STEP: Registrando en base de datos local...\n"
-            record_id = str(uuid4())
-            record = {
-                "id": record_id,
-                "original_name": original_filename,
-                "local_path": str(clean_pdf_path),
-                "gemini_id": gemini_file.name if hasattr(gemini_file, 'name') else gemini_file['name'],
-                "gemini_uri": gemini_file.uri if hasattr(gemini_file, 'uri') else gemini_file['uri'],
-                "metadata": metadata,
-                "timestamp": time.time()
-            }
-            
-            registry = self._load_registry()
-            registry[record_id] = record
-            self._save_registry(registry)
-
-            yield f"SUCCESS: {json.dumps(record)}\n"
+                yield f"START: Iniciando procesamiento de {original_filename}\n"
+
+            for stage in PIPELINE_STAGES:
+                if stage in completed:
+                    continue
+                if not state.get("finished"):
+                    with trace.span(stage):
+                        async for line in self.run_stage(stage, state):
+                            yield line
+                completed.append(stage)
+                if on_stage_complete is not None:
+                    await on_stage_complete(stage, state)
+
+            status = "duplicate" if state.get("finished") else "ok"
+            trace.finish(status, record_id=state["record"]["id"])
+            metrics.inc("ingest_documents_total", status=status)
+            yield f"SUCCESS: {json.dumps(state['record'])}\n"
 
         except Exception as e:
+            state["error"] = str(e)
+            trace.finish("error", error=str(e))
+            metrics.inc("ingest_documents_total", status="error")
             yield f"ERROR: {str(e)}\n"
 
-    def _sanitize_document(self, input_path: str) -> Path:
+    def run_stage(self, stage: str, state: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """
+        Ejecuta una etapa del pipeline sobre `state` (la usan también las ingestas masivas).
+        """
+        if stage not in PIPELINE_STAGES:
+            raise ValueError(f"Etapa desconocida: {stage}")
+        return getattr(self, f"_stage_{stage}")(state)
+
+    async def _stage_dedupe(self, state: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """
+        0. Deduplicación por contenido (archivo byte a byte idéntico).
+        """
+        loop = asyncio.get_running_loop()
+        if state["content_hash"] is None:
+            state["content_hash"] = await loop.run_in_executor(self.cpu_executor, self._hash_file, state["file_path"])
+        existing = await loop.run_in_executor(self.io_executor, self._find_record, "content_hash", state["content_hash"])
+        if existing:
+            print(f"DEBUG: Duplicate content {state['content_hash'][:12]}, reusing record {existing['id']}")
+            yield f"INFO: Documento idéntico ya ingestado como {existing['original_name']}. Reutilizando registro.\n"
+            # content_hash es único: una subida al corpus no puede tener su propio registro
+            if not state.get("project_id") and \
+                    await loop.run_in_executor(self.io_executor, self._adopt_record, existing):
+                yield "INFO: El documento pertenecía a un proyecto; ahora forma parte del corpus común.\n"
+            state["record"] = existing
+            state["finished"] = True
+
+    async def _stage_sanitize(self, state: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """
+        1. Sanitización Local (pool de CPU).
+        """
+        loop = asyncio.get_running_loop()
+        print("DEBUG: Starting sanitization")
+        yield "STEP: Sanitizando documento (recorte de headers/footers)...\n"
+        clean_pdf_path, page_map = await loop.run_in_executor(
+            self.cpu_executor, self._sanitize_document, state["file_path"], state["content_hash"]
+        )
+        clean_hash = await loop.run_in_executor(self.cpu_executor, self._hash_file, clean_pdf_path)
+        print(f"DEBUG: Sanitization complete. Path: {clean_pdf_path}")
+        yield f"INFO: Documento limpio guardado en {clean_pdf_path.name}\n"
+
+        # Caché de segundo nivel: misma salida sanitizada (p.ej. sólo cambió la metadata de portada).
+        # Sólo entre documentos del corpus: los de un proyecto se etiquetan para el Store D y se
+        # indexan con su propio ID
+        cached = None
+        if not state.get("project_id"):
+            cached = await loop.run_in_executor(self.io_executor, self._find_record, "clean_hash", clean_hash, True)
+        if cached:
+            print(f"DEBUG: Sanitized output matches record {cached['id']}, skipping upload and tagging")
+            yield f"INFO: Contenido sanitizado idéntico a {cached['original_name']}. Se omite subida y etiquetado.\n"
+            clean_pdf_path.unlink(missing_ok=True)
+            clean_pdf_path = Path(cached["local_path"])
+            state["reused_from"] = cached["id"]
+            state["gemini_file"] = {"name": cached["gemini_id"], "uri": cached["gemini_uri"]}
+            state["metadata"] = cached["metadata"]
+
+        state["clean_path"] = str(clean_pdf_path)
+        state["page_map"] = page_map
+        state["clean_hash"] = clean_hash
+
+    async def _stage_upload(self, state: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """
+        2. Subida a Gemini (pool de I/O).
+        """
+        if state.get("reused_from"):
+            return
+        print("DEBUG: Starting Gemini upload")
+        yield "STEP: Subiendo a Gemini File Search...\n"
+        if not GOOGLE_API_KEY:
+            print("DEBUG: No API Key, mocking upload")
+            yield "WARN: No API Key found. Using local fake Files API (Mock Mode).\n"
+        gemini_file = await self.uploader.upload(Path(state["clean_path"]))
+        print("DEBUG: Gemini upload complete")
+        yield "INFO: Archivo subido exitosamente a Gemini.\n"
+        state["gemini_file"] = {"name": gemini_file["name"], "uri": gemini_file["uri"]}
+
+    async def _stage_tag(self, state: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """
+        3. Tagging (Clasificación) (pool de I/O).
+        """
+        if state.get("reused_from"):
+            return
+        loop = asyncio.get_running_loop()
+        print("DEBUG: Starting Tagging")
+        yield "STEP: Analizando contenido con IA (Tagging)...\n"
+        # El original conserva la metadata/XMP y la portada completa; el limpio sirve si ya no existe
+        source = Path(state["file_path"])
+        if not source.exists():
+            source = Path(state["clean_path"])
+        metadata = await loop.run_in_executor(self.io_executor, self._tag_document, source, state["content_hash"])
+        # Store fijado por el origen de la subida (p.ej. "D" para los documentos de un proyecto)
+        if state.get("store_type"):
+            metadata = {**metadata, "store_type": state["store_type"]}
+        print(f"DEBUG: Tagging complete: {metadata}")
+        yield f"INFO: Clasificado como {metadata.get('category')} - {metadata.get('code')}\n"
+        state["metadata"] = metadata
+
+    async def _stage_register(self, state: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """
+        4. Registro (idempotente: al reanudar no se duplica el registro).
+        """
+        print("DEBUG: Registering in DB")
+        yield "STEP: Registrando en base de datos local...\n"
+        loop = asyncio.get_running_loop()
+        record = await loop.run_in_executor(self.io_executor, self._register_record, self.build_record(state))
+        state["record"] = record
+        if record["id"] != state["record_id"]:
+            state["finished"] = True
+
+    def _register_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Registro ya existente con ese id (reanudación) o el recién insertado.
+        """
+        existing = self.registry.get(record["id"])
+        if existing is not None:
+            return existing
+        # Inserción atómica; si otra subida idéntica ganó la carrera se devuelve su registro
+        return self.registry.insert(record)
+
+    @staticmethod
+    def build_record(state: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Limpia headers y footers (10%) y guarda en storage usando el Librarian.
+        Registro del documento a partir del estado de las etapas previas.
+        """
+        record_id = state.setdefault("record_id", str(uuid4()))
+        return {
+            "id": record_id,
+            "original_name": state["original_filename"],
+            "local_path": state["clean_path"],
+            "gemini_id": state["gemini_file"]["name"],
+            "gemini_uri": state["gemini_file"]["uri"],
+            "content_hash": state["content_hash"],
+            "clean_hash": state["clean_hash"],
+            "page_map": state["page_map"],
+            "metadata": state["metadata"],
+            "timestamp": time.time()
+        }
+
+    async def _stage_index(self, state: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """
+        5. Fragmentación e indexación local (sólo contenido nuevo; el contenido cacheado ya está indexado).
+        """
+        if state.get("reused_from"):
+            return
+        loop = asyncio.get_running_loop()
+        record = state["record"]
+
+        print("DEBUG: Chunking document")
+        yield "STEP: Extrayendo artículos, tablas y secciones...\n"
+        chunks = await loop.run_in_executor(self.cpu_executor, self._chunk_document, record)
+        articles = len({c["article_id"] for c in chunks if c["kind"] == "article"})
+        yield f"INFO: {len(chunks)} fragmentos extraídos ({articles} artículos)\n"
+
+        print("DEBUG: Indexing document")
+        yield "STEP: Indexando texto para búsqueda local...\n"
+        store_type = await loop.run_in_executor(self.cpu_executor, self._index_document, record, chunks)
+        yield f"INFO: Documento indexado en Store {store_type}\n"
+
+        # Invalidar respuestas cacheadas de versiones previas de la misma norma
+        invalidated = await loop.run_in_executor(self.io_executor, self._invalidate_answer_cache, record)
+        if invalidated:
+            yield f"INFO: {invalidated} respuestas en caché invalidadas\n"
+
+    def _sanitize_document(self, input_path: str, content_hash: Optional[str] = None) -> Tuple[Path, List[int]]:
+        """
+        Limpia headers y footers detectados y guarda en storage usando el Librarian.
+
+        Returns:
+            tuple: (ruta del PDF limpio, páginas originales conservadas 0-based).
         """
         try:
-            clean_bytes = clean_document(str(input_path))
-            
             output_filename = f"{uuid4()}.pdf"
             output_path = LOCAL_STORAGE_PATH / output_filename
-            
-            with open(output_path, "wb") as f:
-                f.write(clean_bytes)
-                
-            return output_path
+
+            # El Librarian escribe directamente en disco (sin copia intermedia en memoria)
+            page_map = clean_document_to_path(str(input_path), output_path, layout_cache=self.layout_cache,
+                                              content_hash=content_hash, density_cache=self.density_cache)
+
+            return output_path, page_map
         except Exception as e:
             raise ValueError(f"Error durante la sanitización: {str(e)}")
 
-    def _upload_to_gemini(self, file_path: Path):
+    def _chunk_document(self, record: Dict) -> List[Dict]:
         """
-        Sube archivo a Gemini y espera a que esté activo.
+        Extrae el texto por página del PDF limpio y lo divide en fragmentos de artículo/tabla/sección.
         """
-        print(f"Uploading {file_path} to Gemini...")
-        file = genai.upload_file(path=file_path)
-        
-        # Polling de estado
-        while file.state.name == "PROCESSING":
-            time.sleep(2)
-            file = genai.get_file(file.name)
-            
-        if file.state.name != "ACTIVE":
-            raise Exception(f"Gemini File Upload Failed: {file.state.name}")
-            
-        return file
+        page_map = record.get("page_map") or []
+        pages = []
+        doc = fitz.open(record["local_path"])
+        try:
+            for i, page in enumerate(doc):
+                # Numeración de la página en el documento original (1-based)
+                page_number = page_map[i] + 1 if i < len(page_map) else i + 1
+                pages.append((page_number, page.get_text("text")))
+        finally:
+            doc.close()
+        return chunk_pages(pages)
 
-    def _tag_document(self, file_path: Path) -> Dict:
+    def _index_document(self, record: Dict, chunks: List[Dict]) -> str:
         """
-        Usa Gemini Flash para extraer metadatos de la primera página.
+        Agrega los fragmentos del documento al índice local del Store correspondiente.
         """
-        if not GOOGLE_API_KEY:
-            return {"category": "MOCK", "code": "MOCK-001", "title": "Mock Doc", "year": 2024}
+        store_type = record["metadata"].get("store_type") or DEFAULT_STORE_TYPE
+        self.index.add_document(record["id"], record["original_name"], store_type, chunks)
+        return store_type
 
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        # Convertir primera página a imagen para el modelo
-        doc = fitz.open(file_path)
-        try:
-            page = doc[0]
-            pix = page.get_pixmap()
-            img_data = pix.tobytes("png")
-        finally:
-            doc.close()
-        
-        image_part = {
-            "mime_type": "image/png",
-            "data": img_data
-        }
-        
-        prompt = """
-        Analiza esta portada de documento técnico de construcción.
-        Extrae en JSON:
-        - category: (ESTRUCTURAS, ARQUITECTURA, SANITARIAS, ELECTRICAS, NORMATIVA, GESTION)
-        - code: Código del documento (ej. E.030)
-        - title: Título principal
-        - year: Año de publicación (int)
-        """
-        
-        try:
-            response = model.generate_content([prompt, image_part])
-            text = response.text.replace("```json", "").replace("```", "").strip()
-            return json.loads(text)
-        except Exception as e:
-            print(f"Tagging error: {e}")
-            return {"category": "UNKNOWN", "code": "UNK", "title": file_path.name, "year": 2024}
+    def _index_documents(self, chunked: List[Tuple[Dict, List[Dict]]]) -> int:
+        """
+        Indexa varios documentos con sus fragmentos, una escritura por Store (ingesta masiva).
+        """
+        by_store: Dict[str, List[Tuple[str, str, List[Dict]]]] = {}
+        for record, chunks in chunked:
+            store_type = record["metadata"].get("store_type") or DEFAULT_STORE_TYPE
+            by_store.setdefault(store_type, []).append((record["id"], record["original_name"], chunks))
+        for store_type, documents in by_store.items():
+            self.index.add_documents(store_type, documents)
+        return len(chunked)
+
+    def _invalidate_answer_cache(self, record: Dict) -> int:
+        """
+        Invalida las respuestas del Router asociadas al código de la norma ingestada y a los
+        documentos previos con el mismo código.
+        """
+        code = record["metadata"].get("code")
+        if not code:
+            return 0
+        tags = [code_tag(code)]
+        tags += [document_tag(r["id"]) for r in self.registry.list(code=code) if r["id"] != record["id"]]
+        return get_answer_cache().invalidate_tags(tags)
+
+    def _tag_document(self, file_path: Path, content_hash: Optional[str] = None) -> Dict:
+        """
+        Etiquetado escalonado (caché -> texto/metadata -> Gemini Flash sólo con baja confianza).
+        """
+        return tag_document(file_path, content_hash=content_hash, cache=self.tag_cache)
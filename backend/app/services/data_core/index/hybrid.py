@@ -0,0 +1,104 @@
+import os
+import threading
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from app.services.data_core.index.lexical import LexicalIndex, get_lexical_index
+from app.services.data_core.index.vector import VectorIndex, get_vector_index
+
+# "hybrid" (BM25 + vectores), "lexical" o "vector"
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+# Candidatos por índice antes de fusionar (múltiplo del top_k pedido)
+HYBRID_CANDIDATES_FACTOR = int(os.getenv("HYBRID_CANDIDATES_FACTOR", "3"))
+# Peso del ranking vectorial en la fusión (el léxico pesa 1.0)
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+RRF_K = 60
+
+
+class HybridIndex:
+    """
+    Búsqueda híbrida local: BM25 (coincidencia exacta de códigos y términos) y similitud
+    vectorial (variantes y paráfrasis), fusionadas con Reciprocal Rank Fusion.
+
+    Expone la misma interfaz que LexicalIndex, así que la ingesta y el Router la usan sin
+    cambios; cada documento se escribe en ambos índices.
+    """
+
+    def __init__(self, lexical: LexicalIndex, vector: Optional[VectorIndex], mode: str = SEARCH_MODE):
+        self.lexical = lexical
+        self.vector = vector if mode != "lexical" else None
+        self.mode = mode
+
+    def add_document(self, doc_id: str, source_file: str, store: str, units: List[Dict[str, Any]]):
+        self.lexical.add_document(doc_id, source_file, store, units)
+        if self.vector is not None:
+            self.vector.add_document(doc_id, source_file, store, units)
+
+    def add_documents(self, store: str, documents: List[Tuple[str, str, List[Dict[str, Any]]]]):
+        """
+        Indexa varios documentos del mismo Store. El índice vectorial escribe una sola
+        generación para todo el lote (en lugar de una por documento), lo que mantiene lineal
+        el costo de las ingestas masivas.
+
+        Args:
+            documents: Tuplas (doc_id, source_file, units).
+        """
+        for doc_id, source_file, units in documents:
+            self.lexical.add_document(doc_id, source_file, store, units)
+        if self.vector is not None:
+            self.vector.add_documents(store, documents)
+
+    def remove_document(self, doc_id: str, store: Optional[str] = None) -> bool:
+        removed = self.lexical.remove_document(doc_id, store)
+        if self.vector is not None:
+            removed = self.vector.remove_document(doc_id, store) or removed
+        return removed
+
+    def search(self, query: str, store_id: str, top_k: int = 5,
+               exclude: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Búsqueda en un Store según SEARCH_MODE. En modo híbrido, cada resultado conserva el
+        puntaje de cada índice (`lexical_score`, `vector_score`) y `score` es el de la fusión.
+        Los documentos en `exclude` no aparecen en los resultados.
+        """
+        if self.vector is None:
+            return self.lexical.search(query, store_id, top_k, exclude=exclude)
+        if self.mode == "vector":
+            return self.vector.search(query, store_id, top_k, exclude=exclude)
+
+        candidates = top_k * HYBRID_CANDIDATES_FACTOR
+        rankings = (
+            ("lexical_score", 1.0, self.lexical.search(query, store_id, candidates, exclude=exclude)),
+            ("vector_score", HYBRID_VECTOR_WEIGHT, self.vector.search(query, store_id, candidates, exclude=exclude)),
+        )
+        fused: Dict[tuple, Dict[str, Any]] = {}
+        for field, weight, results in rankings:
+            for rank, res in enumerate(results):
+                key = (res["document_id"], res["page_number"], res.get("start"))
+                entry = fused.setdefault(key, {**res, "score": 0.0})
+                entry[field] = res["score"]
+                entry["score"] += weight / (RRF_K + rank + 1)
+        return sorted(fused.values(), key=lambda r: r["score"], reverse=True)[:top_k]
+
+    def store_scores(self, query: str, exclude: Optional[Dict[str, Set[str]]] = None) -> Dict[str, float]:
+        """
+        Similitud máxima de la consulta en cada Store (vacío sin índice vectorial).
+        """
+        return self.vector.store_scores(query, exclude) if self.vector is not None else {}
+
+    def document_count(self, store_id: str) -> int:
+        return self.lexical.document_count(store_id)
+
+
+_index: Optional[HybridIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> HybridIndex:
+    """
+    Instancia compartida del índice de búsqueda (la usan tanto la ingesta como el Router).
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = HybridIndex(get_lexical_index(), get_vector_index() if SEARCH_MODE != "lexical" else None)
+        return _index
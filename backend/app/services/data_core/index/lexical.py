@@ -0,0 +1,368 @@
+import os
+import json
+import math
+import mmap
+import heapq
+import threading
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set
+from uuid import uuid4
+
+from app.services.data_core.index.text import tokenize
+
+LEXICAL_INDEX_PATH = Path(os.getenv("LEXICAL_INDEX_PATH", "./data/index/lexical"))
+
+# Parámetros BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STORES = ("A", "B", "C", "D")
+
+
+class _Segment:
+    """
+    Segmento inmutable de un documento.
+
+    Archivos:
+        <segmento>.meta.json  Unidades (página, artículo, offsets en el texto de la página)
+                              y diccionario de términos.
+        <segmento>.post       Postings uint32 intercalados (unidad, tf), leídos vía mmap.
+        <segmento>.text       Texto UTF-8 de las unidades concatenado, leído vía mmap.
+
+    Los archivos nunca se reescriben; al reemplazar un documento se crea un segmento nuevo.
+    Los mapeos se liberan cuando ninguna búsqueda en curso mantiene referencias al segmento.
+    """
+
+    def __init__(self, base: str):
+        with open(f"{base}.meta.json", "r") as f:
+            meta = json.load(f)
+        self.name = meta["name"]
+        self.doc_id = meta["doc_id"]
+        self.source_file = meta["source_file"]
+        self.units = meta["units"]
+        self.terms = meta["terms"]
+        self.total_len = meta["total_len"]
+        self._post_file = open(f"{base}.post", "rb")
+        self._text_file = open(f"{base}.text", "rb")
+        self._post_map = mmap.mmap(self._post_file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if os.path.getsize(self._post_file.name) else None
+        self._text_map = mmap.mmap(self._text_file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if os.path.getsize(self._text_file.name) else None
+        self.postings_view = memoryview(self._post_map).cast("I") if self._post_map else memoryview(b"").cast("I")
+
+    def postings(self, term: str):
+        entry = self.terms.get(term)
+        if entry is None:
+            return None
+        offset, df = entry
+        return self.postings_view[offset:offset + 2 * df]
+
+    def text(self, unit_idx: int) -> str:
+        start, length = self.units[unit_idx][2:4]
+        return self._text_map[start:start + length].decode("utf-8") if self._text_map else ""
+
+
+class LexicalIndex:
+    """
+    Índice invertido local con ranking BM25, particionado por Store (A/B/C/D).
+
+    Cada documento ingestado se escribe como un segmento independiente, por lo que el índice
+    se actualiza de forma incremental (agregar o quitar un documento no reescribe el resto).
+    Un MANIFEST.json por Store mapea cada documento a su segmento vigente y lleva los totales
+    de BM25 (unidades, largo total y df por término), que se suman o restan con cada segmento;
+    los lectores lo recargan cuando cambia en disco.
+    """
+
+    def __init__(self, root: Path = LEXICAL_INDEX_PATH):
+        self.root = Path(root)
+        self._lock = threading.RLock()
+        self._segments: Dict[str, Dict[str, _Segment]] = {store: {} for store in STORES}
+        self._manifest_mtime: Dict[str, int] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        for store in STORES:
+            (self.root / store).mkdir(parents=True, exist_ok=True)
+
+    # --- Manifest -------------------------------------------------------------
+
+    def _manifest_path(self, store: str) -> Path:
+        return self.root / store / "MANIFEST.json"
+
+    def _read_manifest(self, store: str) -> Dict[str, Any]:
+        try:
+            with open(self._manifest_path(store), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"generation": 0, "segments": {}}
+
+    def _write_manifest(self, store: str, manifest: Dict[str, Any]):
+        path = self._manifest_path(store)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+    def _refresh(self, store: str):
+        """
+        Sincroniza los segmentos abiertos con el MANIFEST si cambió en disco.
+        """
+        try:
+            mtime = self._manifest_path(store).stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = 0
+        if self._manifest_mtime.get(store) == mtime:
+            return
+        with self._lock:
+            manifest = self._read_manifest(store)
+            wanted = manifest["segments"]
+            opened = self._segments[store]
+            for doc_id in list(opened):
+                if wanted.get(doc_id) != opened[doc_id].name:
+                    opened.pop(doc_id)
+            for doc_id, segment_name in wanted.items():
+                if doc_id in opened:
+                    continue
+                try:
+                    opened[doc_id] = _Segment(str(self.root / store / segment_name))
+                except FileNotFoundError:
+                    print(f"WARN: Missing index segment {segment_name} in store {store}")
+            self._manifest_mtime[store] = mtime
+            totals = self._manifest_stats(store, manifest)
+            unit_count, total_len = totals["units"], totals["total_len"]
+            self._stats[store] = {
+                "N": unit_count, "avgdl": (total_len / unit_count) if unit_count else 0.0, "df": totals["df"],
+            }
+
+    @staticmethod
+    def _apply_stats(totals: Dict[str, Any], meta: Dict[str, Any], sign: int = 1):
+        """
+        Suma (o resta, con sign=-1) las unidades, el largo y el df de un segmento a los totales.
+        """
+        totals["units"] += sign * len(meta["units"])
+        totals["total_len"] += sign * meta["total_len"]
+        df = totals["df"]
+        for term, (_, term_df) in meta["terms"].items():
+            count = df.get(term, 0) + sign * term_df
+            if count > 0:
+                df[term] = count
+            else:
+                df.pop(term, None)
+
+    def _sum_stats(self, metas) -> Dict[str, Any]:
+        totals = {"units": 0, "total_len": 0, "df": {}}
+        for meta in metas:
+            self._apply_stats(totals, meta)
+        return totals
+
+    def _read_segment_meta(self, store: str, segment_name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.root / store / f"{segment_name}.meta.json", "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            print(f"WARN: Missing index segment {segment_name} in store {store}")
+            return None
+
+    def _manifest_stats(self, store: str, manifest: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Totales del MANIFEST; en uno de formato previo se calculan desde los segmentos (y se
+        persisten con la próxima escritura).
+        """
+        if "stats" not in manifest:
+            manifest["stats"] = self._sum_stats(
+                meta for meta in (self._read_segment_meta(store, name) for name in manifest["segments"].values())
+                if meta is not None
+            )
+        return manifest["stats"]
+
+    # --- Escritura ------------------------------------------------------------
+
+    def add_document(self, doc_id: str, source_file: str, store: str, units: List[Dict[str, Any]]):
+        """
+        Indexa un documento como un nuevo segmento del Store indicado.
+
+        Args:
+            units: Unidades recuperables (fragmentos), cada una con `page_number`, `content` y
+                opcionalmente `article_id`, `start` y `end` (offsets dentro del texto de la página).
+        """
+        store_dir = self.root / store
+        unit_rows, postings_by_term = [], {}
+        text_blob = bytearray()
+        total_len = 0
+        for unit_idx, unit in enumerate(units):
+            tokens = tokenize(unit["content"])
+            encoded = unit["content"].encode("utf-8")
+            unit_rows.append([
+                unit["page_number"], unit.get("article_id"), len(text_blob), len(encoded), len(tokens),
+                unit.get("start"), unit.get("end"),
+            ])
+            text_blob.extend(encoded)
+            total_len += len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings_by_term.setdefault(term, []).append((unit_idx, tf))
+
+        postings = array("I")
+        terms = {}
+        for term in sorted(postings_by_term):
+            entries = postings_by_term[term]
+            terms[term] = [len(postings), len(entries)]
+            for unit_idx, tf in entries:
+                postings.append(unit_idx)
+                postings.append(tf)
+
+        with self._lock:
+            segment_name = f"{doc_id}_{uuid4().hex[:8]}"
+            base = str(store_dir / segment_name)
+            with open(f"{base}.post", "wb") as f:
+                postings.tofile(f)
+            with open(f"{base}.text", "wb") as f:
+                f.write(text_blob)
+            meta = {
+                "name": segment_name,
+                "doc_id": doc_id,
+                "source_file": source_file,
+                "units": unit_rows,
+                "terms": terms,
+                "total_len": total_len,
+            }
+            with open(f"{base}.meta.json", "w") as f:
+                json.dump(meta, f)
+
+            manifest = self._read_manifest(store)
+            totals = self._manifest_stats(store, manifest)
+            previous = manifest["segments"].get(doc_id)
+            previous_meta = self._read_segment_meta(store, previous) if previous else None
+            if previous_meta is not None:
+                self._apply_stats(totals, previous_meta, -1)
+            self._apply_stats(totals, meta)
+            manifest["segments"][doc_id] = segment_name
+            manifest["generation"] += 1
+            self._write_manifest(store, manifest)
+            if previous:
+                self._delete_segment_files(store, previous)
+            # Forzar recarga en la próxima búsqueda
+            self._manifest_mtime.pop(store, None)
+        print(f"DEBUG: Indexed {len(units)} units of {source_file} in store {store}")
+
+    def remove_document(self, doc_id: str, store: Optional[str] = None) -> bool:
+        """
+        Quita el segmento de un documento (de todos los Stores si no se indica uno).
+        """
+        removed = False
+        with self._lock:
+            for store_key in ([store] if store else STORES):
+                manifest = self._read_manifest(store_key)
+                if doc_id not in manifest["segments"]:
+                    continue
+                totals = self._manifest_stats(store_key, manifest)
+                segment_name = manifest["segments"].pop(doc_id)
+                segment_meta = self._read_segment_meta(store_key, segment_name)
+                if segment_meta is not None:
+                    self._apply_stats(totals, segment_meta, -1)
+                manifest["generation"] += 1
+                self._write_manifest(store_key, manifest)
+                self._delete_segment_files(store_key, segment_name)
+                self._manifest_mtime.pop(store_key, None)
+                removed = True
+        return removed
+
+    def _delete_segment_files(self, store: str, segment_name: str):
+        # Seguro aunque haya búsquedas en curso: los mapeos abiertos siguen siendo válidos
+        base = self.root / store / segment_name
+        for suffix in (".meta.json", ".post", ".text"):
+            Path(f"{base}{suffix}").unlink(missing_ok=True)
+
+    # --- Lectura --------------------------------------------------------------
+
+    def search(self, query: str, store_id: str, top_k: int = 5,
+               exclude: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """
+        Búsqueda BM25 dentro de un Store.
+
+        Args:
+            exclude: IDs de documentos a omitir (p.ej. documentos de otros proyectos).
+
+        Returns:
+            list: Resultados con `document_id`, `source_file`, `page_number`, `content`,
+            `article_id`, `start`, `end` y `score`, ordenados por relevancia.
+        """
+        if store_id not in self._segments:
+            return []
+        self._refresh(store_id)
+        with self._lock:
+            segments = list(self._segments[store_id].values())
+            stats = self._stats.get(store_id)
+        if exclude:
+            # Las estadísticas (N, df) siguen siendo las del Store completo
+            segments = [segment for segment in segments if segment.doc_id not in exclude]
+        if not segments or not stats or not stats["N"]:
+            return []
+
+        n_units, avgdl, df = stats["N"], stats["avgdl"], stats["df"]
+        scores: Dict[tuple, float] = {}
+        for term in set(tokenize(query)):
+            term_df = df.get(term)
+            if not term_df:
+                continue
+            idf = math.log(1.0 + (n_units - term_df + 0.5) / (term_df + 0.5))
+            for seg_idx, segment in enumerate(segments):
+                postings = segment.postings(term)
+                if postings is None:
+                    continue
+                units = segment.units
+                for i in range(0, len(postings), 2):
+                    unit_idx, tf = postings[i], postings[i + 1]
+                    dl = units[unit_idx][4]
+                    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * dl / avgdl) if avgdl else BM25_K1
+                    key = (seg_idx, unit_idx)
+                    scores[key] = scores.get(key, 0.0) + idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+
+        results = []
+        for (seg_idx, unit_idx), score in heapq.nlargest(top_k, scores.items(), key=lambda item: item[1]):
+            segment = segments[seg_idx]
+            page_number, article_id, _, _, _, start, end = segment.units[unit_idx]
+            results.append({
+                "document_id": segment.doc_id,
+                "source_file": segment.source_file,
+                "page_number": page_number,
+                "content": segment.text(unit_idx),
+                "article_id": article_id,
+                "start": start,
+                "end": end,
+                "score": score,
+            })
+        return results
+
+    def documents(self, store_id: str):
+        """
+        Documentos vigentes del Store como (doc_id, source_file, unidades), p.ej. para
+        reconstruir otros índices sin volver a leer los PDFs.
+        """
+        self._refresh(store_id)
+        with self._lock:
+            segments = list(self._segments.get(store_id, {}).values())
+        for segment in segments:
+            units = []
+            for unit_idx, (page_number, article_id, _, _, _, start, end) in enumerate(segment.units):
+                units.append({"page_number": page_number, "article_id": article_id, "start": start,
+                              "end": end, "content": segment.text(unit_idx)})
+            yield segment.doc_id, segment.source_file, units
+
+    def document_count(self, store_id: str) -> int:
+        self._refresh(store_id)
+        return len(self._segments.get(store_id, {}))
+
+
+_index: Optional[LexicalIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    """
+    Instancia compartida del índice (la usan tanto la ingesta como el Router).
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = LexicalIndex()
+        return _index
@@ -0,0 +1,39 @@
+import re
+import unicodedata
+from typing import List
+
+# Tokens alfanuméricos; conserva códigos de norma como "e.030", "is.010" o "12.3"
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+
+SPANISH_STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aquel aquella aquellas aquellos aqui asi
+bajo cada como con contra cual cuales cuando cuanto de del desde donde dos el ella ellas ellos en
+entre era eran es esa esas ese eso esos esta estan estas este esto estos fue fueron ha han hasta hay
+la las le les lo los mas me mi mientras muy no nos o otra otras otro otros para pero por porque que
+quien se segun ser si sin sino sobre son su sus tal tambien tan tanto te tiene tienen todo todos tu
+un una unas uno unos y ya
+""".split())
+
+
+def fold_accents(text: str) -> str:
+    """
+    Minúsculas y sin tildes ("Artículo" -> "articulo", "Diseño" -> "diseno").
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _stem(token: str) -> str:
+    """
+    Stemming ligero para español: unifica singular y plural ("zapatas" -> "zapata").
+    """
+    if len(token) > 4 and token.endswith("s") and not any(c.isdigit() for c in token):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokeniza texto en español: plegado de tildes, descarte de stopwords y stemming ligero.
+    """
+    return [_stem(t) for t in _TOKEN_RE.findall(fold_accents(text)) if t not in SPANISH_STOPWORDS]
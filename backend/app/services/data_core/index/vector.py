@@ -0,0 +1,533 @@
+import os
+import json
+import mmap
+import zlib
+import importlib
+import threading
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Set
+
+import numpy as np
+
+from app.services.data_core.index.text import tokenize
+
+VECTOR_INDEX_PATH = Path(os.getenv("VECTOR_INDEX_PATH", "./data/index/vector"))
+# Embedder: "hashing" (local, determinista) o la ruta "modulo:Clase" de uno propio
+VECTOR_EMBEDDER = os.getenv("VECTOR_EMBEDDER", "hashing")
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "384"))
+# Almacenamiento de los vectores: "int8" (escala por fila) o "float16"
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "int8")
+# Similitud coseno mínima para devolver un resultado
+VECTOR_MIN_SCORE = float(os.getenv("VECTOR_MIN_SCORE", "0.2"))
+# Filas por bloque del producto matricial: la conversión a float32 de cada bloque cabe en caché
+VECTOR_BLOCK_ROWS = int(os.getenv("VECTOR_BLOCK_ROWS", "4096"))
+# Compactación: máximo de segmentos por Store y fracción de filas reemplazadas tolerada por segmento
+VECTOR_MAX_SEGMENTS = int(os.getenv("VECTOR_MAX_SEGMENTS", "8"))
+VECTOR_MAX_DEAD_RATIO = float(os.getenv("VECTOR_MAX_DEAD_RATIO", "0.5"))
+
+STORES = ("A", "B", "C", "D")
+
+
+def _signed_slot(feature: str, dim: int):
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % dim, (1.0 if h & 0x80000000 else -1.0)
+
+
+@lru_cache(maxsize=1 << 16)
+def _token_features(token: str, dim: int):
+    """
+    Posiciones y pesos (con signo) del término y sus trigramas de caracteres; el peso de los
+    trigramas de una palabra suma 1, sin importar su largo.
+    """
+    padded = f"<{token}>"
+    grams = [padded[j:j + 3] for j in range(len(padded) - 2)]
+    slots = [_signed_slot(f"w:{token}", dim)] + [_signed_slot(f"c:{gram}", dim) for gram in grams]
+    indices = np.array([slot for slot, _ in slots], dtype=np.intp)
+    weights = np.array([sign for _, sign in slots], dtype=np.float32)
+    weights[1:] /= max(len(grams), 1)
+    return indices, weights
+
+
+class HashingEmbedder:
+    """
+    Embedder local sin modelo: "feature hashing" con signo de términos, pares de términos
+    consecutivos y trigramas de caracteres, normalizado a norma 1.
+
+    Los trigramas dan tolerancia a variantes morfológicas y errores de tipeo ("sísmico" /
+    "sismica", "placas" / "placa"); para paráfrasis reales (sinónimos) se configura un
+    embedder con modelo vía VECTOR_EMBEDDER. Es determinista entre procesos (crc32, no `hash`).
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = VECTOR_DIM):
+        self.dim = dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            vector = vectors[row]
+            for token, count in Counter(tokens).items():
+                indices, weights = _token_features(token, self.dim)
+                np.add.at(vector, indices, weights * count)
+            for pair, count in Counter(zip(tokens, tokens[1:])).items():
+                slot, sign = _signed_slot(f"b:{pair[0]} {pair[1]}", self.dim)
+                vector[slot] += 0.5 * sign * count
+        # Frecuencias sublineales y normalización L2
+        np.copyto(vectors, np.sign(vectors) * np.log1p(np.abs(vectors)))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def load_embedder(spec: str = VECTOR_EMBEDDER):
+    """
+    Instancia el embedder configurado. Uno propio debe exponer `name`, `dim` y
+    `embed(texts) -> np.ndarray` (float32, filas de norma 1).
+    """
+    if spec == "hashing":
+        return HashingEmbedder()
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def quantize(vectors: np.ndarray, dtype: str = VECTOR_DTYPE):
+    """
+    Cuantiza filas float32: int8 simétrico con una escala por fila, o float16.
+
+    Returns:
+        tuple: (matriz cuantizada, escalas float32 o None).
+    """
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class _Segment:
+    """
+    Segmento inmutable de un Store: las filas de un lote de documentos.
+
+    Archivos:
+        <segmento>.vec.npy     Matriz (filas x dim) int8 o float16, leída vía mmap.
+        <segmento>.scale.npy   Escala float32 por fila (sólo int8).
+        <segmento>.units.json  Por fila: documento, página, artículo, offsets y posición del texto.
+        <segmento>.text        Texto UTF-8 de las unidades concatenado, leído vía mmap.
+
+    Los archivos nunca se reescriben: reemplazar un documento deja sus filas anteriores sin
+    referencias en el MANIFEST, y la compactación las descarta.
+    """
+
+    def __init__(self, base: str, name: str, dtype: str):
+        self.name = name
+        self.vectors = np.load(f"{base}.vec.npy", mmap_mode="r")
+        self.scales = np.load(f"{base}.scale.npy", mmap_mode="r") if dtype == "int8" else None
+        with open(f"{base}.units.json", "r") as f:
+            self.units = json.load(f)
+        self._text_file = open(f"{base}.text", "rb")
+        self._text_map = mmap.mmap(self._text_file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if os.path.getsize(self._text_file.name) else None
+
+    @property
+    def rows(self) -> int:
+        return self.vectors.shape[0]
+
+    def text_bytes(self, row: int) -> bytes:
+        start, length = self.units[row][5:7]
+        return self._text_map[start:start + length] if self._text_map else b""
+
+    def text(self, row: int) -> str:
+        return self.text_bytes(row).decode("utf-8")
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Similitud coseno de cada consulta con todas las filas (consultas x filas), por bloques.
+        """
+        scores = np.empty((queries.shape[0], self.rows), dtype=np.float32)
+        for start in range(0, self.rows, VECTOR_BLOCK_ROWS):
+            end = min(start + VECTOR_BLOCK_ROWS, self.rows)
+            block = queries @ self.vectors[start:end].astype(np.float32).T
+            if self.scales is not None:
+                block *= self.scales[start:end]
+            scores[:, start:end] = block
+        return scores
+
+
+class _StoreView:
+    """
+    Segmentos vigentes de un Store vistos como una sola matriz: filas globales, rango vigente
+    de cada documento y máscara de filas vigentes (las reemplazadas o quitadas no puntúan).
+    """
+
+    def __init__(self, segments: List[_Segment], docs: Dict[str, list]):
+        self.segments = segments
+        self.offsets = np.cumsum([0] + [segment.rows for segment in segments])
+        position = {segment.name: idx for idx, segment in enumerate(segments)}
+        self.docs: Dict[str, tuple] = {}
+        self.live = np.zeros(int(self.offsets[-1]), dtype=bool)
+        for doc_id, (segment_name, row_start, row_end, source_file) in docs.items():
+            offset = int(self.offsets[position[segment_name]])
+            self.docs[doc_id] = (offset + row_start, offset + row_end, source_file)
+            self.live[offset + row_start:offset + row_end] = True
+
+    @property
+    def rows(self) -> int:
+        return self.live.shape[0]
+
+    def locate(self, row: int):
+        idx = int(np.searchsorted(self.offsets, row, side="right")) - 1
+        return self.segments[idx], row - int(self.offsets[idx])
+
+    def scores(self, queries: np.ndarray, exclude=()) -> np.ndarray:
+        scores = np.hstack([segment.scores(queries) for segment in self.segments])
+        scores[:, ~self.live] = -np.inf
+        for doc_id in exclude or ():
+            rows_range = self.docs.get(doc_id)
+            if rows_range is not None:
+                scores[:, rows_range[0]:rows_range[1]] = -np.inf
+        return scores
+
+
+class VectorIndex:
+    """
+    Índice vectorial local, particionado por Store (A/B/C/D).
+
+    Cada Store es un conjunto de segmentos inmutables (matrices cuantizadas int8 o float16
+    leídas vía mmap), de modo que una búsqueda es un producto matricial por lotes más un top-k.
+    Como en el índice léxico, cada lote de documentos agregado escribe sólo un segmento nuevo y
+    actualiza el MANIFEST.json; cuando hay demasiados segmentos, o demasiadas filas
+    reemplazadas, los más chicos se fusionan en uno. Los lectores recargan el MANIFEST cuando
+    cambia en disco.
+    """
+
+    def __init__(self, root: Path = VECTOR_INDEX_PATH, embedder=None, dtype: str = VECTOR_DTYPE):
+        self.root = Path(root)
+        self.embedder = embedder or load_embedder()
+        self.dtype = dtype
+        self._lock = threading.RLock()
+        self._views: Dict[str, Optional[_StoreView]] = {store: None for store in STORES}
+        self._segments: Dict[str, Dict[str, _Segment]] = {store: {} for store in STORES}
+        self._manifest_mtime: Dict[str, int] = {}
+        for store in STORES:
+            (self.root / store).mkdir(parents=True, exist_ok=True)
+
+    # --- Manifest -------------------------------------------------------------
+
+    def _manifest_path(self, store: str) -> Path:
+        return self.root / store / "MANIFEST.json"
+
+    def _read_manifest(self, store: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._manifest_path(store), "r") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+        if "segments" not in manifest:
+            # Formato anterior: una única generación con todas las filas
+            name = manifest.pop("generation_name")
+            manifest["segments"] = [name]
+            manifest["docs"] = {doc_id: [name, *entry] for doc_id, entry in manifest["docs"].items()}
+        return manifest
+
+    def _write_manifest(self, store: str, manifest: Dict[str, Any]):
+        path = self._manifest_path(store)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+    def _compatible(self, manifest: Dict[str, Any]) -> bool:
+        return manifest.get("embedder") == self.embedder.name and manifest.get("dim") == self.embedder.dim
+
+    def _open_segment(self, store: str, name: str, dtype: str) -> _Segment:
+        opened = self._segments[store]
+        if name not in opened:
+            opened[name] = _Segment(str(self.root / store / name), name, dtype)
+        return opened[name]
+
+    def _refresh(self, store: str):
+        """
+        Sincroniza los segmentos abiertos del Store con el MANIFEST si cambió en disco.
+        """
+        try:
+            mtime = self._manifest_path(store).stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = 0
+        if self._manifest_mtime.get(store) == mtime:
+            return
+        with self._lock:
+            manifest = self._read_manifest(store)
+            view = None
+            if manifest and manifest["docs"]:
+                if self._compatible(manifest):
+                    segments = [self._open_segment(store, name, manifest["dtype"]) for name in manifest["segments"]]
+                    view = _StoreView(segments, manifest["docs"])
+                else:
+                    print(f"WARN: Vector index of store {store} was built with {manifest.get('embedder')}/"
+                          f"{manifest.get('dim')}; rebuild it for {self.embedder.name}/{self.embedder.dim}")
+            wanted = set(manifest["segments"]) if manifest else set()
+            for name in list(self._segments[store]):
+                if name not in wanted:
+                    self._segments[store].pop(name)
+            self._views[store] = view
+            self._manifest_mtime[store] = mtime
+
+    # --- Escritura ------------------------------------------------------------
+
+    def _write_segment(self, store: str, name: str, parts: List[Dict[str, Any]]) -> Dict[str, list]:
+        """
+        Escribe un segmento con las filas de `parts` (documentos con `vectors`, `scales`,
+        `units` y los textos ya codificados en `texts`).
+
+        Returns:
+            dict: doc_id -> [segmento, fila inicial, fila final, source_file].
+        """
+        vector_parts, scale_parts, units, docs = [], [], [], {}
+        text_blob = bytearray()
+        for part in parts:
+            vector_parts.append(part["vectors"])
+            if part["scales"] is not None:
+                scale_parts.append(part["scales"])
+            docs[part["doc_id"]] = [name, len(units), len(units) + len(part["units"]), part["source_file"]]
+            for unit, encoded in zip(part["units"], part["texts"]):
+                units.append(unit[:5] + [len(text_blob), len(encoded)])
+                text_blob.extend(encoded)
+
+        base = self.root / store / name
+        np.save(f"{base}.vec.npy", np.concatenate(vector_parts))
+        if scale_parts:
+            np.save(f"{base}.scale.npy", np.concatenate(scale_parts))
+        with open(f"{base}.units.json", "w") as f:
+            json.dump(units, f)
+        with open(f"{base}.text", "wb") as f:
+            f.write(text_blob)
+        return docs
+
+    def _delete_segment_files(self, store: str, name: str):
+        # Seguro aunque haya búsquedas en curso: los mapeos abiertos siguen siendo válidos
+        base = self.root / store / name
+        for suffix in (".vec.npy", ".scale.npy", ".units.json", ".text"):
+            Path(f"{base}{suffix}").unlink(missing_ok=True)
+
+    def _compact(self, store: str, manifest: Dict[str, Any]):
+        """
+        Descarta los segmentos sin filas vigentes y, si quedan más de VECTOR_MAX_SEGMENTS o
+        alguno tiene más de VECTOR_MAX_DEAD_RATIO de filas reemplazadas, fusiona los más chicos
+        (y los degradados) en un segmento nuevo con sólo sus filas vigentes.
+        """
+        live_rows: Counter = Counter()
+        for segment_name, row_start, row_end, _ in manifest["docs"].values():
+            live_rows[segment_name] += row_end - row_start
+        manifest["segments"] = [name for name in manifest["segments"] if live_rows[name]]
+
+        segments = {name: self._open_segment(store, name, manifest["dtype"]) for name in manifest["segments"]}
+        merge = {name for name, segment in segments.items()
+                 if 1 - live_rows[name] / segment.rows > VECTOR_MAX_DEAD_RATIO}
+        by_size = sorted(manifest["segments"], key=lambda name: live_rows[name])
+        excess = len(manifest["segments"]) - VECTOR_MAX_SEGMENTS
+        if excess > 0:
+            merge.update(by_size[:excess + VECTOR_MAX_SEGMENTS // 2])
+        if not merge:
+            return
+
+        parts = []
+        for doc_id, (segment_name, row_start, row_end, source_file) in manifest["docs"].items():
+            if segment_name not in merge:
+                continue
+            segment = segments[segment_name]
+            parts.append({
+                "doc_id": doc_id, "source_file": source_file,
+                "vectors": segment.vectors[row_start:row_end],
+                "scales": segment.scales[row_start:row_end] if segment.scales is not None else None,
+                "units": segment.units[row_start:row_end],
+                "texts": [segment.text_bytes(row) for row in range(row_start, row_end)],
+            })
+        manifest["generation"] += 1
+        name = f"seg-{manifest['generation']:08d}"
+        manifest["docs"].update(self._write_segment(store, name, parts))
+        first = min(manifest["segments"].index(merged) for merged in merge)
+        manifest["segments"] = [segment_name for segment_name in manifest["segments"] if segment_name not in merge]
+        manifest["segments"].insert(first, name)
+        print(f"DEBUG: Compacted {len(merge)} vector segments of store {store} into {name}")
+
+    def _commit(self, store: str, manifest: Dict[str, Any], previous_segments: List[str]):
+        """
+        Publica el MANIFEST y borra los segmentos que dejaron de estar referenciados.
+        """
+        self._write_manifest(store, manifest)
+        for name in set(previous_segments) - set(manifest["segments"]):
+            self._segments[store].pop(name, None)
+            self._delete_segment_files(store, name)
+        self._manifest_mtime.pop(store, None)
+
+    def add_document(self, doc_id: str, source_file: str, store: str, units: List[Dict[str, Any]]):
+        """
+        Embebe e indexa las unidades de un documento (reemplaza su versión previa).
+
+        Args:
+            units: Las mismas unidades que recibe el índice léxico (`page_number`, `content` y
+                opcionalmente `article_id`, `start` y `end`).
+        """
+        self.add_documents(store, [(doc_id, source_file, units)])
+
+    def add_documents(self, store: str, documents: List[tuple]):
+        """
+        Variante por lotes de `add_document` (un solo segmento nuevo para todo el lote).
+
+        Args:
+            documents: Tuplas (doc_id, source_file, units).
+        """
+        if not documents:
+            return
+        additions = []
+        for doc_id, source_file, units in documents:
+            if not units:
+                continue
+            vectors, scales = quantize(self.embedder.embed([unit["content"] for unit in units]), self.dtype)
+            additions.append({
+                "doc_id": doc_id, "source_file": source_file, "vectors": vectors, "scales": scales,
+                "units": [[doc_id, unit["page_number"], unit.get("article_id"), unit.get("start"), unit.get("end")]
+                          for unit in units],
+                "texts": [unit["content"].encode("utf-8") for unit in units],
+            })
+        with self._lock:
+            manifest = self._read_manifest(store)
+            previous_segments = list(manifest["segments"]) if manifest else []
+            if not (manifest and self._compatible(manifest) and manifest["dtype"] == self.dtype):
+                # Índice vacío o construido con otro embedder: se empieza de cero
+                manifest = {
+                    "generation": manifest["generation"] if manifest else 0, "segments": [], "docs": {},
+                    "embedder": self.embedder.name, "dim": self.embedder.dim, "dtype": self.dtype,
+                }
+            for doc_id, _, _ in documents:
+                manifest["docs"].pop(doc_id, None)
+            if additions:
+                manifest["generation"] += 1
+                name = f"seg-{manifest['generation']:08d}"
+                manifest["docs"].update(self._write_segment(store, name, additions))
+                manifest["segments"].append(name)
+                # Si la compactación lo fusiona enseguida, también se borra
+                previous_segments.append(name)
+            self._compact(store, manifest)
+            self._commit(store, manifest, previous_segments)
+        print(f"DEBUG: Embedded {sum(len(a['units']) for a in additions)} units of {len(additions)} documents in store {store}")
+
+    def remove_document(self, doc_id: str, store: Optional[str] = None) -> bool:
+        """
+        Quita las filas de un documento (de todos los Stores si no se indica uno).
+        """
+        removed = False
+        with self._lock:
+            for store_key in ([store] if store else STORES):
+                manifest = self._read_manifest(store_key)
+                if not manifest or doc_id not in manifest["docs"]:
+                    continue
+                previous_segments = list(manifest["segments"])
+                manifest["docs"].pop(doc_id)
+                self._compact(store_key, manifest)
+                self._commit(store_key, manifest, previous_segments)
+                removed = True
+        return removed
+
+    # --- Lectura --------------------------------------------------------------
+
+    def search_many(self, queries: List[str], store_id: str, top_k: int = 5,
+                    min_score: float = VECTOR_MIN_SCORE,
+                    exclude: Optional[Set[str]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Búsqueda por similitud coseno de varias consultas a la vez (un solo producto matricial).
+        Las filas de los documentos en `exclude` se descartan antes del top-k.
+
+        Returns:
+            list: Por consulta, resultados con los mismos campos que el índice léxico.
+        """
+        if store_id not in self._views:
+            return [[] for _ in queries]
+        self._refresh(store_id)
+        view = self._views[store_id]
+        if view is None or not queries or not view.rows:
+            return [[] for _ in queries]
+
+        scores = view.scores(self.embedder.embed(queries), exclude)
+        k = min(top_k, view.rows)
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        all_results = []
+        for query_idx, row_ids in enumerate(candidates):
+            results = []
+            for row in sorted(row_ids, key=lambda r: -scores[query_idx, r]):
+                score = float(scores[query_idx, row])
+                if score < min_score:
+                    break
+                segment, local_row = view.locate(int(row))
+                doc_id, page_number, article_id, start, end = segment.units[local_row][:5]
+                results.append({
+                    "document_id": doc_id,
+                    "source_file": view.docs[doc_id][2],
+                    "page_number": page_number,
+                    "content": segment.text(local_row),
+                    "article_id": article_id,
+                    "start": start,
+                    "end": end,
+                    "score": score,
+                })
+            all_results.append(results)
+        return all_results
+
+    def search(self, query: str, store_id: str, top_k: int = 5,
+               exclude: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        return self.search_many([query], store_id, top_k, exclude=exclude)[0]
+
+    def store_scores(self, query: str, exclude: Optional[Dict[str, Set[str]]] = None) -> Dict[str, float]:
+        """
+        Mejor similitud de la consulta en cada Store (para enrutar consultas sin palabras clave).
+        `exclude` indica por Store los documentos que no cuentan (los de otros proyectos en D).
+        """
+        query_vector = self.embedder.embed([query])
+        best = {}
+        for store in STORES:
+            self._refresh(store)
+            view = self._views[store]
+            if view is None or not view.rows:
+                best[store] = 0.0
+                continue
+            scores = view.scores(query_vector, (exclude or {}).get(store, ()))
+            best[store] = max(float(scores.max()), 0.0)
+        return best
+
+    def document_count(self, store_id: str) -> int:
+        self._refresh(store_id)
+        view = self._views.get(store_id)
+        return len(view.docs) if view is not None else 0
+
+
+_index: Optional[VectorIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_vector_index() -> VectorIndex:
+    """
+    Instancia compartida del índice vectorial.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = VectorIndex()
+        return _index
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.services.data_core.index.lexical import get_lexical_index
+
+    parser = argparse.ArgumentParser(description="Reconstruye el índice vectorial a partir del índice léxico")
+    parser.add_argument("--stores", default=",".join(STORES), help="Stores a reconstruir (p.ej. B,C)")
+    args = parser.parse_args()
+
+    lexical, vector = get_lexical_index(), get_vector_index()
+    for store in args.stores.split(","):
+        vector.add_documents(store, list(lexical.documents(store)))
+        print(f"INFO: Store {store}: {vector.document_count(store)} documents embedded")
@@ -0,0 +1,262 @@
+import os
+import time
+import asyncio
+from pathlib import Path
+from typing import Dict, Any, AsyncGenerator, List, Optional, Tuple
+from uuid import uuid4
+
+from app.services.data_core.engine import PIPELINE_STAGES
+from app.services.data_core.projects.manager import PROJECT_STORE
+from app.services.data_core.jobs.store import (
+    JobStore, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED, TERMINAL_STATUSES,
+)
+
+# Jobs de ingesta ejecutándose a la vez (el resto espera en cola)
+MAX_ACTIVE_JOBS = int(os.getenv("MAX_ACTIVE_JOBS", "4"))
+
+
+class JobManager:
+    """
+    Cola de jobs de ingesta en segundo plano.
+
+    El procesamiento de un documento ya no depende de la conexión HTTP que lo subió: cada
+    subida se convierte en un job con ID, su progreso se persiste tras cada etapa del
+    pipeline y los clientes pueden consultarlo o suscribirse a sus logs. Tras un reinicio,
+    `resume_pending` retoma los jobs inconclusos desde la última etapa completada.
+    """
+
+    def __init__(self, engine, store: Optional[JobStore] = None, max_active: int = MAX_ACTIVE_JOBS,
+                 projects=None):
+        self.engine = engine
+        # ProjectManager para las subidas destinadas a un proyecto (Store D)
+        self.projects = projects
+        self.store = store or JobStore()
+        self.max_active = max_active
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        # Log por job: última secuencia asignada, líneas aún no persistidas y su escritor
+        self._event_seq: Dict[str, int] = {}
+        self._unflushed: Dict[str, List[tuple]] = {}
+        self._writers: Dict[str, asyncio.Task] = {}
+
+    # --- Envío ----------------------------------------------------------------
+
+    def submit(self, file_path: str, original_name: str, content_hash: Optional[str] = None,
+               project_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Encola la ingesta de un archivo ya guardado en disco y devuelve el job creado. Con
+        `project_id`, el documento va al Store D y se agrega al proyecto al terminar.
+        """
+        job_id = uuid4().hex
+        state = {"file_path": str(file_path), "original_filename": original_name, "content_hash": content_hash}
+        if project_id:
+            state.update(project_id=project_id, store_type=PROJECT_STORE)
+        job = self.store.create(job_id, "ingest", original_name, state)
+        self._schedule(job_id)
+        print(f"DEBUG: Job {job_id} queued for {original_name}")
+        return job
+
+    def resume_pending(self) -> int:
+        """
+        Reprograma los jobs que quedaron encolados o en curso. Devuelve cuántos se retomaron.
+        """
+        resumed = 0
+        for job in self.store.unfinished():
+            if job["id"] in self._tasks:
+                continue
+            self.store.update(job["id"], status=JOB_QUEUED)
+            self._schedule(job["id"])
+            resumed += 1
+        if resumed:
+            print(f"INFO: Resuming {resumed} unfinished ingestion jobs")
+        return resumed
+
+    def _schedule(self, job_id: str):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_active)
+        task = asyncio.get_running_loop().create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    # --- Ejecución ------------------------------------------------------------
+
+    async def _run(self, job_id: str):
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            job = await loop.run_in_executor(None, self.store.get, job_id)
+            state = job["state"]
+            await self._update(job_id, status=JOB_RUNNING)
+            # Un job reanudado continúa la numeración de su log
+            self._event_seq[job_id] = await loop.run_in_executor(None, self.store.last_event_seq, job_id)
+
+            async def on_stage_complete(stage: str, stage_state: Dict[str, Any]):
+                if stage == "register" and self._owns_record(stage_state):
+                    # Oculto a otros proyectos desde antes de indexarlo
+                    await loop.run_in_executor(
+                        None, self.projects.claim_document, stage_state["project_id"], stage_state["record"]
+                    )
+                progress = len(stage_state["completed_stages"]) / len(PIPELINE_STAGES)
+                await self._update(job_id, stage=stage, progress=round(progress, 4), state=stage_state)
+
+            try:
+                async for line in self.engine.process_document(
+                    state["file_path"], state["original_filename"], content_hash=state.get("content_hash"),
+                    state=state, on_stage_complete=on_stage_complete,
+                ):
+                    self._publish(job_id, line)
+            except Exception as e:
+                state["error"] = str(e)
+                self._publish(job_id, f"ERROR: {str(e)}\n")
+
+            if not state.get("error") and state.get("project_id"):
+                await self._assign_project(job_id, state)
+
+            # El historial debe estar completo antes de marcar el job como terminado
+            await self._flush_events(job_id)
+            if state.get("error"):
+                await self._update(job_id, status=JOB_FAILED, error=state["error"], state=state)
+            else:
+                record = state.get("record") or {}
+                await self._update(job_id, status=JOB_SUCCEEDED, progress=1.0, record_id=record.get("id"), state=state)
+            # El archivo temporal sólo se necesita para reanudar; el job ya terminó
+            Path(state["file_path"]).unlink(missing_ok=True)
+            self._close(job_id)
+
+    async def _update(self, job_id: str, **fields):
+        """
+        `store.update` fuera del event loop: escribe en SQLite y serializa el estado del job.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, lambda: self.store.update(job_id, **fields))
+
+    @staticmethod
+    def _owns_record(state: Dict[str, Any]) -> bool:
+        """
+        La subida de proyecto registró un documento nuevo (no reutiliza uno del corpus).
+        """
+        return bool(state.get("project_id")) and state["record"]["id"] == state.get("record_id")
+
+    async def _assign_project(self, job_id: str, state: Dict[str, Any]):
+        """
+        Agrega el documento ingestado al proyecto de la subida (idempotente al reanudar). Si
+        el contenido ya existía en el corpus, el proyecto sólo lo referencia.
+
+        Si no se puede agregar, el documento propio se elimina del registro y del índice.
+        """
+        record = state["record"]
+        owned = self._owns_record(state)
+        loop = asyncio.get_running_loop()
+        try:
+            project = await loop.run_in_executor(
+                None, self.projects.add_document, state["project_id"], record, owned
+            )
+        except Exception as e:
+            project = None
+            state["error"] = f"Error al agregar al proyecto {state['project_id']}: {e}"
+        else:
+            if project is None:
+                state["error"] = f"Proyecto {state['project_id']} no encontrado"
+        if project is not None:
+            self._publish(job_id, f"INFO: Agregado al proyecto {state['project_id']} (versión {project['head']})\n")
+            return
+
+        self._publish(job_id, f"ERROR: {state['error']}\n")
+        if owned:
+            try:
+                await loop.run_in_executor(None, self.projects.discard_document, state["project_id"], record["id"])
+                self._publish(job_id, f"INFO: Documento {record['id']} descartado\n")
+            except Exception as e:
+                print(f"WARN: Could not discard project document {record['id']}: {e}")
+
+    def _publish(self, job_id: str, line: str):
+        """
+        Entrega una línea de log a los suscriptores y la encola para persistirla fuera del
+        event loop (ver _write_events). La secuencia se lleva en memoria por job.
+        """
+        seq = self._event_seq.get(job_id, 0) + 1
+        self._event_seq[job_id] = seq
+        self._unflushed.setdefault(job_id, []).append((seq, line, time.time()))
+        if job_id not in self._writers:
+            self._writers[job_id] = asyncio.get_running_loop().create_task(self._write_events(job_id))
+        for queue in self._subscribers.get(job_id, []):
+            queue.put_nowait((seq, line))
+
+    async def _write_events(self, job_id: str):
+        """
+        Escritor único del log de un job: persiste en un lote todas las líneas acumuladas
+        mientras se escribía el anterior. Las líneas siguen en `_unflushed` hasta confirmarse.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while self._unflushed.get(job_id):
+                batch = list(self._unflushed[job_id])
+                await loop.run_in_executor(None, self.store.append_events, job_id, batch)
+                del self._unflushed[job_id][:len(batch)]
+        except Exception as e:
+            print(f"WARN: Could not persist log of job {job_id}: {e}")
+        finally:
+            self._writers.pop(job_id, None)
+
+    async def _flush_events(self, job_id: str):
+        if self._unflushed.get(job_id) and job_id not in self._writers:
+            # Reintento tras un fallo de escritura
+            self._writers[job_id] = asyncio.get_running_loop().create_task(self._write_events(job_id))
+        writer = self._writers.get(job_id)
+        if writer is not None:
+            await writer
+
+    def _close(self, job_id: str):
+        self._event_seq.pop(job_id, None)
+        self._unflushed.pop(job_id, None)
+        for queue in self._subscribers.pop(job_id, []):
+            queue.put_nowait(None)
+
+    # --- Consulta -------------------------------------------------------------
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def list(self, limit: int = 50, offset: int = 0, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self.store.list(limit=limit, offset=offset, status=status)
+
+    async def events(self, job_id: str, after: int = 0) -> AsyncGenerator[Tuple[int, str], None]:
+        """
+        Líneas de log del job como (secuencia, línea): primero el historial posterior a
+        `after` y luego las nuevas en vivo, hasta que el job termina.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        # Suscribirse antes de leer el historial para no perder líneas intermedias; las
+        # publicadas antes que aún no se persistieron se toman de la memoria
+        self._subscribers.setdefault(job_id, []).append(queue)
+        unflushed = list(self._unflushed.get(job_id, ()))
+        try:
+            last_seq = after
+            for seq, line in await loop.run_in_executor(None, self.store.events, job_id, after):
+                last_seq = seq
+                yield seq, line
+            for seq, line, _ in unflushed:
+                if seq > last_seq:
+                    last_seq = seq
+                    yield seq, line
+
+            job = await loop.run_in_executor(None, self.store.get, job_id)
+            if job is None or job["status"] in TERMINAL_STATUSES:
+                # Líneas emitidas entre la lectura del historial y el cierre del job
+                for seq, line in await loop.run_in_executor(None, self.store.events, job_id, last_seq):
+                    yield seq, line
+                return
+
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                seq, line = item
+                if seq <= last_seq:
+                    continue
+                last_seq = seq
+                yield seq, line
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers and queue in subscribers:
+                subscribers.remove(queue)
@@ -0,0 +1,147 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+JOBS_DB_PATH = Path(os.getenv("JOBS_DB_PATH", "./data/jobs.db"))
+
+# Estados de un job de ingesta
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+TERMINAL_STATUSES = (JOB_SUCCEEDED, JOB_FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    original_name TEXT,
+    record_id TEXT,
+    error TEXT,
+    state TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    line TEXT NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class JobStore:
+    """
+    Tabla persistente de jobs de ingesta (SQLite en modo WAL).
+
+    Cada job guarda el estado del pipeline tras cada etapa completada, lo que permite
+    reanudarlo después de un reinicio, y el historial de líneas de log para reproducirlo
+    a clientes que se suscriben tarde.
+    """
+
+    def __init__(self, db_path: Path = JOBS_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["state"] = json.loads(job["state"])
+        return job
+
+    def create(self, job_id: str, kind: str, original_name: str, state: Dict[str, Any]) -> Dict[str, Any]:
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, original_name, state, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, JOB_QUEUED, original_name, json.dumps(state), now, now),
+            )
+        return self.get(job_id)
+
+    def update(self, job_id: str, **fields):
+        """
+        Actualiza columnas del job (`state` se serializa a JSON).
+        """
+        if "state" in fields:
+            fields["state"] = json.dumps(fields["state"])
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._connect()
+        with conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def list(self, limit: int = 50, offset: int = 0, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        query, params = "SELECT * FROM jobs", []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY created DESC LIMIT ? OFFSET ?"
+        rows = self._connect().execute(query, (*params, limit, offset)).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """
+        Jobs que quedaron encolados o en curso (p.ej. por un reinicio del servidor).
+        """
+        rows = self._connect().execute(
+            "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created", (JOB_QUEUED, JOB_RUNNING)
+        ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def append_events(self, job_id: str, events: List[tuple]):
+        """
+        Guarda en una sola transacción líneas de log del job como (secuencia, línea, fecha).
+        La secuencia la asigna quien publica (ver JobManager); reintentar un lote no duplica líneas.
+        """
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO job_events (job_id, seq, line, created) VALUES (?, ?, ?, ?)",
+                [(job_id, seq, line, created) for seq, line, created in events],
+            )
+
+    def last_event_seq(self, job_id: str) -> int:
+        """
+        Secuencia de la última línea guardada del job (0 si no tiene), para continuar al reanudar.
+        """
+        row = self._connect().execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM job_events WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return row[0]
+
+    def events(self, job_id: str, after: int = 0) -> List[tuple]:
+        rows = self._connect().execute(
+            "SELECT seq, line FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+        ).fetchall()
+        return [(row["seq"], row["line"]) for row in rows]
@@ -0,0 +1,102 @@
+import os
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+# Tamaño máximo de un fragmento; los artículos más largos se parten por párrafos
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1500"))
+
+# Anclas de normas peruanas al inicio de línea:
+#   "Artículo 12", "ARTÍCULO 12.3°", "Tabla N° 1", "E.030 § 4.2", "§ 4", "4.2.1 CATEGORÍA ..."
+_ANCHOR_RE = re.compile(
+    r"^[ \t]*(?:"
+    r"(?P<article>art[íi]culo\s+(?P<article_num>\d+(?:\.\d+)*))"
+    r"|(?P<table>tabla\s+(?:n\s*)?[°º.]?\s*(?P<table_num>\d+(?:\.\d+)*))"
+    r"|(?P<section>(?:(?P<code>[a-z]{1,3}\.\d{3})\s*)?§\s*(?P<section_num>\d+(?:\.\d+)*))"
+    r"|(?P<heading>(?P<heading_num>\d+(?:\.\d+)+)\.?[ \t]+(?-i:[A-ZÁÉÍÓÚÑ]))"
+    r")",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def _anchor_id(match: re.Match) -> Tuple[str, str]:
+    """
+    Devuelve (tipo, identificador legible) de un ancla encontrada.
+    """
+    if match.group("article"):
+        return "article", f"Art. {match.group('article_num')}"
+    if match.group("table"):
+        return "table", f"Tabla {match.group('table_num')}"
+    if match.group("section"):
+        code = match.group("code")
+        section = f"§ {match.group('section_num')}"
+        return "section", f"{code.upper()} {section}" if code else section
+    return "section", match.group("heading_num")
+
+
+def _strip_span(text: str, start: int, end: int) -> Tuple[int, int]:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _split_long(text: str, start: int, end: int, max_chars: int) -> List[Tuple[int, int]]:
+    """
+    Parte un tramo largo en piezas de hasta max_chars, cortando en saltos de línea cuando es posible.
+    """
+    spans = []
+    while end - start > max_chars:
+        cut = text.rfind("\n", start + max_chars // 2, start + max_chars)
+        if cut == -1:
+            cut = text.rfind(" ", start + max_chars // 2, start + max_chars)
+        if cut == -1:
+            cut = start + max_chars
+        spans.append((start, cut))
+        start = cut
+    spans.append((start, end))
+    return spans
+
+
+def chunk_pages(pages: List[Tuple[int, str]], max_chars: int = CHUNK_MAX_CHARS) -> List[Dict[str, Any]]:
+    """
+    Divide el texto de las páginas en fragmentos de artículo, tabla o sección.
+
+    El texto al inicio de una página que precede a la primera ancla se considera continuación
+    del último artículo de la página anterior.
+
+    Args:
+        pages: Lista de (número de página 1-based, texto de la página).
+        max_chars: Tamaño máximo de cada fragmento.
+
+    Returns:
+        list: Fragmentos con `page_number`, `article_id`, `kind`, `start`, `end` (offsets de
+        caracteres dentro del texto de la página) y `content`.
+    """
+    chunks = []
+    current_id: Optional[str] = None
+    current_kind = "text"
+
+    for page_number, text in pages:
+        boundaries = [(m.start(), *_anchor_id(m)) for m in _ANCHOR_RE.finditer(text)]
+        # Tramo inicial (continuación de la página anterior) + un tramo por ancla
+        segments = [(0, current_kind, current_id)] + [(pos, kind, anchor) for pos, kind, anchor in boundaries]
+        for i, (seg_start, kind, anchor) in enumerate(segments):
+            seg_end = segments[i + 1][0] if i + 1 < len(segments) else len(text)
+            current_kind, current_id = kind, anchor
+            seg_start, seg_end = _strip_span(text, seg_start, seg_end)
+            if seg_start >= seg_end:
+                continue
+            for start, end in _split_long(text, seg_start, seg_end, max_chars):
+                start, end = _strip_span(text, start, end)
+                if start >= end:
+                    continue
+                chunks.append({
+                    "page_number": page_number,
+                    "article_id": anchor,
+                    "kind": kind,
+                    "start": start,
+                    "end": end,
+                    "content": text[start:end],
+                })
+    return chunks
@@ -0,0 +1,143 @@
+import os
+import threading
+from typing import Dict, Optional
+
+import fitz  # PyMuPDF
+
+# Caracteres mínimos en la Safe Zone para conservar una página sin imágenes
+DENSITY_MIN_CHARS = int(os.getenv("DENSITY_MIN_CHARS", "100"))
+# "fast": pre-escaneo barato (streams, imágenes, bloques con corte temprano)
+# "full": extracción completa del texto de la Safe Zone (comportamiento anterior)
+DENSITY_MODE = os.getenv("DENSITY_MODE", "fast")
+# Bytes de operadores de texto (BT...ET) por carácter exigido a partir de los cuales la página
+# se conserva sin extraer texto. Es holgado a propósito: cubre posicionamiento, strings hex y
+# encabezados/pies fuera de la Safe Zone; en caso de duda se extraen los bloques.
+DENSITY_STREAM_BYTES_PER_CHAR = int(os.getenv("DENSITY_STREAM_BYTES_PER_CHAR", "16"))
+
+# Decisiones por página (un carácter por página en la caché)
+PAGE_EMPTY = "E"
+PAGE_IMAGE = "I"
+PAGE_TEXT = "T"
+
+# Extracción mínima: sin imágenes, ligaduras ni espacios preservados
+_BLOCK_FLAGS = fitz.TEXT_MEDIABOX_CLIP
+
+
+def _content_length(doc: fitz.Document, page: fitz.Page) -> int:
+    """
+    Tamaño (comprimido) de los content streams de la página, leído del diccionario del
+    objeto sin descomprimirlo.
+    """
+    total = 0
+    for xref in page.get_contents():
+        kind, value = doc.xref_get_key(xref, "Length")
+        if kind == "int":
+            total += int(value)
+        else:
+            # Longitud indirecta o ausente: se asume contenido
+            return -1
+    return total
+
+
+def _text_operator_bytes(content: bytes) -> int:
+    """
+    Bytes dentro de los objetos de texto (BT ... ET) del content stream ya descomprimido.
+    """
+    total, position = 0, 0
+    while True:
+        start = content.find(b"BT", position)
+        if start < 0:
+            return total
+        end = content.find(b"ET", start + 2)
+        if end < 0:
+            return total + len(content) - start
+        total += end - start
+        position = end + 2
+
+
+def classify_page(page: fitz.Page, clip: fitz.Rect, mode: str = DENSITY_MODE,
+                  min_chars: int = DENSITY_MIN_CHARS) -> str:
+    """
+    Decide si una página tiene contenido o es un separador.
+
+    En modo "fast" se evita extraer el texto completo:
+
+    1. Sin content streams (o todos vacíos): página en blanco.
+    2. Con imágenes referenciadas: se conserva sin mirar el texto (escaneos, láminas).
+    3. Content stream sin operadores de texto ni XObjects: página en blanco (sólo trazos).
+       Con muchos bytes de texto: se conserva.
+    4. Casos dudosos: bloques de texto de la Safe Zone, cortando en cuanto se alcanzan
+       `min_chars`.
+
+    Las decisiones heurísticas sólo pueden conservar de más, nunca descartar contenido.
+
+    Returns:
+        str: PAGE_EMPTY, PAGE_IMAGE o PAGE_TEXT.
+    """
+    if mode == "full":
+        char_count = len(page.get_text("text", clip=clip).strip())
+        if page.get_images():
+            return PAGE_IMAGE
+        return PAGE_TEXT if char_count >= min_chars else PAGE_EMPTY
+
+    if _content_length(page.parent, page) == 0:
+        return PAGE_EMPTY
+    if page.get_images():
+        return PAGE_IMAGE
+    content = page.read_contents()
+    text_bytes = _text_operator_bytes(content)
+    if text_bytes == 0 and b"Do" not in content:
+        return PAGE_EMPTY
+    if text_bytes >= min_chars * DENSITY_STREAM_BYTES_PER_CHAR:
+        return PAGE_TEXT
+    char_count = 0
+    for block in page.get_text("blocks", clip=clip, flags=_BLOCK_FLAGS, sort=False):
+        # Un salto de línea entre bloques, como en la extracción "text"
+        char_count += len(block[4].strip()) + (1 if char_count else 0)
+        if char_count >= min_chars:
+            return PAGE_TEXT
+    return PAGE_EMPTY
+
+
+def _density_key(layout: Dict, mode: str, min_chars: int) -> str:
+    """
+    Parámetros de los que dependen las decisiones: modo y umbral del análisis y la Safe Zone
+    de la plantilla. Es también el valor de la columna `layout` del backend.
+    """
+    return f"{mode}:{min_chars}:{layout['header']:.4f}:{layout['footer']:.4f}"
+
+
+class PageDensityCache:
+    """
+    Caché de decisiones por página (contenido / separador) por hash de contenido, plantilla
+    de encabezado/pie (la Safe Zone depende de ella) y modo/umbral del análisis.
+
+    Mantiene los resultados en memoria y, si se indica un backend (p.ej. DocumentRegistry),
+    los persiste para que sobrevivan reinicios.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._decisions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, content_hash: str, layout: Dict, mode: str = DENSITY_MODE,
+            min_chars: int = DENSITY_MIN_CHARS) -> Optional[str]:
+        density_key = _density_key(layout, mode, min_chars)
+        key = f"{content_hash}|{density_key}"
+        with self._lock:
+            decisions = self._decisions.get(key)
+        if decisions is None and self.backend is not None:
+            decisions = self.backend.get_page_density(content_hash, density_key)
+            if decisions is not None:
+                with self._lock:
+                    self._decisions[key] = decisions
+        return decisions
+
+    def put(self, content_hash: str, layout: Dict, decisions: str, mode: str = DENSITY_MODE,
+            min_chars: int = DENSITY_MIN_CHARS):
+        density_key = _density_key(layout, mode, min_chars)
+        with self._lock:
+            self._decisions[f"{content_hash}|{density_key}"] = decisions
+        if self.backend is not None:
+            self.backend.save_page_density(content_hash, density_key, decisions)
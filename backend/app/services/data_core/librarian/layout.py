@@ -0,0 +1,239 @@
+import os
+import re
+import hashlib
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional
+
+import fitz  # PyMuPDF
+
+# Páginas muestreadas para detectar encabezados/pies repetidos
+LAYOUT_SAMPLE_PAGES = int(os.getenv("LAYOUT_SAMPLE_PAGES", "8"))
+# Franja superior/inferior (fracción de la altura) donde se buscan bloques repetidos: acota
+# el recorte máximo de encabezado y pie
+LAYOUT_SEARCH_BAND = float(os.getenv("LAYOUT_SEARCH_BAND", "0.10"))
+# Fracción mínima de páginas muestreadas en las que debe repetirse un bloque
+LAYOUT_MIN_REPEAT_RATIO = 0.5
+# Tolerancias para considerar que dos bloques son "el mismo" encabezado/pie
+LAYOUT_POSITION_TOLERANCE = 0.02
+LAYOUT_SIMILARITY = 0.8
+LAYOUT_PADDING = 0.005
+
+# Plantilla por defecto cuando el documento es demasiado corto para detectar repeticiones
+# (equivale al recorte fijo del 10% superior e inferior)
+FALLBACK_LAYOUT = {"header": 0.10, "footer": 0.90, "source": "fallback"}
+
+# Números de página: con etiqueta ("pag. 12", "pagina 3 de 40") o sueltos al inicio o al final
+# del bloque ("12", "- 12 -", "12/40"); "Artículo 3.1" o "E.030" no son números de página
+_PAGE_NUMBER = r"\d{1,4}(?:\s*(?:/|de|of)\s*\d{1,4})?"
+_PAGE_NUMBER_RE = re.compile(
+    rf"\b(?:pag(?:ina)?|page|p)\.?\s*{_PAGE_NUMBER}\b"
+    rf"|^[\s\-–|]*{_PAGE_NUMBER}(?![\d.,])"
+    rf"|(?<![\w.,]){_PAGE_NUMBER}[\s\-–|]*$"
+)
+
+
+def _normalize_block_text(text: str) -> str:
+    """
+    Normaliza el texto de un bloque para comparar encabezados entre páginas
+    (minúsculas, sin tildes, números de página reemplazados por '#'; el resto de los números
+    se conserva para no confundir títulos de artículos distintos).
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"\s+", " ", text).strip()
+    return _PAGE_NUMBER_RE.sub("#", text)
+
+
+def _sample_pages(page_count: int, sample_size: int) -> List[int]:
+    """
+    Elige páginas repartidas uniformemente, omitiendo la portada si hay suficientes páginas.
+    """
+    first = 1 if page_count > 2 else 0
+    candidates = range(first, page_count)
+    if len(candidates) <= sample_size:
+        return list(candidates)
+    step = len(candidates) / sample_size
+    return [candidates[int(i * step)] for i in range(sample_size)]
+
+
+def layout_fingerprint(doc: fitz.Document) -> Optional[str]:
+    """
+    Huella de editor/serie del documento: autor y creador de la metadata más el tamaño de página.
+
+    Devuelve None si la metadata no identifica al editor (no se puede cachear la plantilla).
+    La huella sólo agrupa candidatos: la plantilla guarda el texto de sus bloques repetidos y
+    se valida contra el documento antes de usarla (ver matches_layout).
+    """
+    metadata = doc.metadata or {}
+    publisher = [(metadata.get(key) or "").strip().lower() for key in ("author", "creator")]
+    if not any(publisher) or len(doc) == 0:
+        return None
+    rect = doc[0].rect
+    producer = (metadata.get("producer") or "").strip().lower()
+    key = "|".join(publisher + [producer, f"{round(rect.width)}x{round(rect.height)}"])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _band_blocks(page: fitz.Page):
+    """
+    Bloques de texto de la franja superior/inferior de la página.
+
+    Yields:
+        tuple: (zona "header"/"footer", borde superior, borde inferior, texto normalizado),
+        con los bordes como fracción de la altura de la página.
+    """
+    height = page.rect.height or 1.0
+    for x0, y0, x1, y1, text, _, block_type in page.get_text("blocks"):
+        if block_type != 0:
+            continue
+        top, bottom = y0 / height, y1 / height
+        if bottom <= LAYOUT_SEARCH_BAND:
+            zone = "header"
+        elif top >= 1.0 - LAYOUT_SEARCH_BAND:
+            zone = "footer"
+        else:
+            continue
+        norm = _normalize_block_text(text)
+        if norm:
+            yield zone, top, bottom, norm
+
+
+def _same_block(top: float, text: str, other_top: float, other_text: str) -> bool:
+    return abs(top - other_top) <= LAYOUT_POSITION_TOLERANCE and \
+        SequenceMatcher(None, text, other_text).ratio() >= LAYOUT_SIMILARITY
+
+
+def detect_layout(doc: fitz.Document, sample_size: int = LAYOUT_SAMPLE_PAGES) -> Dict:
+    """
+    Detecta encabezados y pies de página buscando bloques de texto que se repiten en la misma
+    posición a lo largo de varias páginas.
+
+    Returns:
+        dict: Plantilla con las fracciones de altura `header` (borde inferior del encabezado,
+        0.0 si no hay) y `footer` (borde superior del pie, 1.0 si no hay), `source`
+        ("detected" si se encontró algún bloque repetido, "none" si no) y `blocks`, los
+        bloques repetidos (zona, posición y texto normalizado) con los que se valida la
+        plantilla al reutilizarla en otro documento.
+    """
+    sample = _sample_pages(len(doc), sample_size)
+    if len(sample) < 2:
+        return dict(FALLBACK_LAYOUT)
+
+    # Clusters de bloques similares por zona: [y0, y1, texto, {páginas}]; por página, los
+    # clusters de sus bloques ordenados desde el borde
+    clusters: Dict[str, List[list]] = {"header": [], "footer": []}
+    stacks: Dict[str, List[List[list]]] = {"header": [], "footer": []}
+    for page_num in sample:
+        page_blocks = list(_band_blocks(doc[page_num]))
+        for zone, from_edge in (("header", lambda b: b[1]), ("footer", lambda b: -b[2])):
+            stack = []
+            for _, top, bottom, norm in sorted((b for b in page_blocks if b[0] == zone), key=from_edge):
+                for cluster in clusters[zone]:
+                    if _same_block(cluster[0], cluster[2], top, norm):
+                        cluster[1] = max(cluster[1], bottom)
+                        cluster[0] = min(cluster[0], top)
+                        cluster[3].add(page_num)
+                        break
+                else:
+                    cluster = [top, bottom, norm, {page_num}]
+                    clusters[zone].append(cluster)
+                stack.append(cluster)
+            stacks[zone].append(stack)
+
+    # Un bloque repetido sólo es encabezado/pie en las páginas donde está en el borde o
+    # debajo de otros bloques repetidos (un título de artículo en la franja no lo es)
+    min_pages = max(2, int(len(sample) * LAYOUT_MIN_REPEAT_RATIO + 0.5))
+    edge_pages: Dict[int, int] = {}
+    for zone in ("header", "footer"):
+        for stack in stacks[zone]:
+            for cluster in stack:
+                if len(cluster[3]) < min_pages:
+                    break
+                edge_pages[id(cluster)] = edge_pages.get(id(cluster), 0) + 1
+    headers = [c for c in clusters["header"] if edge_pages.get(id(c), 0) >= min_pages]
+    footers = [c for c in clusters["footer"] if edge_pages.get(id(c), 0) >= min_pages]
+
+    return {
+        "header": min(1.0, max(c[1] for c in headers) + LAYOUT_PADDING) if headers else 0.0,
+        "footer": max(0.0, min(c[0] for c in footers) - LAYOUT_PADDING) if footers else 1.0,
+        "source": "detected" if headers or footers else "none",
+        "blocks": [
+            {"zone": zone, "top": round(c[0], 4), "text": c[2]}
+            for zone, found in (("header", headers), ("footer", footers)) for c in found
+        ],
+    }
+
+
+def matches_layout(doc: fitz.Document, template: Dict) -> bool:
+    """
+    Verifica una plantilla cacheada contra una página de muestra del documento: al menos
+    uno de sus bloques repetidos debe aparecer en la misma zona y posición con texto similar.
+
+    La huella sólo identifica al editor por metadata, que suele ser genérica (p.ej. el
+    programa que generó el PDF); esta comprobación evita aplicar la plantilla de otra serie.
+    """
+    blocks = template.get("blocks")
+    sample = _sample_pages(len(doc), LAYOUT_SAMPLE_PAGES)
+    if not blocks or not sample:
+        return False
+    page_blocks = list(_band_blocks(doc[sample[len(sample) // 2]]))
+    return any(
+        zone == block["zone"] and _same_block(block["top"], block["text"], top, norm)
+        for block in blocks for zone, top, _, norm in page_blocks
+    )
+
+
+class LayoutTemplateCache:
+    """
+    Caché de plantillas de diagramación por huella de editor/serie.
+
+    Mantiene las plantillas en memoria y, si se indica un backend (p.ej. DocumentRegistry),
+    las persiste para que sobrevivan reinicios.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._templates: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint: str) -> Optional[Dict]:
+        with self._lock:
+            template = self._templates.get(fingerprint)
+        if template is None and self.backend is not None:
+            template = self.backend.get_layout_template(fingerprint)
+            if template is not None:
+                with self._lock:
+                    self._templates[fingerprint] = template
+        return template
+
+    def put(self, fingerprint: str, template: Dict):
+        with self._lock:
+            self._templates[fingerprint] = template
+        if self.backend is not None:
+            self.backend.save_layout_template(fingerprint, template)
+
+
+def resolve_layout(doc: fitz.Document, cache: Optional[LayoutTemplateCache] = None) -> Dict:
+    """
+    Obtiene la plantilla de encabezado/pie del documento, usando la caché por serie si existe.
+
+    Una plantilla cacheada sólo se usa si sus bloques repetidos aparecen en una página de
+    muestra del documento, y sólo se cachean plantillas con algún encabezado o pie detectado.
+    """
+    fingerprint = layout_fingerprint(doc) if cache is not None else None
+    if fingerprint:
+        template = cache.get(fingerprint)
+        if template is not None:
+            if matches_layout(doc, template):
+                print(f"DEBUG: Layout template cache hit for {fingerprint}")
+                return template
+            print(f"DEBUG: Layout template {fingerprint} does not match document, detecting")
+
+    template = detect_layout(doc)
+    print(f"DEBUG: Detected layout header={template['header']:.3f} footer={template['footer']:.3f} "
+          f"({template['source']})")
+    if fingerprint and template["source"] == "detected":
+        cache.put(fingerprint, template)
+    return template
@@ -1,79 +1,259 @@
 import fitz  # PyMuPDF
-import io
+import os
+import shutil
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
-def clean_document(file_path: str) -> bytes:
+from app.services.data_core.librarian.density import PageDensityCache, classify_page, PAGE_EMPTY, DENSITY_MODE
+from app.services.data_core.librarian.layout import LayoutTemplateCache, resolve_layout
+
+# Paralelismo del sanitizador (1 = modo serial en el proceso actual)
+SANITIZER_WORKERS = int(os.getenv("SANITIZER_WORKERS", "1"))
+# Tamaño fijo de los rangos de páginas. Es independiente del número de workers para que
+# la salida sea idéntica byte a byte tanto en modo serial como en paralelo.
+SANITIZER_CHUNK_PAGES = int(os.getenv("SANITIZER_CHUNK_PAGES", "50"))
+# Opciones de guardado (garbage: 0-4 según PyMuPDF, deflate: comprimir streams)
+SANITIZER_GARBAGE = int(os.getenv("SANITIZER_GARBAGE", "1"))
+SANITIZER_DEFLATE = os.getenv("SANITIZER_DEFLATE", "1") == "1"
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
     """
-    Limpia un documento PDF eliminando encabezados y pies de página basados en un margen porcentual (10%).
-    También descarta páginas con baja densidad de contenido (separadores).
-    
+    Devuelve un pool de procesos persistente (se recrea sólo si cambia el número de workers).
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # 'spawn' evita heredar hilos/locks del servidor al hacer fork
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+def _page_ranges(page_count: int, chunk_pages: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + chunk_pages, page_count)) for start in range(0, page_count, chunk_pages)]
+
+
+def _clean_page_range(file_path: str, start: int, end: int, part_path: str, layout: Dict,
+                      garbage: int = SANITIZER_GARBAGE, deflate: bool = SANITIZER_DEFLATE,
+                      decisions: Optional[str] = None,
+                      density_mode: str = DENSITY_MODE) -> Tuple[List[int], str]:
+    """
+    Analiza y redacta las páginas [start, end) del documento y guarda el PDF parcial en part_path.
+
     Args:
-        file_path: Ruta absoluta al archivo PDF.
-        
+        layout: Plantilla de encabezado/pie (fracciones de altura `header` y `footer`).
+        decisions: Decisiones de densidad ya conocidas para el rango (ver librarian.density);
+            si se indican, no se analiza ninguna página.
+        density_mode: Modo del análisis de densidad ("fast" o "full").
+
     Returns:
-        bytes: El contenido del PDF limpio en memoria.
+        tuple: (números de página originales 0-based conservados, decisiones del rango). Si no
+        se conserva ninguna página no se escribe archivo.
     """
+    doc = fitz.open(file_path)
+    clean_doc = fitz.open()
+    kept_pages = []
+    range_decisions = []
     try:
-        doc = fitz.open(file_path)
-        
-        # Crear un nuevo documento para la salida
-        clean_doc = fitz.open()
-        
-        print(f"DEBUG: Processing PDF with {len(doc)} pages")
-
-        for page_num in range(len(doc)):
+        for page_num in range(start, end):
             if page_num % 10 == 0:
                 print(f"DEBUG: Processing page {page_num}")
-                
+
             page = doc[page_num]
             rect = page.rect
             width = rect.width
             height = rect.height
-            
-            # Definir Safe Zone (10% de margen superior e inferior)
-            margin_top = height * 0.10
-            margin_bottom = height * 0.10
-            
+
+            # Definir Safe Zone según la plantilla detectada
+            margin_top = height * layout["header"]
+            margin_bottom = height * (1.0 - layout["footer"])
+
             # Definir el rectángulo de recorte (Safe Zone)
             clip_rect = fitz.Rect(0, margin_top, width, height - margin_bottom)
-            
-            # Extraer texto solo de la Safe Zone para análisis de densidad
-            text_in_safe_zone = page.get_text("text", clip=clip_rect)
-            
-            # Lógica de descarte de páginas vacías o separadores
-            char_count = len(text_in_safe_zone.strip())
-            image_list = page.get_images()
-            
-            if char_count < 100 and not image_list:
+
+            # Lógica de descarte de páginas vacías o separadores (densidad de la Safe Zone)
+            if decisions is not None:
+                decision = decisions[page_num - start]
+            else:
+                decision = classify_page(page, clip_rect, density_mode)
+            range_decisions.append(decision)
+
+            if decision == PAGE_EMPTY:
                 continue
-                
+
             # Si la página es válida, la copiamos al nuevo documento.
             clean_doc.insert_pdf(doc, from_page=page_num, to_page=page_num)
-            
-            # Aplicar Redactions
+            kept_pages.append(page_num)
+
+            # Aplicar Redactions (sólo sobre las franjas realmente detectadas)
+            if margin_top <= 0 and margin_bottom <= 0:
+                continue
             try:
                 new_page = clean_doc[-1] # La última página insertada
-                
+
                 # Redactar Header (Parte superior)
-                header_rect = fitz.Rect(0, 0, width, margin_top)
-                new_page.add_redact_annot(header_rect, fill=(1, 1, 1)) # Blanco
-                
+                if margin_top > 0:
+                    header_rect = fitz.Rect(0, 0, width, margin_top)
+                    new_page.add_redact_annot(header_rect, fill=(1, 1, 1)) # Blanco
+
                 # Redactar Footer (Parte inferior)
-                footer_rect = fitz.Rect(0, height - margin_bottom, width, height)
-                new_page.add_redact_annot(footer_rect, fill=(1, 1, 1)) # Blanco
-                
+                if margin_bottom > 0:
+                    footer_rect = fitz.Rect(0, height - margin_bottom, width, height)
+                    new_page.add_redact_annot(footer_rect, fill=(1, 1, 1)) # Blanco
+
                 # Aplicar las redacciones
                 new_page.apply_redactions()
             except Exception as e:
                 print(f"WARN: Error applying redaction on page {page_num}: {e}")
 
-        # Guardar en buffer
-        output_buffer = io.BytesIO()
-        clean_doc.save(output_buffer)
+        if kept_pages:
+            clean_doc.save(part_path, garbage=garbage, deflate=deflate, no_new_id=True)
+        return kept_pages, "".join(range_decisions)
+    finally:
         clean_doc.close()
         doc.close()
-        
-        return output_buffer.getvalue()
+
+
+def clean_document_to_path(file_path: str, output_path, workers: Optional[int] = None,
+                           garbage: int = SANITIZER_GARBAGE, deflate: bool = SANITIZER_DEFLATE,
+                           incremental: bool = True,
+                           layout_cache: Optional[LayoutTemplateCache] = None,
+                           content_hash: Optional[str] = None,
+                           density_cache: Optional[PageDensityCache] = None,
+                           density_mode: str = DENSITY_MODE) -> List[int]:
+    """
+    Limpia un documento PDF eliminando encabezados y pies de página detectados por repetición
+    entre páginas (ver librarian.layout). También descarta páginas con baja densidad de contenido
+    (separadores) con un pre-escaneo barato (ver librarian.density).
+
+    El documento se procesa en rangos de SANITIZER_CHUNK_PAGES páginas que se escriben como PDFs
+    parciales en disco. Con más de un worker los rangos se procesan en un pool de procesos; el
+    resultado es idéntico al del modo serial. Los parciales se unen en orden directamente sobre
+    output_path, sin mantener el documento completo en memoria.
+
+    Args:
+        file_path: Ruta absoluta al archivo PDF.
+        output_path: Ruta donde se guarda el PDF limpio.
+        workers: Número de procesos a usar (por defecto SANITIZER_WORKERS).
+        garbage: Nivel de recolección de objetos no usados al guardar (0-4).
+        deflate: Comprimir streams al guardar.
+        incremental: Unir los rangos sobre el primer parcial con guardado incremental en lugar
+            de reescribir todo el documento (ignora garbage en la unión).
+        layout_cache: Caché de plantillas por editor/serie; si la huella del documento ya es
+            conocida se omite la detección.
+        content_hash: SHA-256 del archivo; junto con `density_cache` permite reutilizar las
+            decisiones por página de una sanitización previa del mismo contenido.
+        density_cache: Caché de decisiones de densidad por página.
+        density_mode: "fast" (pre-escaneo) o "full" (extracción completa del texto).
+
+    Returns:
+        list: Números de página originales (0-based) conservados en el documento limpio.
+    """
+    try:
+        workers = workers or SANITIZER_WORKERS
+        output_path = Path(output_path)
+
+        doc = fitz.open(file_path)
+        page_count = len(doc)
+        layout = resolve_layout(doc, layout_cache)
+        doc.close()
+
+        print(f"DEBUG: Processing PDF with {page_count} pages")
+
+        ranges = _page_ranges(page_count, SANITIZER_CHUNK_PAGES)
+
+        use_density_cache = density_cache is not None and content_hash is not None
+        decisions = density_cache.get(content_hash, layout, density_mode) if use_density_cache else None
+        if decisions is not None and len(decisions) != page_count:
+            decisions = None
+        if decisions is not None:
+            print(f"DEBUG: Page density cache hit for {content_hash[:12]}")
+        range_decisions = [decisions[start:end] if decisions else None for start, end in ranges]
+
+        # Los parciales se escriben junto al destino para que el renombrado final sea atómico
+        with tempfile.TemporaryDirectory(dir=output_path.parent, prefix=".sanitize-") as tmp_dir:
+            part_paths = [os.path.join(tmp_dir, f"part-{i:05d}.pdf") for i in range(len(ranges))]
+            starts = [start for start, _ in ranges]
+            ends = [end for _, end in ranges]
+
+            if workers > 1 and len(ranges) > 1:
+                print(f"DEBUG: Sanitizing {len(ranges)} page ranges with {workers} workers")
+                results = list(_get_pool(workers).map(
+                    _clean_page_range, repeat(file_path), starts, ends, part_paths,
+                    repeat(layout), repeat(garbage), repeat(deflate), range_decisions, repeat(density_mode)
+                ))
+            else:
+                results = [
+                    _clean_page_range(file_path, start, end, part_path, layout, garbage, deflate,
+                                      range_decision, density_mode)
+                    for start, end, part_path, range_decision in zip(starts, ends, part_paths, range_decisions)
+                ]
+            kept_per_range = [kept for kept, _ in results]
+            if use_density_cache and decisions is None:
+                density_cache.put(content_hash, layout, "".join(d for _, d in results), density_mode)
+
+            parts = [p for p, kept in zip(part_paths, kept_per_range) if kept]
+            if not parts:
+                raise ValueError("El documento no contiene páginas con contenido")
+
+            if incremental:
+                # Unir los rangos sobre el primer parcial y anexar sólo los cambios
+                base_doc = fitz.open(parts[0])
+                for part in parts[1:]:
+                    part_doc = fitz.open(part)
+                    base_doc.insert_pdf(part_doc)
+                    part_doc.close()
+                if len(parts) > 1:
+                    base_doc.save(parts[0], incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP, no_new_id=True)
+                base_doc.close()
+                shutil.move(parts[0], output_path)
+            else:
+                clean_doc = fitz.open()
+                for part in parts:
+                    part_doc = fitz.open(part)
+                    clean_doc.insert_pdf(part_doc)
+                    part_doc.close()
+                clean_doc.save(output_path, garbage=garbage, deflate=deflate, no_new_id=True)
+                clean_doc.close()
+
+        return [page for kept in kept_per_range for page in kept]
 
     except Exception as e:
         print(f"ERROR: Failed to clean document: {e}")
         raise e
+
+
+def clean_document(file_path: str, workers: Optional[int] = None,
+                   layout_cache: Optional[LayoutTemplateCache] = None,
+                   content_hash: Optional[str] = None,
+                   density_cache: Optional[PageDensityCache] = None) -> bytes:
+    """
+    Variante de clean_document_to_path que devuelve el PDF limpio en memoria.
+
+    Args:
+        file_path: Ruta absoluta al archivo PDF.
+        workers: Número de procesos a usar (por defecto SANITIZER_WORKERS).
+        layout_cache: Caché de plantillas de encabezado/pie por editor/serie.
+        content_hash: SHA-256 del archivo (clave de `density_cache`).
+        density_cache: Caché de decisiones de densidad por página.
+
+    Returns:
+        bytes: El contenido del PDF limpio en memoria.
+    """
+    with tempfile.TemporaryDirectory(prefix="sanitize-") as tmp_dir:
+        output_path = Path(tmp_dir) / "clean.pdf"
+        clean_document_to_path(file_path, output_path, workers=workers, layout_cache=layout_cache,
+                               content_hash=content_hash, density_cache=density_cache)
+        return output_path.read_bytes()
@@ -1,94 +1,312 @@
 import os
+import re
 import json
+import threading
 import fitz  # PyMuPDF
-from typing import Optional
-import google.generativeai as genai
-from PIL import Image
-import io
+from collections import Counter
+from datetime import date
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
 
 # Importar el modelo para validación (aunque el output del LLM es JSON, lo parseamos a este modelo)
-from src.data_core.models.schema import DocumentMetadata
+from app.services.data_core.models.schema import DocumentMetadata
+from app.services.data_core.clients import get_model, TAGGER_MODEL
 
-def extract_first_page_as_image(file_path: str) -> Image.Image:
+# Páginas iniciales cuyo texto se analiza con heurísticas
+TAGGER_TEXT_PAGES = int(os.getenv("TAGGER_TEXT_PAGES", "2"))
+# Confianza mínima de las heurísticas para no consultar al modelo
+TAGGER_MIN_CONFIDENCE = float(os.getenv("TAGGER_MIN_CONFIDENCE", "0.75"))
+# Render reducido de la portada para el modelo (escala de grises)
+TAGGER_RENDER_DPI = int(os.getenv("TAGGER_RENDER_DPI", "60"))
+TAGGER_RENDER_MAX_PX = int(os.getenv("TAGGER_RENDER_MAX_PX", "768"))
+
+CATEGORIES = ("ESTRUCTURAS", "ARQUITECTURA", "SANITARIAS", "ELECTRICAS", "NORMATIVA", "GESTION")
+
+# Prefijos de normas del RNE -> categoría técnica
+RNE_PREFIX_CATEGORY = {
+    "G": "GESTION", "GE": "GESTION", "TH": "ARQUITECTURA", "A": "ARQUITECTURA",
+    "E": "ESTRUCTURAS", "CE": "ESTRUCTURAS", "OS": "SANITARIAS", "IS": "SANITARIAS",
+    "EC": "ELECTRICAS", "EM": "ELECTRICAS",
+}
+
+_RNE_RE = re.compile(r"\b(GE|TH|CE|OS|IS|EC|EM|G|A|E)\s?\.\s?(\d{3})\b", re.IGNORECASE)
+_NTP_RE = re.compile(r"\bNTP\s+(\d{3}\.\d{3}(?::\d{4})?)", re.IGNORECASE)
+_ISO_RE = re.compile(r"\bISO\s*(\d{4,5})(?:-\d+)?\b", re.IGNORECASE)
+_LEY_RE = re.compile(r"\bLEY\s+N?\s*[°º.]?\s*(\d{4,5})\b", re.IGNORECASE)
+_DECREE_RE = re.compile(
+    r"\b(D\.?\s?S\.?|R\.?\s?M\.?|DECRETO\s+SUPREMO|RESOLUCI[OÓ]N\s+MINISTERIAL)\s+N?\s*[°º.]?\s*"
+    r"(\d{1,4}-(\d{4})(?:-[A-Z]+)?)",
+    re.IGNORECASE,
+)
+_YEAR_RE = re.compile(r"(?<![\d.\-])(19[5-9]\d|20\d{2})(?![\d.])")
+_SPEC_RE = re.compile(r"\b(ficha\s+t[eé]cnica|hoja\s+t[eé]cnica|cat[aá]logo|data\s*sheet)\b", re.IGNORECASE)
+_METHODOLOGY_RE = re.compile(r"\b(BEP|plan\s+de\s+ejecuci[oó]n\s+BIM|gu[ií]a\s+nacional\s+BIM|ISO\s*19650)\b", re.IGNORECASE)
+
+
+class TagCache:
     """
-    Convierte la primera página de un PDF a una imagen PIL.
+    Caché de metadatos de etiquetado por hash de contenido.
+
+    Mantiene los resultados en memoria y, si se indica un backend (p.ej. DocumentRegistry),
+    los persiste para que sobrevivan reinicios.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._tags: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, content_hash: str) -> Optional[Dict]:
+        with self._lock:
+            tags = self._tags.get(content_hash)
+        if tags is None and self.backend is not None:
+            tags = self.backend.get_cached_tags(content_hash)
+            if tags is not None:
+                with self._lock:
+                    self._tags[content_hash] = tags
+        return tags
+
+    def put(self, content_hash: str, tags: Dict):
+        with self._lock:
+            self._tags[content_hash] = tags
+        if self.backend is not None:
+            self.backend.save_cached_tags(content_hash, tags)
+
+
+def _find_codes(text: str) -> List[Tuple[str, str, str]]:
+    """
+    Códigos de documento en un texto como (código, categoría, store).
+    """
+    found = []
+    for prefix, number in _RNE_RE.findall(text):
+        prefix = prefix.upper()
+        found.append((f"{prefix}.{number}", RNE_PREFIX_CATEGORY[prefix], "B"))
+    for number in _NTP_RE.findall(text):
+        found.append((f"NTP {number}", "NORMATIVA", "B"))
+    for number in _LEY_RE.findall(text):
+        found.append((f"Ley {number}", "NORMATIVA", "B"))
+    for kind, number, _ in _DECREE_RE.findall(text):
+        abbr = "DS" if kind.upper().replace(".", "").replace(" ", "").startswith(("DS", "DECRETO")) else "RM"
+        found.append((f"{abbr} {number.upper()}", "NORMATIVA", "B"))
+    for number in _ISO_RE.findall(text):
+        found.append((f"ISO {number}", "GESTION", "A"))
+    return found
+
+
+def _title_from_page(page: fitz.Page) -> Optional[str]:
+    """
+    Título de portada: las líneas con la fuente más grande de la página.
+    """
+    lines = []
+    for block in page.get_text("dict").get("blocks", []):
+        for line in block.get("lines", []):
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if text:
+                lines.append((max(span["size"] for span in line["spans"]), text))
+    if not lines:
+        return None
+    largest = max(size for size, _ in lines)
+    if all(size >= largest - 0.5 for size, _ in lines):
+        # Sin tipografía destacada: la primera línea hace de título
+        return lines[0][1][:200]
+    title_lines = []
+    for size, text in lines:
+        if size >= largest - 0.5:
+            title_lines.append(text)
+        elif title_lines:
+            break
+    return " ".join(title_lines[:3])[:200] or None
+
+
+def extract_heuristic_tags(doc: fitz.Document) -> Tuple[Dict[str, Any], float]:
+    """
+    Primer nivel: metadatos a partir de la capa de texto y de la metadata/XMP del PDF.
+
+    Returns:
+        tuple: (campos encontrados, confianza entre 0 y 1).
+    """
+    meta = doc.metadata or {}
+    meta_text = " ".join(filter(None, [meta.get("title"), meta.get("subject"), meta.get("keywords")]))
+    xmp = doc.get_xml_metadata() or ""
+    pages_text = [doc[i].get_text() for i in range(min(TAGGER_TEXT_PAGES, doc.page_count))]
+    cover = pages_text[0] if pages_text else ""
+    # Bloque de título de la portada: un código citado en el cuerpo no identifica al documento
+    title_block = _title_from_page(doc[0]) if doc.page_count else None
+
+    # Códigos ponderados por dónde aparecen: metadata > XMP y bloque de título
+    scores: Counter = Counter()
+    info: Dict[str, Tuple[str, str]] = {}
+    for weight, text in ((3, meta_text), (2, re.sub(r"<[^>]+>", " ", xmp)), (2, title_block or "")):
+        for code, category, store in _find_codes(text):
+            scores[code] += weight
+            info[code] = (category, store)
+
+    # Señales de ficha técnica / metodología: fuertes en metadata o título, débiles en el cuerpo
+    prominent_text = meta_text + "\n" + (title_block or "")
+    body_text = "\n".join(pages_text)
+    signal = None
+    if _METHODOLOGY_RE.search(prominent_text):
+        signal = ("A", "GESTION", True)
+    elif _SPEC_RE.search(prominent_text):
+        signal = ("C", None, True)
+    elif _METHODOLOGY_RE.search(body_text):
+        signal = ("A", "GESTION", False)
+    elif _SPEC_RE.search(body_text):
+        signal = ("C", None, False)
+
+    tags: Dict[str, Any] = {}
+    confidence = 0.0
+    if scores:
+        code = max(scores, key=lambda c: (scores[c], -len(c)))
+        tags["code"] = code
+        tags["category"], tags["store_type"] = info[code]
+        if signal is None or signal[0] == tags["store_type"]:
+            confidence += 0.7
+        elif signal[2]:
+            # Ficha técnica o BEP que cita una norma en su título: manda la señal y decide el modelo
+            tags["store_type"] = signal[0]
+            if signal[1]:
+                tags["category"] = signal[1]
+            else:
+                tags.pop("category")
+            confidence += 0.4
+        else:
+            confidence += 0.5
+    elif signal is not None:
+        tags["store_type"] = signal[0]
+        if signal[1]:
+            tags["category"] = signal[1]
+        confidence += 0.5 if signal[2] else (0.3 if signal[1] else 0.1)
+
+    # Año: el de un decreto/resolución, o el más frecuente de la portada, o la fecha de creación
+    current_year = date.today().year
+    decree_years = [int(y) for _, _, y in _DECREE_RE.findall(cover)]
+    years = [int(y) for y in _YEAR_RE.findall(cover) if int(y) <= current_year]
+    creation = re.match(r"D:(\d{4})", meta.get("creationDate") or "")
+    if decree_years:
+        tags["year"] = decree_years[0]
+    elif years:
+        counts = Counter(years)
+        tags["year"] = max(counts, key=lambda y: (counts[y], y))
+    elif creation:
+        tags["year"] = int(creation.group(1))
+    if "year" in tags:
+        confidence += 0.15
+
+    title = (meta.get("title") or "").strip()
+    if len(title) <= 8 or title.lower().endswith(".pdf") or title.upper() == tags.get("code"):
+        title = title_block
+    if title:
+        tags["title"] = title
+        confidence += 0.15
+
+    return tags, round(min(confidence, 1.0), 2)
+
+
+def render_cover(doc: fitz.Document, dpi: int = TAGGER_RENDER_DPI, max_px: int = TAGGER_RENDER_MAX_PX) -> bytes:
+    """
+    Portada en escala de grises y resolución reducida (PNG), para minimizar tokens de imagen.
     """
-    doc = fitz.open(file_path)
     page = doc[0]
-    pix = page.get_pixmap()
-    img_data = pix.tobytes("png")
-    return Image.open(io.BytesIO(img_data))
-
-def tag_document(file_path: str) -> Optional[DocumentMetadata]:
-    """
-    Usa Gemini 1.5 Flash para extraer metadatos de la primera página del documento.
-    """
-    
-    # Configuración de API Key (debe estar en variables de entorno)
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        # En modo desarrollo sin API Key, retornamos un mock o lanzamos error
-        print("WARNING: GOOGLE_API_KEY not found. Returning mock metadata.")
-        return DocumentMetadata(
-            category="GESTION",
-            code="MOCK-001",
-            title="Documento Sin Procesar (Mock)",
-            year=2024,
-            store_type="D"
-        )
-
-    genai.configure(api_key=api_key)
-    
-    # Modelo Flash para baja latencia y costo
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    
-    image = extract_first_page_as_image(file_path)
-    
-    prompt = """
-    Actúa como un Bibliotecario BIM experto. Analiza la imagen de la portada de este documento técnico.
-    Extrae el Código de Norma, Categoría Técnica y Año del documento.
-    
-    Las categorías permitidas son: ESTRUCTURAS, ARQUITECTURA, SANITARIAS, ELECTRICAS, NORMATIVA, GESTION.
-    Los tipos de Store son: 
-    - A: Metodología (Guías, BEP, ISO)
-    - B: Normativa (RNE, Leyes, Reglamentos)
-    - C: Specs (Fichas Técnicas, Catálogos)
-    - D: Contexto Proyecto (Memorias, Estudios de Suelos)
-    
-    Devuelve exclusivamente un JSON con la siguiente estructura:
-    {
-        "category": "...",
-        "code": "...",
-        "title": "...",
-        "year": 2024,
-        "store_type": "..."
-    }
-    
+    scale = dpi / 72.0
+    longest = max(page.rect.width, page.rect.height) * scale
+    if longest > max_px:
+        scale *= max_px / longest
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csGRAY, alpha=False)
+    return pix.tobytes("png")
+
+
+def _tag_with_llm(image_png: bytes, hints: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Segundo nivel: Gemini Flash sobre la portada reducida, con las pistas ya encontradas.
+    """
+    # Modelo Flash para baja latencia y costo (instancia compartida del proceso)
+    model = get_model(TAGGER_MODEL)
+
+    prompt = f"""
+    Actúa como un Bibliotecario BIM experto. Analiza la portada de este documento técnico de construcción.
+    Pistas extraídas del texto (pueden estar incompletas): {json.dumps(hints, ensure_ascii=False)}
+    Devuelve exclusivamente un JSON con:
+    - category: (ESTRUCTURAS, ARQUITECTURA, SANITARIAS, ELECTRICAS, NORMATIVA, GESTION)
+    - code: Código del documento (ej. E.030)
+    - title: Título principal
+    - year: Año de publicación (int)
+    - store_type: Store destino (A=Metodología, B=Normativa, C=Specs, D=Contexto Proyecto)
     Si no estás seguro de la categoría, usa GESTION.
-    Si no encuentras el año, estima basado en el contexto o usa el año actual.
     """
-    
+
+    response = model.generate_content([prompt, {"mime_type": "image/png", "data": image_png}])
+    text = response.text.replace("```json", "").replace("```", "").strip()
+    return json.loads(text)
+
+
+def _finalize(tags: Dict[str, Any], file_path: Path) -> Dict[str, Any]:
+    """
+    Completa campos faltantes con valores seguros y valida contra DocumentMetadata.
+    """
+    category = str(tags.get("category") or "").upper()
+    store_type = str(tags.get("store_type") or "").upper()
     try:
-        response = model.generate_content([prompt, image])
-        json_str = response.text.strip()
-        
-        # Limpieza básica por si el modelo devuelve bloques de código markdown
-        if json_str.startswith("```json"):
-            json_str = json_str[7:]
-        if json_str.endswith("```"):
-            json_str = json_str[:-3]
-            
-        data = json.loads(json_str)
-        
-        return DocumentMetadata(**data)
-        
-    except Exception as e:
-        print(f"Error tagging document: {e}")
-        # Fallback seguro
-        return DocumentMetadata(
-            category="GESTION",
-            code="UNKNOWN",
-            title=os.path.basename(file_path),
-            year=2024,
-            store_type="D"
-        )
+        year = int(tags.get("year"))
+    except (TypeError, ValueError):
+        year = date.today().year
+    metadata = DocumentMetadata(
+        category=category if category in CATEGORIES else "GESTION",
+        code=str(tags.get("code") or "UNKNOWN"),
+        title=str(tags.get("title") or file_path.stem),
+        year=year,
+        store_type=store_type if store_type in ("A", "B", "C", "D") else "D",
+    )
+    return metadata.model_dump()
+
+
+def tag_document(file_path, content_hash: Optional[str] = None, cache: Optional[TagCache] = None,
+                 use_llm: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    Etiquetado escalonado de un documento.
+
+    1. Caché por hash de contenido.
+    2. Heurísticas sobre el texto y la metadata (códigos E.030, IS.010, NTP..., años, título).
+    3. Sólo si la confianza es baja, Gemini Flash con un render reducido en grises de la portada.
+
+    Args:
+        file_path: PDF a etiquetar (preferentemente el original, que conserva la metadata).
+        content_hash: Hash del contenido, clave del caché.
+        cache: Caché de etiquetas; sin caché siempre se recalcula.
+        use_llm: Permite el nivel 3 (por defecto, si hay GOOGLE_API_KEY).
+
+    Returns:
+        dict: Campos de DocumentMetadata más `tag_source` ("text", "llm" o "default")
+        y `tag_confidence`.
+    """
+    file_path = Path(file_path)
+    if cache is not None and content_hash:
+        cached = cache.get(content_hash)
+        if cached is not None:
+            print(f"DEBUG: Tag cache hit for {content_hash[:12]}")
+            return cached
+
+    if use_llm is None:
+        use_llm = bool(os.getenv("GOOGLE_API_KEY"))
+
+    doc = fitz.open(file_path)
+    try:
+        tags, confidence = extract_heuristic_tags(doc)
+        source = "text" if confidence >= TAGGER_MIN_CONFIDENCE else "default"
+        if source == "default" and use_llm and doc.page_count:
+            print(f"DEBUG: Heuristic tagging confidence {confidence} below threshold, asking the model")
+            try:
+                llm_tags = _tag_with_llm(render_cover(doc), tags)
+                # Los campos encontrados por regex son exactos; el modelo completa el resto
+                tags = {**llm_tags, **tags}
+                source = "llm"
+            except Exception as e:
+                print(f"Error tagging document: {e}")
+    finally:
+        doc.close()
+
+    result = {**_finalize(tags, file_path), "tag_source": source, "tag_confidence": confidence}
+    # Los valores por defecto no se cachean: con API Key un reintento puede mejorarlos
+    if cache is not None and content_hash and source != "default":
+        cache.put(content_hash, result)
+    return result
@@ -0,0 +1,222 @@
+import os
+import time
+import random
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, Optional
+from uuid import uuid4
+
+from app.services.data_core.clients import genai_module
+
+# Subidas simultáneas a Gemini (cupo global del proceso)
+GEMINI_UPLOAD_CONCURRENCY = int(os.getenv("GEMINI_UPLOAD_CONCURRENCY", "16"))
+# Reintentos ante fallos transitorios (red, 429, 5xx)
+GEMINI_UPLOAD_RETRIES = int(os.getenv("GEMINI_UPLOAD_RETRIES", "4"))
+# Tiempo máximo total por archivo (subida + procesamiento), en segundos
+GEMINI_UPLOAD_TIMEOUT = float(os.getenv("GEMINI_UPLOAD_TIMEOUT", "600"))
+# Backoff exponencial (segundos) para reintentos y para el sondeo de estado
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.25"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "8"))
+
+_TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+_TRANSIENT_ERROR_NAMES = {
+    "ServiceUnavailable", "TooManyRequests", "ResourceExhausted", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "BadGateway",
+}
+
+
+class TransientUploadError(Exception):
+    """
+    Fallo recuperable del Files API (se reintenta).
+    """
+
+
+class UploadFailedError(Exception):
+    """
+    El archivo terminó en un estado distinto de ACTIVE, o se agotaron los reintentos.
+    """
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Fallos que vale la pena reintentar: red, timeouts, 429 y 5xx del API.
+    """
+    if isinstance(error, (TransientUploadError, ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    if type(error).__name__ in _TRANSIENT_ERROR_NAMES:
+        return True
+    code = getattr(error, "code", None)
+    code = getattr(code, "value", code)
+    return isinstance(code, int) and code in _TRANSIENT_STATUS_CODES
+
+
+def _file_info(file) -> Dict[str, Any]:
+    return {"name": file.name, "uri": file.uri, "state": file.state.name}
+
+
+class GenaiFilesAPI:
+    """
+    Files API de Gemini (google.generativeai). Las llamadas del SDK son bloqueantes, así
+    que se ejecutan en un pool propio; las esperas entre sondeos no ocupan hilos.
+    """
+
+    def __init__(self, max_workers: int = GEMINI_UPLOAD_CONCURRENCY):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini-files")
+
+    async def upload(self, file_path: Path) -> Dict[str, Any]:
+        genai = genai_module()
+        loop = asyncio.get_running_loop()
+        file = await loop.run_in_executor(self._executor, lambda: genai.upload_file(path=file_path))
+        return _file_info(file)
+
+    async def get(self, name: str) -> Dict[str, Any]:
+        genai = genai_module()
+        loop = asyncio.get_running_loop()
+        file = await loop.run_in_executor(self._executor, genai.get_file, name)
+        return _file_info(file)
+
+
+class FakeFilesAPI:
+    """
+    Sustituto local del Files API, para modo sin API Key y pruebas de carga.
+
+    Simula la latencia de subida, el tiempo en PROCESSING y fallos transitorios o
+    definitivos, sin red ni hilos.
+
+    Args:
+        upload_latency: Segundos que tarda cada subida.
+        processing_time: Segundos que un archivo permanece en PROCESSING.
+        transient_failures: Cuántas llamadas (subida o consulta) fallan con error transitorio
+            antes de empezar a responder.
+        fail_state: Si se indica (p.ej. "FAILED"), los archivos terminan en ese estado.
+    """
+
+    def __init__(self, upload_latency: float = 0.0, processing_time: float = 0.0,
+                 transient_failures: int = 0, fail_state: Optional[str] = None):
+        self.upload_latency = upload_latency
+        self.processing_time = processing_time
+        self.transient_failures = transient_failures
+        self.fail_state = fail_state
+        self.calls = {"upload": 0, "get": 0}
+        self._files: Dict[str, Dict[str, Any]] = {}
+
+    def _maybe_fail(self):
+        if self.transient_failures > 0:
+            self.transient_failures -= 1
+            raise TransientUploadError("503 Service Unavailable (fake)")
+
+    def _info(self, name: str) -> Dict[str, Any]:
+        entry = self._files[name]
+        if time.monotonic() < entry["ready_at"]:
+            state = "PROCESSING"
+        else:
+            state = self.fail_state or "ACTIVE"
+        return {"name": name, "uri": entry["uri"], "state": state}
+
+    async def upload(self, file_path: Path) -> Dict[str, Any]:
+        self.calls["upload"] += 1
+        await asyncio.sleep(self.upload_latency)
+        self._maybe_fail()
+        name = f"files/fake-{uuid4().hex[:12]}"
+        self._files[name] = {
+            "uri": f"https://fake.local/{name}",
+            "path": str(file_path),
+            "ready_at": time.monotonic() + self.processing_time,
+        }
+        return self._info(name)
+
+    async def get(self, name: str) -> Dict[str, Any]:
+        self.calls["get"] += 1
+        self._maybe_fail()
+        return self._info(name)
+
+
+class GeminiUploader:
+    """
+    Subida asíncrona de archivos a Gemini.
+
+    - Cupo global de subidas simultáneas (semáforo compartido por todas las ingestas).
+    - Reintentos con backoff exponencial y jitter ante fallos transitorios.
+    - Sondeo del estado PROCESSING con el mismo backoff (sin `time.sleep` ni hilos ocupados).
+    - Tiempo máximo total por archivo.
+    """
+
+    def __init__(self, files_api=None, max_concurrency: int = GEMINI_UPLOAD_CONCURRENCY,
+                 max_retries: int = GEMINI_UPLOAD_RETRIES, timeout: float = GEMINI_UPLOAD_TIMEOUT,
+                 backoff_base: float = GEMINI_BACKOFF_BASE, backoff_max: float = GEMINI_BACKOFF_MAX):
+        self.files_api = files_api or GenaiFilesAPI()
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _delay(self, attempt: int) -> float:
+        """
+        Backoff exponencial con "full jitter": uniforme entre 0 y base * 2^intento (acotado).
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _call(self, operation, *args) -> Dict[str, Any]:
+        attempt = 0
+        while True:
+            try:
+                return await operation(*args)
+            except Exception as e:
+                if not is_transient(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._delay(attempt)
+                print(f"WARN: Gemini files call failed ({e}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _upload(self, file_path: Path) -> Dict[str, Any]:
+        file = await self._call(self.files_api.upload, file_path)
+        poll = 0
+        while file["state"] == "PROCESSING":
+            await asyncio.sleep(self._delay(poll))
+            poll += 1
+            file = await self._call(self.files_api.get, file["name"])
+        if file["state"] != "ACTIVE":
+            raise UploadFailedError(f"Gemini File Upload Failed: {file['state']}")
+        return file
+
+    async def upload(self, file_path: Path) -> Dict[str, Any]:
+        """
+        Sube un archivo y espera a que quede ACTIVE.
+
+        Returns:
+            dict: `name`, `uri` y `state` del archivo en Gemini.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            print(f"Uploading {file_path} to Gemini...")
+            try:
+                return await asyncio.wait_for(self._upload(Path(file_path)), self.timeout)
+            except asyncio.TimeoutError:
+                raise UploadFailedError(f"Gemini File Upload timed out after {self.timeout}s")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Prueba de carga del uploader contra el Files API simulado")
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--processing", type=float, default=1.0)
+    parser.add_argument("--transient-failures", type=int, default=5)
+    args = parser.parse_args()
+
+    async def _demo():
+        fake = FakeFilesAPI(args.latency, args.processing, args.transient_failures)
+        uploader = GeminiUploader(fake)
+        started = time.perf_counter()
+        results = await asyncio.gather(*(uploader.upload(Path(f"doc_{i}.pdf")) for i in range(args.files)))
+        elapsed = time.perf_counter() - started
+        active = sum(r["state"] == "ACTIVE" for r in results)
+        print(f"{active}/{args.files} ACTIVE in {elapsed:.2f}s (calls: {fake.calls})")
+
+    asyncio.run(_demo())
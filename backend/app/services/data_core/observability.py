@@ -0,0 +1,269 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from uuid import uuid4
+
+# Trazas recientes conservadas en memoria para /traces
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "500"))
+METRICS_PREFIX = "bimai_"
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# ID de la petición en curso (lo fija el middleware HTTP; las tareas de fondo lo heredan)
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    return request_id_var.get()
+
+
+def new_request_id() -> str:
+    return uuid4().hex[:16]
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Iterable[Tuple[str, str]], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Métricas en proceso (contadores e histogramas con etiquetas) en formato de exposición
+    de Prometheus, sin dependencias externas.
+    """
+
+    def __init__(self, prefix: str = METRICS_PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, _Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str, buckets: Optional[Tuple[float, ...]] = None):
+        self._help[name] = help_text
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets.get(name, LATENCY_BUCKETS))
+            histogram.observe(value)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                full = f"{self.prefix}{name}"
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{full}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                full = f"{self.prefix}{name}"
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{full}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                    lines.append(f"{full}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{full}_sum{_format_labels(key)} {histogram.sum:g}")
+                    lines.append(f"{full}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class TraceBuffer:
+    """
+    Últimas trazas (ingestas, consultas, peticiones HTTP) en un buffer circular.
+    """
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE):
+        self._traces = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, trace: Dict[str, Any]):
+        with self._lock:
+            self._traces.append(trace)
+
+    def recent(self, limit: int = 50, kind: Optional[str] = None,
+               request_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            traces = list(self._traces)
+        traces.reverse()
+        if kind:
+            traces = [t for t in traces if t["kind"] == kind]
+        if request_id:
+            traces = [t for t in traces if t.get("request_id") == request_id]
+        return traces[:limit]
+
+
+metrics = MetricsRegistry()
+traces = TraceBuffer()
+
+metrics.describe("ingest_stage_seconds", "Duración de cada etapa del pipeline de ingesta")
+metrics.describe("ingest_documents_total", "Documentos procesados por resultado")
+metrics.describe("query_stage_seconds", "Duración de cada etapa de una consulta al Router")
+metrics.describe("queries_total", "Consultas por intención y resultado de caché")
+metrics.describe("answer_cache_requests_total", "Consultas al caché de respuestas por resultado")
+metrics.describe("query_tokens", "Tokens estimados por consulta", TOKEN_BUCKETS)
+metrics.describe("query_tokens_total", "Tokens estimados acumulados por tipo")
+metrics.describe("http_request_seconds", "Latencia de peticiones HTTP")
+metrics.describe("startup_seconds", "Duración de cada fase del arranque del proceso")
+
+
+class Trace:
+    """
+    Traza de una operación: etapas con su inicio relativo y duración.
+
+    Al cerrarse, cada etapa alimenta el histograma `<kind>_stage_seconds` y la traza se
+    guarda en el buffer de trazas recientes.
+    """
+
+    def __init__(self, kind: str, name: str, **attributes):
+        self.kind = kind
+        self.name = name
+        self.attributes = attributes
+        self.request_id = current_request_id()
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.status = "ok"
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(stage, time.perf_counter() - started, started)
+
+    def add_span(self, stage: str, seconds: float, started: Optional[float] = None):
+        offset = ((started if started is not None else time.perf_counter() - seconds) - self._started) * 1000
+        self.spans.append({"stage": stage, "start_ms": round(offset, 3), "duration_ms": round(seconds * 1000, 3)})
+        metrics.observe(f"{self.kind}_stage_seconds", seconds, stage=stage)
+
+    def finish(self, status: Optional[str] = None, duration_ms: Optional[float] = None, **attributes) -> Dict[str, Any]:
+        if status:
+            self.status = status
+        self.attributes.update(attributes)
+        if duration_ms is None:
+            duration_ms = (time.perf_counter() - self._started) * 1000
+        trace = {
+            "kind": self.kind,
+            "name": self.name,
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "duration_ms": round(duration_ms, 3),
+            "status": self.status,
+            "spans": self.spans,
+            "attributes": self.attributes,
+        }
+        traces.add(trace)
+        return trace
+
+
+class StartupReport:
+    """
+    Tiempos del arranque (import de la app, creación de servicios, warm-up) para detectar
+    regresiones en el tiempo hasta servir tráfico.
+    """
+
+    def __init__(self):
+        self.phases: List[Dict[str, Any]] = []
+        self.ready_at: Optional[float] = None
+
+    def add(self, phase: str, seconds: float):
+        self.phases.append({"phase": phase, "ms": round(seconds * 1000, 3)})
+        metrics.observe("startup_seconds", seconds, phase=phase)
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def ready(self):
+        self.ready_at = time.time()
+        summary = ", ".join(f"{p['phase']} {p['ms'] / 1000:.2f}s" for p in self.phases)
+        print(f"INFO: Startup complete in {self.total_ms() / 1000:.2f}s ({summary})")
+
+    def total_ms(self) -> float:
+        return round(sum(p["ms"] for p in self.phases), 3)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"ready_at": self.ready_at, "total_ms": self.total_ms(), "phases": self.phases}
+
+
+startup = StartupReport()
+
+
+def record_query(query: str, metadata: Dict[str, Any]):
+    """
+    Registra una consulta del Router a partir de su metadata (timings, caché, tokens).
+    """
+    timings = metadata.get("timings", {})
+    cache = metadata.get("cache", "miss")
+    total_ms = timings.get("total_ms", 0.0)
+    trace = Trace("query", query[:120], intent=metadata.get("intent"), stores=metadata.get("stores_used"), cache=cache)
+    # La traza se registra al terminar: se lleva su inicio al comienzo real de la consulta y
+    # las etapas (secuenciales) se ubican una tras otra
+    trace.started_at -= total_ms / 1000
+    trace._started -= total_ms / 1000
+    offset = trace._started
+    for stage, key in (("classify", "classify_ms"), ("retrieve", "retrieval_ms"), ("synthesize", "synthesis_ms")):
+        if key in timings:
+            trace.add_span(stage, timings[key] / 1000, offset)
+            offset += timings[key] / 1000
+    metrics.observe("query_stage_seconds", timings.get("total_ms", 0.0) / 1000, stage="total")
+    metrics.inc("queries_total", intent=metadata.get("intent", "GENERAL"), cache=cache)
+    metrics.inc("answer_cache_requests_total", result=cache)
+    for kind in ("context_tokens", "prompt_tokens"):
+        if kind in metadata:
+            metrics.observe("query_tokens", metadata[kind], kind=kind)
+            metrics.inc("query_tokens_total", metadata[kind], kind=kind)
+    trace.finish(
+        duration_ms=total_ms,
+        cache_hit_rate=metadata.get("cache_hit_rate"),
+        context_tokens=metadata.get("context_tokens"),
+        prompt_tokens=metadata.get("prompt_tokens"),
+    )
@@ -0,0 +1,197 @@
+import os
+import time
+import shutil
+import asyncio
+import threading
+from pathlib import Path
+from typing import Dict, Any, Iterable, Optional, Set
+
+from app.services.data_core.projects.store import ProjectStore, get_project_store
+from app.services.data_core.router.cache import get_answer_cache, document_tag
+
+# Blobs direccionados por contenido (hash del PDF saneado), compartidos entre proyectos
+BLOB_STORAGE_PATH = Path(os.getenv("BLOB_STORAGE_PATH", "./data/blobs"))
+# Versiones recientes conservadas por proyecto además de los snapshots
+PROJECT_HISTORY_VERSIONS = int(os.getenv("PROJECT_HISTORY_VERSIONS", "20"))
+# Intervalo de la recolección de basura en segundos (0 = sólo manual)
+PROJECT_GC_INTERVAL = float(os.getenv("PROJECT_GC_INTERVAL", "300"))
+# Antigüedad mínima sin referencias antes de borrar un blob
+PROJECT_GC_GRACE_SECONDS = float(os.getenv("PROJECT_GC_GRACE_SECONDS", "600"))
+
+# Store de los documentos de proyecto
+PROJECT_STORE = "D"
+
+
+class BlobStore:
+    """
+    Almacén de PDFs saneados direccionado por su SHA-256 (`clean_hash`).
+
+    Los blobs se crean como hardlinks del archivo en LOCAL_STORAGE_PATH, así que agregar un
+    documento a un proyecto no copia datos (salvo entre sistemas de archivos distintos).
+    """
+
+    def __init__(self, root: Path = BLOB_STORAGE_PATH):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / f"{digest}.pdf"
+
+    def link(self, source: Path, digest: str) -> Path:
+        path = self.path(digest)
+        if path.exists():
+            return path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{digest}.{threading.get_ident()}.tmp")
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            # Otro sistema de archivos (o sin soporte de hardlinks): copia
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+        return path
+
+    def delete(self, digest: str) -> bool:
+        path = self.path(digest)
+        if not path.exists():
+            return False
+        path.unlink()
+        return True
+
+
+class ProjectManager:
+    """
+    Espacios de nombres por proyecto para el Store D.
+
+    Los documentos se ingestan una sola vez (deduplicados por contenido) y cada proyecto
+    sólo guarda un manifiesto con los que ve; snapshot y restore son operaciones de
+    metadatos (ver ProjectStore). Los documentos ingestados por un proyecto sólo aparecen
+    en las búsquedas de los proyectos que los referencian, y la recolección de basura los
+    elimina (registro, índice y archivos) cuando ningún proyecto ni snapshot los usa.
+    """
+
+    def __init__(self, engine, store: Optional[ProjectStore] = None, blobs: Optional[BlobStore] = None):
+        self.engine = engine
+        self.store = store or get_project_store()
+        self.blobs = blobs or BlobStore()
+        # Serializa el enlace de blobs con su borrado en la recolección
+        self._blob_lock = threading.Lock()
+
+    # --- Documentos -----------------------------------------------------------
+
+    def add_document(self, project_id: str, record: Dict[str, Any], owned: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Agrega un documento ya registrado al proyecto.
+
+        Args:
+            owned: El documento se ingestó para este proyecto (no es parte del corpus común).
+        """
+        return self.add_documents(project_id, [record], owned=owned)
+
+    def add_documents(self, project_id: str, records: Iterable[Dict[str, Any]],
+                      owned: bool = False) -> Optional[Dict[str, Any]]:
+        records = list(records)
+        with self._blob_lock:
+            project = self.store.update_documents(
+                project_id, add={r["id"]: r["clean_hash"] for r in records}, reason="add"
+            )
+            if project is None:
+                return None
+            for record in records:
+                self.blobs.link(Path(record["local_path"]), record["clean_hash"])
+                if owned:
+                    self.store.mark_owned(record["id"], record["clean_hash"], project_id)
+        return project
+
+    def claim_document(self, project_id: str, record: Dict[str, Any]):
+        """
+        Marca como propio un documento recién registrado para un proyecto, antes de
+        indexarlo: queda oculto en las búsquedas hasta que el proyecto lo referencie.
+        """
+        self.store.mark_owned(record["id"], record["clean_hash"], project_id)
+
+    def discard_document(self, project_id: str, doc_id: str) -> bool:
+        """
+        Elimina un documento propio que no pudo agregarse a su proyecto (registro, índice y
+        archivo), para que no quede huérfano en el Store D.
+        """
+        if doc_id in (self.store.documents(project_id) or {}):
+            # El fallo ocurrió después de actualizar el manifiesto
+            self.remove_documents(project_id, [doc_id])
+        purged = self._purge_document(doc_id)
+        self.store.forget_owned(doc_id)
+        return purged
+
+    def remove_documents(self, project_id: str, doc_ids: Iterable[str]) -> Optional[Dict[str, Any]]:
+        return self.store.update_documents(project_id, remove=doc_ids, reason="remove")
+
+    def hidden_documents(self, project_id: Optional[str]) -> Set[str]:
+        """
+        Documentos de proyecto que no deben aparecer en una búsqueda: los ingestados por
+        proyectos que no están en el manifiesto del proyecto activo.
+        """
+        return self.store.hidden_documents(project_id)
+
+    # --- Recolección de basura ------------------------------------------------
+
+    def collect_garbage(self, grace_seconds: float = PROJECT_GC_GRACE_SECONDS) -> Dict[str, int]:
+        """
+        Poda versiones antiguas, libera manifiestos sin referencias y borra los blobs que
+        llevan más de `grace_seconds` sin usarse, junto con los documentos propios de
+        proyectos que los usaban (índice, registro y PDF saneado).
+
+        El costo depende de lo que se libera, no del tamaño del corpus.
+        """
+        started = time.perf_counter()
+        stats = {
+            "versions": self.store.prune_versions(PROJECT_HISTORY_VERSIONS),
+            "manifests": self.store.collect_manifests(),
+            "blobs": 0,
+            "documents": 0,
+        }
+        for digest in self.store.unreferenced_blobs(time.time() - grace_seconds):
+            with self._blob_lock:
+                doc_ids = self.store.drop_blob(digest)
+                if doc_ids is None:
+                    continue
+                self.blobs.delete(digest)
+            stats["blobs"] += 1
+            stats["documents"] += sum(1 for doc_id in doc_ids if self._purge_document(doc_id))
+        if any(stats.values()):
+            print(f"INFO: Project GC in {time.perf_counter() - started:.2f}s: "
+                  + ", ".join(f"{v} {k}" for k, v in stats.items()))
+        return stats
+
+    def _purge_document(self, doc_id: str) -> bool:
+        """
+        Elimina un documento de proyecto (registro, índice y PDF saneado). El archivo se
+        conserva si otro registro lo reutiliza (contenido sanitizado idéntico).
+        """
+        registry = self.engine.registry
+        record = registry.get(doc_id)
+        if record is None:
+            return False
+        registry.delete(doc_id)
+        get_answer_cache().invalidate_tags([document_tag(doc_id)])
+        self.engine.index.remove_document(doc_id)
+        local_path = record.get("local_path")
+        shared = any(
+            other.get("local_path") == local_path
+            for other in registry.list(limit=1000, clean_hash=record.get("clean_hash"))
+        )
+        if local_path and not shared:
+            Path(local_path).unlink(missing_ok=True)
+        return True
+
+    async def run_gc(self, interval: float = PROJECT_GC_INTERVAL):
+        """
+        Recolección de basura periódica en segundo plano (se cancela al apagar la app).
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, self.collect_garbage)
+            except Exception as e:
+                print(f"WARN: Project GC failed: {e}")
+
@@ -0,0 +1,454 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+PROJECTS_DB_PATH = Path(os.getenv("PROJECTS_DB_PATH", "./data/projects.db"))
+# Manifiestos decodificados en memoria (son inmutables)
+MANIFEST_CACHE_SIZE = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    head INTEGER NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS project_manifests (
+    hash TEXT PRIMARY KEY,
+    documents TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS project_versions (
+    project_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    manifest TEXT NOT NULL,
+    reason TEXT,
+    created REAL NOT NULL,
+    PRIMARY KEY (project_id, version)
+);
+CREATE TABLE IF NOT EXISTS project_snapshots (
+    project_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    manifest TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    created REAL NOT NULL,
+    PRIMARY KEY (project_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_project_versions_manifest ON project_versions(manifest);
+CREATE INDEX IF NOT EXISTS idx_project_snapshots_manifest ON project_snapshots(manifest);
+CREATE TABLE IF NOT EXISTS blob_refs (
+    digest TEXT PRIMARY KEY,
+    refcount INTEGER NOT NULL,
+    zeroed REAL
+);
+CREATE INDEX IF NOT EXISTS idx_blob_refs_refcount ON blob_refs(refcount);
+CREATE TABLE IF NOT EXISTS project_documents (
+    doc_id TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_project_documents_digest ON project_documents(digest);
+"""
+
+
+def manifest_hash(documents: Dict[str, str]) -> str:
+    return hashlib.sha256(json.dumps(documents, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ProjectStore:
+    """
+    Metadatos de los proyectos del Store D (SQLite en modo WAL).
+
+    El contenido de un proyecto es un manifiesto inmutable `{doc_id: digest}` direccionado
+    por su hash; cada cambio crea una versión nueva que apunta a otro manifiesto. Un
+    snapshot sólo guarda el hash del manifiesto vigente y restaurarlo crea una versión que
+    vuelve a apuntar a él, así que ambas operaciones cuestan lo mismo con 1 o 10.000
+    documentos.
+
+    `blob_refs` cuenta cuántos manifiestos referencian cada blob; se actualiza al crear o
+    recolectar un manifiesto (no al crear versiones o snapshots que reutilizan uno existente).
+    """
+
+    def __init__(self, db_path: Path = PROJECTS_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._owned: Optional[Set[str]] = None
+        self._cache_lock = threading.Lock()
+        self._manifests: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+        conn = self._connect()
+        with conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self) -> sqlite3.Connection:
+        """
+        Abre una transacción de escritura (BEGIN IMMEDIATE) para leer y modificar la cabeza
+        de un proyecto sin carreras con otros escritores.
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    # --- Manifiestos ----------------------------------------------------------
+
+    @staticmethod
+    def _store_manifest(conn: sqlite3.Connection, documents: Dict[str, str]) -> str:
+        """
+        Guarda el manifiesto si no existía (sumando una referencia a cada blob) y devuelve su hash.
+        """
+        digest = manifest_hash(documents)
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO project_manifests (hash, documents, created) VALUES (?, ?, ?)",
+            (digest, json.dumps(documents, sort_keys=True), time.time()),
+        )
+        if cursor.rowcount:
+            conn.executemany(
+                "INSERT INTO blob_refs (digest, refcount) VALUES (?, 1) "
+                "ON CONFLICT(digest) DO UPDATE SET refcount = refcount + 1, zeroed = NULL",
+                [(blob,) for blob in set(documents.values())],
+            )
+        return digest
+
+    def manifest(self, digest: str) -> Dict[str, str]:
+        """
+        Documentos de un manifiesto ({doc_id: digest}); el resultado no debe modificarse.
+        """
+        with self._cache_lock:
+            documents = self._manifests.get(digest)
+            if documents is not None:
+                self._manifests.move_to_end(digest)
+                return documents
+        row = self._connect().execute("SELECT documents FROM project_manifests WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            return {}
+        documents = json.loads(row["documents"])
+        with self._cache_lock:
+            self._manifests[digest] = documents
+            while len(self._manifests) > MANIFEST_CACHE_SIZE:
+                self._manifests.popitem(last=False)
+        return documents
+
+    # --- Proyectos ------------------------------------------------------------
+
+    def create(self, project_id: str, name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Crea un proyecto vacío (versión 1). Devuelve None si el ID ya existe.
+        """
+        now = time.time()
+        conn = self._transaction()
+        try:
+            if conn.execute("SELECT 1 FROM projects WHERE id = ?", (project_id,)).fetchone():
+                conn.execute("ROLLBACK")
+                return None
+            empty = self._store_manifest(conn, {})
+            conn.execute("INSERT INTO projects VALUES (?, ?, 1, ?, ?)", (project_id, name or project_id, now, now))
+            conn.execute("INSERT INTO project_versions VALUES (?, 1, ?, 'create', ?)", (project_id, empty, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(project_id)
+
+    def get(self, project_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT p.*, v.manifest FROM projects p "
+            "JOIN project_versions v ON v.project_id = p.id AND v.version = p.head WHERE p.id = ?",
+            (project_id,),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def list(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT p.*, v.manifest FROM projects p "
+            "JOIN project_versions v ON v.project_id = p.id AND v.version = p.head "
+            "ORDER BY p.created DESC LIMIT ? OFFSET ?",
+            (limit, offset),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete(self, project_id: str) -> bool:
+        """
+        Elimina el proyecto con sus versiones y snapshots. Los manifiestos y blobs que queden
+        sin referencias los libera la recolección de basura.
+        """
+        conn = self._transaction()
+        try:
+            cursor = conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+            conn.execute("DELETE FROM project_versions WHERE project_id = ?", (project_id,))
+            conn.execute("DELETE FROM project_snapshots WHERE project_id = ?", (project_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cursor.rowcount > 0
+
+    def documents(self, project_id: str) -> Optional[Dict[str, str]]:
+        """
+        Manifiesto vigente del proyecto ({doc_id: digest}) o None si no existe.
+        """
+        project = self.get(project_id)
+        return self.manifest(project["manifest"]) if project else None
+
+    def update_documents(self, project_id: str, add: Optional[Dict[str, str]] = None,
+                         remove: Iterable[str] = (), reason: str = "update") -> Optional[Dict[str, Any]]:
+        """
+        Agrega o quita documentos creando una versión nueva (si el contenido no cambia, no se
+        crea versión). Devuelve el proyecto actualizado o None si no existe.
+        """
+        conn = self._transaction()
+        try:
+            row = conn.execute(
+                "SELECT p.head, v.manifest FROM projects p "
+                "JOIN project_versions v ON v.project_id = p.id AND v.version = p.head WHERE p.id = ?",
+                (project_id,),
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            documents = dict(self.manifest(row["manifest"]))
+            documents.update(add or {})
+            for doc_id in remove:
+                documents.pop(doc_id, None)
+            digest = self._store_manifest(conn, documents)
+            if digest != row["manifest"]:
+                self._add_version(conn, project_id, row["head"] + 1, digest, reason)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(project_id)
+
+    @staticmethod
+    def _add_version(conn: sqlite3.Connection, project_id: str, version: int, manifest: str, reason: str):
+        now = time.time()
+        conn.execute("INSERT INTO project_versions VALUES (?, ?, ?, ?, ?)", (project_id, version, manifest, reason, now))
+        conn.execute("UPDATE projects SET head = ?, updated = ? WHERE id = ?", (version, now, project_id))
+
+    def versions(self, project_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT version, manifest, reason, created FROM project_versions WHERE project_id = ? "
+            "ORDER BY version DESC LIMIT ?",
+            (project_id, limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    # --- Snapshots ------------------------------------------------------------
+
+    def snapshot(self, project_id: str, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Congela la versión vigente con un nombre (sólo metadatos).
+
+        Raises:
+            ValueError: Si ya existe un snapshot con ese nombre.
+        """
+        conn = self._transaction()
+        try:
+            row = conn.execute(
+                "SELECT p.head, v.manifest FROM projects p "
+                "JOIN project_versions v ON v.project_id = p.id AND v.version = p.head WHERE p.id = ?",
+                (project_id,),
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            try:
+                conn.execute("INSERT INTO project_snapshots VALUES (?, ?, ?, ?, ?)",
+                             (project_id, name, row["manifest"], row["head"], time.time()))
+            except sqlite3.IntegrityError:
+                raise ValueError(f"Ya existe el snapshot {name} en el proyecto {project_id}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get_snapshot(project_id, name)
+
+    def get_snapshot(self, project_id: str, name: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT * FROM project_snapshots WHERE project_id = ? AND name = ?", (project_id, name)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def snapshots(self, project_id: str) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT * FROM project_snapshots WHERE project_id = ? ORDER BY created DESC", (project_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete_snapshot(self, project_id: str, name: str) -> bool:
+        conn = self._connect()
+        cursor = conn.execute("DELETE FROM project_snapshots WHERE project_id = ? AND name = ?", (project_id, name))
+        return cursor.rowcount > 0
+
+    def restore(self, project_id: str, name: str) -> Optional[Dict[str, Any]]:
+        """
+        Vuelve el proyecto al contenido de un snapshot con una versión nueva (el historial
+        posterior se conserva). Devuelve None si el proyecto o el snapshot no existen.
+        """
+        conn = self._transaction()
+        try:
+            row = conn.execute(
+                "SELECT p.head, s.manifest FROM projects p "
+                "JOIN project_snapshots s ON s.project_id = p.id AND s.name = ? WHERE p.id = ?",
+                (name, project_id),
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            self._add_version(conn, project_id, row["head"] + 1, row["manifest"], f"restore:{name}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(project_id)
+
+    # --- Documentos propios ---------------------------------------------------
+
+    def mark_owned(self, doc_id: str, digest: str, project_id: str):
+        """
+        Registra un documento ingestado por un proyecto: sólo es visible desde los proyectos
+        que lo referencian y se elimina cuando ninguno lo hace.
+        """
+        conn = self._connect()
+        conn.execute("INSERT OR IGNORE INTO project_documents VALUES (?, ?, ?, ?)",
+                     (doc_id, digest, project_id, time.time()))
+        with self._cache_lock:
+            self._owned = None
+
+    def forget_owned(self, doc_id: str):
+        """
+        Olvida un documento propio que no llegó a agregarse a su proyecto (ya purgado).
+        """
+        self._connect().execute("DELETE FROM project_documents WHERE doc_id = ?", (doc_id,))
+        with self._cache_lock:
+            self._owned = None
+
+    def owned_documents(self) -> Set[str]:
+        with self._cache_lock:
+            if self._owned is None:
+                rows = self._connect().execute("SELECT doc_id FROM project_documents").fetchall()
+                self._owned = {row["doc_id"] for row in rows}
+            return self._owned
+
+    def hidden_documents(self, project_id: Optional[str]) -> Set[str]:
+        """
+        Documentos propios de proyectos que no están en el manifiesto vigente del proyecto
+        activo (sin proyecto, todos los propios).
+        """
+        owned = self.owned_documents()
+        if not owned:
+            return set()
+        visible = (self.documents(project_id) or {}) if project_id else {}
+        return owned.difference(visible)
+
+    def scope(self, project_id: Optional[str]) -> str:
+        """
+        Identificador del contenido visible de un proyecto (hash de su manifiesto vigente),
+        para separar respuestas cacheadas por proyecto y versión.
+        """
+        project = self.get(project_id) if project_id else None
+        return project["manifest"][:16] if project else "-"
+
+    # --- Recolección de basura ------------------------------------------------
+
+    def prune_versions(self, keep: int) -> int:
+        """
+        Borra las versiones más antiguas que las últimas `keep` de cada proyecto (la vigente
+        nunca se borra; los snapshots no dependen de las versiones).
+        """
+        conn = self._connect()
+        cursor = conn.execute(
+            "DELETE FROM project_versions WHERE version <= "
+            "(SELECT head FROM projects WHERE projects.id = project_versions.project_id) - ? "
+            "OR project_id NOT IN (SELECT id FROM projects)",
+            (max(keep, 1),),
+        )
+        return cursor.rowcount
+
+    def collect_manifests(self) -> int:
+        """
+        Elimina los manifiestos que ya no referencia ninguna versión ni snapshot y descuenta
+        sus referencias a blobs. Devuelve cuántos se eliminaron.
+        """
+        conn = self._transaction()
+        try:
+            rows = conn.execute(
+                "SELECT hash, documents FROM project_manifests m "
+                "WHERE NOT EXISTS (SELECT 1 FROM project_versions v WHERE v.manifest = m.hash) "
+                "AND NOT EXISTS (SELECT 1 FROM project_snapshots s WHERE s.manifest = m.hash)"
+            ).fetchall()
+            now = time.time()
+            for row in rows:
+                with self._cache_lock:
+                    self._manifests.pop(row["hash"], None)
+                for blob in set(json.loads(row["documents"]).values()):
+                    conn.execute(
+                        "UPDATE blob_refs SET refcount = refcount - 1, "
+                        "zeroed = CASE WHEN refcount = 1 THEN ? ELSE zeroed END WHERE digest = ?",
+                        (now, blob),
+                    )
+                conn.execute("DELETE FROM project_manifests WHERE hash = ?", (row["hash"],))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def unreferenced_blobs(self, older_than: float) -> List[str]:
+        rows = self._connect().execute(
+            "SELECT digest FROM blob_refs WHERE refcount <= 0 AND zeroed < ?", (older_than,)
+        ).fetchall()
+        return [row["digest"] for row in rows]
+
+    def drop_blob(self, digest: str) -> Optional[List[str]]:
+        """
+        Olvida un blob si sigue sin referencias y devuelve los documentos propios que lo
+        usaban (None si volvió a referenciarse entretanto).
+        """
+        conn = self._transaction()
+        try:
+            cursor = conn.execute("DELETE FROM blob_refs WHERE digest = ? AND refcount <= 0", (digest,))
+            if not cursor.rowcount:
+                conn.execute("ROLLBACK")
+                return None
+            rows = conn.execute("SELECT doc_id FROM project_documents WHERE digest = ?", (digest,)).fetchall()
+            conn.execute("DELETE FROM project_documents WHERE digest = ?", (digest,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._cache_lock:
+            self._owned = None
+        return [row["doc_id"] for row in rows]
+
+
+_store: Optional[ProjectStore] = None
+_store_lock = threading.Lock()
+
+
+def get_project_store() -> ProjectStore:
+    """
+    Instancia compartida de los metadatos de proyectos (la usan la API y el Router).
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ProjectStore()
+        return _store
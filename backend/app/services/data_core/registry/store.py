@@ -0,0 +1,264 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, Collection, List, Optional
+
+REGISTRY_DB_PATH = Path(os.getenv("REGISTRY_DB_PATH", "./data/registry.db"))
+
+# Columnas consultables (los campos indexados del registro)
+_LOOKUP_FIELDS = {"id", "content_hash", "clean_hash", "category", "code", "store_type"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id TEXT PRIMARY KEY,
+    original_name TEXT NOT NULL,
+    local_path TEXT,
+    gemini_id TEXT,
+    gemini_uri TEXT,
+    content_hash TEXT,
+    clean_hash TEXT,
+    category TEXT,
+    code TEXT,
+    store_type TEXT,
+    timestamp REAL NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash);
+CREATE INDEX IF NOT EXISTS idx_documents_clean_hash ON documents(clean_hash);
+CREATE INDEX IF NOT EXISTS idx_documents_category ON documents(category);
+CREATE INDEX IF NOT EXISTS idx_documents_code ON documents(code);
+CREATE INDEX IF NOT EXISTS idx_documents_store_type ON documents(store_type);
+CREATE INDEX IF NOT EXISTS idx_documents_timestamp ON documents(timestamp);
+CREATE TABLE IF NOT EXISTS layout_templates (
+    fingerprint TEXT PRIMARY KEY,
+    template TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tag_cache (
+    content_hash TEXT PRIMARY KEY,
+    metadata TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS page_density (
+    content_hash TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    decisions TEXT NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (content_hash, layout)
+);
+"""
+
+
+class DocumentRegistry:
+    """
+    Registro de documentos ingestados respaldado por SQLite (modo WAL).
+
+    Cada inserción es una transacción de un solo registro, por lo que las ingestas
+    concurrentes no se pisan entre sí. El registro completo se guarda como JSON en
+    la columna `record`; los campos de búsqueda se duplican en columnas indexadas.
+    """
+
+    def __init__(self, db_path: Path = REGISTRY_DB_PATH):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Devuelve la conexión del hilo actual (sqlite3 no comparte conexiones entre hilos).
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_values(record: Dict[str, Any]) -> tuple:
+        metadata = record.get("metadata") or {}
+        return (
+            record["id"],
+            record.get("original_name", ""),
+            record.get("local_path"),
+            record.get("gemini_id"),
+            record.get("gemini_uri"),
+            record.get("content_hash"),
+            record.get("clean_hash"),
+            metadata.get("category"),
+            metadata.get("code"),
+            metadata.get("store_type"),
+            record.get("timestamp", 0.0),
+            json.dumps(record),
+        )
+
+    def insert(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Inserta un registro de forma atómica.
+
+        Si ya existe otro registro con el mismo content_hash (dos subidas idénticas en
+        paralelo), no se inserta y se devuelve el registro existente.
+        """
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(content_hash) DO NOTHING",
+                self._row_values(record),
+            )
+        if cursor.rowcount == 0:
+            return self.find_one("content_hash", record.get("content_hash")) or record
+        return record
+
+    def insert_many(self, records: List[Dict[str, Any]]) -> int:
+        """
+        Inserta varios registros en una sola transacción. Devuelve cuántos se insertaron.
+        """
+        conn = self._connect()
+        with conn:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [self._row_values(r) for r in records],
+            )
+        return cursor.rowcount
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        return self.find_one("id", record_id)
+
+    def find_one(self, field: str, value: Optional[str],
+                 exclude: Collection[str] = ()) -> Optional[Dict[str, Any]]:
+        """
+        Busca el registro más reciente cuyo campo indexado coincide con el valor, omitiendo
+        los IDs de `exclude`.
+        """
+        if field not in _LOOKUP_FIELDS:
+            raise ValueError(f"Campo no indexado: {field}")
+        if not value:
+            return None
+        rows = self._connect().execute(
+            f"SELECT id, record FROM documents WHERE {field} = ? ORDER BY timestamp DESC",
+            (value,),
+        )
+        for row in rows:
+            if row["id"] not in exclude:
+                return json.loads(row["record"])
+        return None
+
+    def list(self, limit: int = 100, offset: int = 0, **filters: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        Lista registros (más recientes primero) filtrando por campos indexados.
+        """
+        clauses, params = [], []
+        for field, value in filters.items():
+            if value is None:
+                continue
+            if field not in _LOOKUP_FIELDS:
+                raise ValueError(f"Campo no indexado: {field}")
+            clauses.append(f"{field} = ?")
+            params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connect().execute(
+            f"SELECT record FROM documents {where} ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        ).fetchall()
+        return [json.loads(r["record"]) for r in rows]
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def delete(self, record_id: str) -> bool:
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute("DELETE FROM documents WHERE id = ?", (record_id,))
+        return cursor.rowcount > 0
+
+    def get_layout_template(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Plantilla de encabezado/pie cacheada para una huella de editor/serie.
+        """
+        row = self._connect().execute(
+            "SELECT template FROM layout_templates WHERE fingerprint = ?", (fingerprint,)
+        ).fetchone()
+        return json.loads(row["template"]) if row else None
+
+    def save_layout_template(self, fingerprint: str, template: Dict[str, Any]):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO layout_templates VALUES (?, ?, ?)",
+                (fingerprint, json.dumps(template), time.time()),
+            )
+
+    def get_cached_tags(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """
+        Metadatos de etiquetado cacheados para un contenido (hash SHA-256).
+        """
+        row = self._connect().execute(
+            "SELECT metadata FROM tag_cache WHERE content_hash = ?", (content_hash,)
+        ).fetchone()
+        return json.loads(row["metadata"]) if row else None
+
+    def save_cached_tags(self, content_hash: str, metadata: Dict[str, Any]):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tag_cache VALUES (?, ?, ?)",
+                (content_hash, json.dumps(metadata), time.time()),
+            )
+
+    def get_page_density(self, content_hash: str, layout: str) -> Optional[str]:
+        """
+        Decisiones por página del sanitizador (un carácter por página) para un contenido y
+        una clave de análisis (modo, umbral y plantilla de encabezado/pie).
+        """
+        row = self._connect().execute(
+            "SELECT decisions FROM page_density WHERE content_hash = ? AND layout = ?", (content_hash, layout)
+        ).fetchone()
+        return row["decisions"] if row else None
+
+    def save_page_density(self, content_hash: str, layout: str, decisions: str):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO page_density VALUES (?, ?, ?, ?)",
+                (content_hash, layout, decisions, time.time()),
+            )
+
+    def migrate_from_json(self, json_path: Path) -> int:
+        """
+        Migración única desde el antiguo registry.json.
+
+        Importa todos los registros en una transacción y renombra el archivo a
+        `<nombre>.migrated` para que no vuelva a importarse.
+        """
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return 0
+        try:
+            with open(json_path, "r") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"WARN: Could not read legacy registry {json_path}: {e}")
+            return 0
+
+        records = [r for r in data.values() if isinstance(r, dict) and "id" in r]
+        inserted = self.insert_many(records)
+        json_path.rename(json_path.with_name(json_path.name + ".migrated"))
+        print(f"DEBUG: Migrated {inserted}/{len(records)} records from {json_path}")
+        return inserted
+
+
+if __name__ == "__main__":
+    import sys
+
+    legacy_path = Path(sys.argv[1] if len(sys.argv) > 1 else os.getenv("REGISTRY_PATH", "./data/registry.json"))
+    registry = DocumentRegistry()
+    print(f"Migrados {registry.migrate_from_json(legacy_path)} registros a {registry.db_path}")
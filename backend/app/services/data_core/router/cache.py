@@ -0,0 +1,277 @@
+import os
+import re
+import asyncio
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+from app.services.data_core.index.text import fold_accents
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+REDIS_URL = os.getenv("REDIS_URL")
+# Versión del corpus: cambiarla invalida todo el caché (p.ej. tras reindexar o cambiar de modelo)
+CORPUS_VERSION = os.getenv("CORPUS_VERSION", "1")
+
+# TTL por Store en segundos: la normativa cambia poco, el contexto de proyecto cambia seguido
+STORE_TTL = {
+    "A": int(os.getenv("CACHE_TTL_STORE_A", str(7 * 24 * 3600))),
+    "B": int(os.getenv("CACHE_TTL_STORE_B", str(30 * 24 * 3600))),
+    "C": int(os.getenv("CACHE_TTL_STORE_C", str(24 * 3600))),
+    "D": int(os.getenv("CACHE_TTL_STORE_D", str(3600))),
+}
+
+_CODE_RE = re.compile(r"\b([a-z]{1,3})\.?\s?(\d{3})\b")
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Forma canónica de una consulta para la clave del caché: minúsculas, sin tildes, sin
+    puntuación y con los espacios colapsados ("¿Recubrimiento  mínimo?" -> "recubrimiento minimo").
+
+    Se conservan el orden y todas las palabras: "con"/"sin", "no" o "concreto sobre
+    albañilería" frente a "albañilería sobre concreto" cambian la respuesta.
+    """
+    return " ".join(_WORD_RE.findall(fold_accents(query)))
+
+
+def normalize_code(code: str) -> str:
+    """
+    Normaliza un código de norma para usarlo como etiqueta ("E.030", "e030" -> "E030").
+    """
+    return re.sub(r"[^A-Z0-9]", "", fold_accents(code).upper())
+
+
+def codes_in_text(text: str) -> List[str]:
+    """
+    Códigos de norma mencionados en un texto (E.030, IS.010, A.010...).
+    """
+    return sorted({f"{prefix}{number}".upper() for prefix, number in _CODE_RE.findall(fold_accents(text))})
+
+
+def document_tag(document_id: str) -> str:
+    return f"doc:{document_id}"
+
+
+def code_tag(code: str) -> str:
+    return f"code:{normalize_code(code)}"
+
+
+class LRUCacheBackend:
+    """
+    Backend en proceso: LRU acotado con TTL por entrada e índice inverso de etiquetas.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl: int, tags: Iterable[str]):
+        tags = set(tags)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in self._tags.pop(tag, set()):
+                    if key in self._entries:
+                        self._remove(key)
+                        removed += 1
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisCacheBackend:
+    """
+    Backend Redis compartido entre réplicas.
+
+    Sólo usa get/set/delete/sadd/smembers/expire (con NX/GT, Redis >= 7), por lo que acepta un
+    cliente redis-py o cualquier sustituto local compatible (p.ej. fakeredis) para pruebas.
+    """
+
+    # Las operaciones son llamadas de red: AnswerCache las saca del event loop
+    blocking = True
+
+    def __init__(self, client, prefix: str = "bimai:answer:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}tag:{tag}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.get(self._key(key))
+        return json.loads(raw) if raw else None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: int, tags: Iterable[str]):
+        self.client.set(self._key(key), json.dumps(value), ex=ttl)
+        for tag in tags:
+            tag_key = self._tag_key(tag)
+            self.client.sadd(tag_key, key)
+            # El TTL de la etiqueta sólo se extiende: debe durar tanto como su entrada más larga
+            self.client.expire(tag_key, ttl, nx=True)
+            self.client.expire(tag_key, ttl, gt=True)
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        removed = 0
+        for tag in tags:
+            tag_key = self._tag_key(tag)
+            keys = [k.decode() if isinstance(k, bytes) else k for k in self.client.smembers(tag_key)]
+            if keys:
+                removed += self.client.delete(*[self._key(k) for k in keys])
+            self.client.delete(tag_key)
+        return removed
+
+    def clear(self):
+        # Invalidación global: cambiar CORPUS_VERSION; no se recorre el keyspace
+        pass
+
+    def size(self) -> int:
+        return -1
+
+
+class AnswerCache:
+    """
+    Caché de respuestas del Router con invalidación selectiva por documento o código de norma.
+
+    La clave combina la consulta normalizada, la intención, los Stores consultados y la versión
+    del corpus. Cada entrada se etiqueta con los documentos citados y los códigos de norma
+    mencionados, para invalidarla cuando se ingesta una nueva versión de esa norma.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or LRUCacheBackend()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(query: str, intent: str, stores: Iterable[str], corpus_version: str = CORPUS_VERSION) -> str:
+        raw = "|".join([normalize_query(query), intent, ",".join(sorted(stores)), corpus_version])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def ttl_for(stores: Iterable[str]) -> int:
+        return min((STORE_TTL.get(store, STORE_TTL["D"]) for store in stores), default=STORE_TTL["D"])
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"WARN: Answer cache get failed: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], stores: Iterable[str], tags: Iterable[str]):
+        stores = list(stores)
+        try:
+            self.backend.set(key, value, self.ttl_for(stores), tags)
+        except Exception as e:
+            print(f"WARN: Answer cache set failed: {e}")
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        `get` para el event loop: con un backend de red (Redis) se ejecuta en el executor.
+        """
+        if getattr(self.backend, "blocking", False):
+            return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+        return self.get(key)
+
+    async def set_async(self, key: str, value: Dict[str, Any], stores: Iterable[str], tags: Iterable[str]):
+        if getattr(self.backend, "blocking", False):
+            await asyncio.get_running_loop().run_in_executor(None, self.set, key, value, list(stores), list(tags))
+        else:
+            self.set(key, value, stores, tags)
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        tags = list(tags)
+        if not tags:
+            return 0
+        try:
+            removed = self.backend.invalidate_tags(tags)
+        except Exception as e:
+            print(f"WARN: Answer cache invalidation failed: {e}")
+            return 0
+        print(f"DEBUG: Answer cache invalidated {removed} entries for {tags}")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "cache_hits": hits,
+            "cache_misses": misses,
+            "cache_hit_rate": round(hits / total, 4) if total else 0.0,
+        }
+
+
+_cache: Optional[AnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """
+    Instancia compartida del caché (Redis si REDIS_URL está configurado, LRU en proceso si no).
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            backend = None
+            if REDIS_URL:
+                try:
+                    import redis
+                    backend = RedisCacheBackend(redis.Redis.from_url(REDIS_URL))
+                except ImportError:
+                    print("WARN: REDIS_URL set but 'redis' is not installed. Using in-process cache.")
+            _cache = AnswerCache(backend)
+        return _cache
@@ -0,0 +1,134 @@
+import os
+import re
+from typing import Dict, Any, List, Set
+
+from app.services.data_core.index.text import tokenize
+
+# Presupuesto de tokens para el contexto recuperado del prompt de síntesis
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Tope por fragmento: los más largos se recortan a sus oraciones más relevantes
+CONTEXT_SNIPPET_TOKENS = int(os.getenv("CONTEXT_SNIPPET_TOKENS", "400"))
+# Balance relevancia/diversidad de MMR (1.0 = sólo relevancia)
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Similitud (Jaccard de términos) a partir de la cual dos fragmentos se consideran duplicados
+CONTEXT_DUPLICATE_SIMILARITY = float(os.getenv("CONTEXT_DUPLICATE_SIMILARITY", "0.8"))
+
+SYSTEM_INSTRUCTION = (
+    "Eres un asistente técnico experto en construcción y normativa BIM. "
+    "Responde SÓLO con el contexto dado. Cita cada afirmación con [n] (archivo y página). "
+    "Si la información no está en el contexto, dilo."
+)
+
+_SENTENCE_RE = re.compile(r"(?<=[.;:!?])\s+|\n+")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimación de tokens sin tokenizador (~4 caracteres por token en español).
+    """
+    return (len(text) + 3) // 4
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _overlaps(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """
+    Dos fragmentos de la misma página cuyos rangos de caracteres se solapan. Sin offsets
+    (índices anteriores a ellos) sólo se consideran solapados si un texto contiene al otro.
+    """
+    if a["document_id"] != b["document_id"] or a["page_number"] != b["page_number"]:
+        return False
+    if a.get("start") is None or b.get("start") is None:
+        a_text, b_text = (a.get("content") or "").strip(), (b.get("content") or "").strip()
+        return bool(a_text and b_text) and (a_text in b_text or b_text in a_text)
+    return a["start"] < b["end"] and b["start"] < a["end"]
+
+
+def _best_span(content: str, query_terms: Set[str], max_tokens: int) -> str:
+    """
+    Recorta un fragmento largo a sus oraciones con más términos de la consulta, en el orden
+    original, hasta `max_tokens`.
+    """
+    if estimate_tokens(content) <= max_tokens:
+        return content
+    sentences = [s.strip() for s in _SENTENCE_RE.split(content) if s.strip()]
+    hits = [len(query_terms & set(tokenize(sentence))) for sentence in sentences]
+    # La primera oración (encabezado del artículo) y las que contienen términos de la consulta;
+    # si ninguna los contiene, el inicio del fragmento
+    ranked = [0] + sorted((i for i in range(1, len(sentences)) if hits[i]), key=lambda i: (-hits[i], i))
+    if len(ranked) == 1:
+        ranked = list(range(len(sentences)))
+    keep, used = set(), 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i]) + 1
+        if used + cost > max_tokens:
+            continue
+        keep.add(i)
+        used += cost
+    if not keep:
+        return content[:max_tokens * 4]
+    return " … ".join(sentences[i] for i in sorted(keep))
+
+
+def build_context(query: str, results: List[Dict[str, Any]], budget: int = CONTEXT_TOKEN_BUDGET,
+                  snippet_tokens: int = CONTEXT_SNIPPET_TOKENS, mmr_lambda: float = CONTEXT_MMR_LAMBDA) -> Dict[str, Any]:
+    """
+    Selecciona y compacta los resultados recuperados para el prompt de síntesis.
+
+    1. Descarta fragmentos que se solapan con otro mejor puntuado de la misma página y los
+       casi idénticos (p.ej. el mismo artículo en dos ediciones de la norma).
+    2. Ordena por MMR: relevancia (puntaje de fusión) penalizada por similitud con lo ya elegido.
+    3. Recorta cada fragmento a sus oraciones más relevantes y agrega hasta agotar el presupuesto.
+
+    Returns:
+        dict: `text` (contexto numerado [1], [2]...), `selected` (resultados usados, en el
+        orden de los números), `tokens` usados y `dropped` (descartados).
+    """
+    query_terms = set(tokenize(query))
+    candidates = []
+    for res in results:
+        terms = set(tokenize(res["content"]))
+        if any(_overlaps(res, kept) or _jaccard(terms, kept["_terms"]) >= CONTEXT_DUPLICATE_SIMILARITY
+               for kept in candidates):
+            continue
+        candidates.append({**res, "_terms": terms})
+
+    # Relevancia normalizada a [0, 1] (los resultados llegan ordenados de mayor a menor)
+    raw = [c.get("rrf_score", c.get("score", 0.0)) or 0.0 for c in candidates]
+    top = max(raw, default=0.0) or 1.0
+    relevance = [r / top for r in raw]
+
+    selected, blocks, used = [], [], 0
+    remaining = list(range(len(candidates)))
+    while remaining and used < budget:
+        def mmr(i):
+            redundancy = max((_jaccard(candidates[i]["_terms"], s["_terms"]) for s in selected), default=0.0)
+            return mmr_lambda * relevance[i] - (1.0 - mmr_lambda) * redundancy
+
+        best = max(remaining, key=mmr)
+        remaining.remove(best)
+        candidate = candidates[best]
+        anchor = f", {candidate['article_id']}" if candidate.get("article_id") else ""
+        header = f"[{len(selected) + 1}] {candidate['source_file']} p.{candidate['page_number']}{anchor}"
+        text = _best_span(candidate["content"], query_terms, min(snippet_tokens, budget - used))
+        cost = estimate_tokens(header) + estimate_tokens(text) + 1
+        if used + cost > budget:
+            continue
+        selected.append(candidate)
+        blocks.append(f"{header}\n{text}")
+        used += cost
+
+    return {
+        "text": "\n\n".join(blocks),
+        "selected": [{k: v for k, v in s.items() if k != "_terms"} for s in selected],
+        "tokens": used,
+        "dropped": len(results) - len(selected),
+    }
+
+
+def build_prompt(query: str, context_text: str) -> str:
+    return f"{SYSTEM_INSTRUCTION}\n\nCONTEXTO:\n{context_text}\n\nCONSULTA: {query}"
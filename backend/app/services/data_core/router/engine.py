@@ -1,37 +1,30 @@
 import os
-import re
-from typing import List, Dict, Any
-from uuid import uuid4
-import google.generativeai as genai
+import time
+import asyncio
+import threading
+from typing import List, Dict, Any, AsyncGenerator, Optional, Set, Tuple
 
 from app.services.data_core.models.schema import CoreResponse, Citation
+from app.services.data_core.clients import get_model, SYNTHESIS_MODEL
+from app.services.data_core.index.hybrid import get_search_index
+from app.services.data_core.router.cache import get_answer_cache, document_tag, code_tag, codes_in_text, CORPUS_VERSION
+from app.services.data_core.router.intent import get_intent_classifier
+from app.services.data_core.router.context import build_context, build_prompt, estimate_tokens
+from app.services.data_core.observability import current_request_id, record_query
+from app.services.data_core.projects.store import get_project_store
+
+ROUTER_TOP_K = int(os.getenv("ROUTER_TOP_K", "5"))
+# Tiempo máximo de búsqueda por Store (segundos); un Store lento no bloquea la respuesta
+ROUTER_STORE_TIMEOUT = float(os.getenv("ROUTER_STORE_TIMEOUT", "2.0"))
+# Similitud mínima para enrutar por vectores una consulta sin palabras clave
+ROUTER_MIN_SIMILARITY = float(os.getenv("ROUTER_MIN_SIMILARITY", "0.3"))
+# Marca de la clave de caché para consultas que se enrutan por similitud vectorial
+SIMILARITY_ROUTE = "~"
+# Constante de Reciprocal Rank Fusion
+RRF_K = 60
+
+NOT_FOUND_ANSWER = "Información no encontrada en la base normativa o técnica disponible."
 
-class VertexAISearchMock:
-    """
-    Mock para simular Vertex AI Search cuando no hay credenciales de nube.
-    """
-    def search(self, query: str, store_id: str, top_k: int = 5):
-        # Simulación de respuesta basada en keywords simples
-        print(f"MOCK SEARCH: Query='{query}' in Store='{store_id}'")
-        
-        if "sismo" in query.lower() or "e.030" in query.lower():
-            return [
-                {
-                    "document_id": str(uuid4()),
-                    "source_file": "E030_Diseno_Sismorresistente_2018.pdf",
-                    "page_number": 15,
-                    "content": "Artículo 12. La zonificación sísmica del Perú se divide en 4 zonas...",
-                    "article_id": "Art. 12"
-                },
-                {
-                    "document_id": str(uuid4()),
-                    "source_file": "E030_Diseno_Sismorresistente_2018.pdf",
-                    "page_number": 16,
-                    "content": "Tabla N° 1. Factores de Zona 'Z'. Zona 4 -> Z=0.45",
-                    "article_id": "Tabla 1"
-                }
-            ]
-        return []
 
 class DataCoreRouter:
     def __init__(self):
@@ -44,103 +37,392 @@ class DataCoreRouter:
             "C": os.getenv("STORE_C_ID", "mock-store-c"), # Specs
             "D": os.getenv("STORE_D_ID", "mock-store-d"), # Contexto
         }
-        self.search_client = VertexAISearchMock() # Reemplazar con cliente real en Prod
+        # Índice local (BM25 + vectores) construido durante la ingesta, particionado por Store A/B/C/D
+        self.search_client = get_search_index()
+        self.cache = get_answer_cache()
+        self.classifier = get_intent_classifier()
+        # Espacios de nombres del Store D por proyecto
+        self.projects = get_project_store()
 
-    def _classify_intent(self, query: str) -> str:
+    def warm_up(self) -> Dict[str, float]:
         """
-        Clasificación determinista de intención (Normativa vs Especificación vs Metodología).
+        Carga de antemano lo que pagaría la primera consulta: el clasificador y los índices de
+        cada Store (manifiestos, segmentos y matrices mapeadas en memoria).
+
+        Returns:
+            dict: Segundos por paso.
         """
-        query_lower = query.lower()
-        
-        # Reglas Regex para Normativa (Store B)
-        normativa_patterns = [
-            r"norma", r"reglamento", r"rne", r"ley", r"decreto", 
-            r"artículo", r"inciso", r"e\.\d{3}", r"a\.\d{3}", r"is\.\d{3}"
-        ]
-        if any(re.search(p, query_lower) for p in normativa_patterns):
-            return "NORMATIVA"
-            
-        # Reglas para Especificaciones (Store C)
-        specs_patterns = [
-            r"ficha técnica", r"resistencia", r"dosificación", r"rendimiento",
-            r"catálogo", r"proveedor", r"precio", r"costo"
-        ]
-        if any(re.search(p, query_lower) for p in specs_patterns):
-            return "ESPECIFICACION"
-            
-        # Default a Metodología/General si no calza
-        return "GENERAL"
+        started = time.perf_counter()
+        self._classify_intent("warm-up")
+        timings = {"classifier": time.perf_counter() - started}
+        started = time.perf_counter()
+        for store in self.stores:
+            self.search_client.search("warm-up", store, 1)
+        timings["indexes"] = time.perf_counter() - started
+        return timings
 
-    def route_query(self, user_query: str, project_context: Dict[str, Any] = None) -> CoreResponse:
+    def _classify_intent(self, query: str) -> Tuple[str, Dict[str, float]]:
         """
-        Orquesta la consulta a los Stores adecuados.
+        Clasificación determinista de intención en una sola pasada (ver router/intent.py).
+
+        Returns:
+            tuple: (intención principal, puntajes por Store).
+        """
+        return self.classifier.classify(query)
+
+    def _route_by_similarity(self, query: str, hidden: Optional[Set[str]] = None) -> List[str]:
+        """
+        Store con el contenido más parecido a la consulta según el índice vectorial, para
+        consultas sin palabras clave de ningún Store. Los documentos `hidden` del Store D (de
+        otros proyectos) no cuentan, igual que en la búsqueda.
+        """
+        similarity = self.search_client.store_scores(query, {"D": hidden} if hidden else None)
+        best = max(similarity, key=similarity.get, default=None)
+        if best is None or similarity[best] < ROUTER_MIN_SIMILARITY:
+            return []
+        return [best]
+
+    def _select_stores(self, scores: Dict[str, float], project_context: Optional[Dict[str, Any]],
+                       fallback: List[str]) -> List[str]:
         """
-        intent = self._classify_intent(user_query)
-        target_store = "A" # Default
-        
-        if intent == "NORMATIVA":
-            target_store = "B"
-        elif intent == "ESPECIFICACION":
-            target_store = "C"
-            
-        # Ejecutar búsqueda (Retrieval)
-        # En producción, aquí se configura search_type='HYBRID'
-        results = self.search_client.search(user_query, self.stores[target_store], top_k=5)
-        
-        if not results:
-            return CoreResponse(
-                answer="Información no encontrada en la base normativa o técnica disponible.",
-                citations=[],
-                confidence_score=0.0
+        Stores a consultar: todos los que superan el umbral (p.ej. norma + catálogo), más el
+        Store D si hay un proyecto activo. El primero es el Store principal. Si ninguno supera
+        el umbral se usa `fallback` (los elegidos por similitud vectorial o el Store A).
+        """
+        stores = self.classifier.stores(scores) or list(fallback)
+        if project_context and project_context.get("project_id") and "D" not in stores:
+            stores.append("D")
+        return stores
+
+    def _project_view(self, project_id: Optional[str]) -> Tuple[str, Set[str]]:
+        """
+        Versión del contenido visible del proyecto (para la clave de caché) y documentos del
+        Store D que la búsqueda debe omitir.
+        """
+        return self.projects.scope(project_id), self.projects.hidden_documents(project_id)
+
+    async def _search_store(self, query: str, store: str, top_k: int, timeout: float,
+                            exclude: Optional[Set[str]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Búsqueda en un Store fuera del event loop, con timeout propio. `exclude` omite
+        documentos (los de otros proyectos en el Store D).
+
+        Returns:
+            tuple: (estado "ok" | "timeout" | "error", resultados).
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            results = await asyncio.wait_for(
+                loop.run_in_executor(None, self.search_client.search, query, store, top_k, exclude),
+                timeout
             )
-            
-        # Procesar resultados y generar respuesta (Synthesis) con Gemini Pro
-        citations = []
-        context_text = ""
-        
-        for res in results:
-            citations.append(Citation(
+            return "ok", results
+        except asyncio.TimeoutError:
+            print(f"WARN: Search in store {store} timed out after {timeout}s")
+            return "timeout", []
+        except Exception as e:
+            print(f"WARN: Search in store {store} failed: {e}")
+            return "error", []
+
+    @staticmethod
+    def _fuse_results(results_by_store: Dict[str, List[Dict[str, Any]]], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Combina los rankings de varios Stores con Reciprocal Rank Fusion.
+        """
+        fused: Dict[tuple, Dict[str, Any]] = {}
+        for store, results in results_by_store.items():
+            for rank, res in enumerate(results):
+                key = (res["document_id"], res["page_number"], res.get("start"))
+                entry = fused.setdefault(key, {**res, "store": store, "rrf_score": 0.0})
+                entry["rrf_score"] += 1.0 / (RRF_K + rank + 1)
+        return sorted(fused.values(), key=lambda r: r["rrf_score"], reverse=True)[:top_k]
+
+    async def _retrieve(self, user_query: str, project_context: Optional[Dict[str, Any]],
+                        stores: Optional[List[str]], top_k: Optional[int], timeout: float) -> Dict[str, Any]:
+        """
+        Clasificación, caché y búsqueda en paralelo; común a la respuesta completa y al streaming.
+
+        Returns:
+            dict: `intent`, `target_stores`, `cache_key`, `cached` (respuesta cacheada o None),
+            `results` fusionados, `metadata`, `timings` y `started`.
+        """
+        started = time.perf_counter()
+        top_k = top_k or ROUTER_TOP_K
+        project_id = (project_context or {}).get("project_id")
+        # Metadatos del proyecto activo (SQLite) fuera del event loop
+        scope, hidden = await asyncio.get_running_loop().run_in_executor(None, self._project_view, project_id)
+        intent, intent_scores = self._classify_intent(user_query)
+        # Sin palabras clave de ningún Store, la ruta por similitud se resuelve después de
+        # consultar la caché (la clave usa la marca SIMILARITY_ROUTE en lugar de los Stores)
+        target_stores = stores or self._select_stores(intent_scores, project_context, [SIMILARITY_ROUTE])
+        timings = {"classify_ms": round((time.perf_counter() - started) * 1000, 3)}
+        ctx = {"intent": intent, "target_stores": target_stores, "timings": timings, "started": started,
+               "results": [], "cached": None}
+
+        # Caché de respuestas (consulta normalizada + intención + Stores + versión de corpus);
+        # con el Store D, la versión incluye el manifiesto vigente del proyecto activo
+        corpus_version = CORPUS_VERSION
+        if "D" in target_stores:
+            corpus_version = f"{CORPUS_VERSION}:{scope}"
+        ctx["cache_key"] = self.cache.make_key(user_query, intent, target_stores, corpus_version)
+        ctx["cached"] = await self.cache.get_async(ctx["cache_key"])
+        if ctx["cached"] is not None:
+            return ctx
+
+        if SIMILARITY_ROUTE in target_stores:
+            routing_started = time.perf_counter()
+            similar = await asyncio.get_running_loop().run_in_executor(
+                None, self._route_by_similarity, user_query, hidden
+            )
+            target_stores = self._select_stores(intent_scores, project_context, similar or ["A"])
+            ctx["target_stores"] = target_stores
+            timings["routing_ms"] = round((time.perf_counter() - routing_started) * 1000, 3)
+
+        # Ejecutar búsqueda híbrida (Retrieval) en todos los Stores a la vez
+        retrieval_started = time.perf_counter()
+        searches = await asyncio.gather(*(
+            self._search_store(user_query, store, top_k, timeout, hidden if store == "D" else None)
+            for store in target_stores
+        ))
+        store_status = {store: status for store, (status, _) in zip(target_stores, searches)}
+        ctx["results"] = self._fuse_results(
+            {store: store_results for store, (_, store_results) in zip(target_stores, searches)}, top_k
+        )
+        timings["retrieval_ms"] = round((time.perf_counter() - retrieval_started) * 1000, 3)
+        ctx["metadata"] = {
+            "intent": intent,
+            "intent_scores": intent_scores,
+            "store_used": target_stores[0],
+            "stores_used": target_stores,
+            "store_status": store_status,
+        }
+        return ctx
+
+    @staticmethod
+    def _citations(results: List[Dict[str, Any]]) -> List[Citation]:
+        return [
+            Citation(
                 document_id=res["document_id"],
                 source_file=res["source_file"],
                 article_id=res.get("article_id"),
                 page_number=res["page_number"],
                 text_snippet=res["content"]
-            ))
-            context_text += f"--- Documento: {res['source_file']} (Página {res['page_number']}) ---\n{res['content']}\n\n"
-            
-        # Llamada real a Gemini 1.5 Pro
+            )
+            for res in results
+        ]
+
+    @staticmethod
+    def _build_prompt(user_query: str, results: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        """
+        Prompt de síntesis compacto con el contexto acotado al presupuesto de tokens.
+
+        Returns:
+            tuple: (prompt, contexto de build_context con `text`, `selected`, `tokens`, `dropped`).
+        """
+        context = build_context(user_query, results)
+        return build_prompt(user_query, context["text"]), context
+
+    @staticmethod
+    def _context_metadata(prompt: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "context_tokens": context["tokens"],
+            "prompt_tokens": estimate_tokens(prompt),
+            "snippets_used": len(context["selected"]),
+            "snippets_dropped": context["dropped"],
+        }
+
+    async def _finish(self, ctx: Dict[str, Any], user_query: str, response: CoreResponse) -> CoreResponse:
+        """
+        Cachea la respuesta si corresponde y completa la metadata de ejecución.
+        """
+        # Sólo se cachean respuestas sintetizadas correctamente, etiquetadas por documento y código
+        if response.confidence_score >= 0.9:
+            tags = [document_tag(c.document_id) for c in response.citations if c.document_id]
+            tags += [code_tag(code) for code in codes_in_text(user_query)]
+            await self.cache.set_async(ctx["cache_key"], response.model_dump(mode="json"), ctx["target_stores"], tags)
+
+        return self._observe(ctx, user_query, response, "miss")
+
+    def _cached_response(self, ctx: Dict[str, Any], user_query: str) -> CoreResponse:
+        return self._observe(ctx, user_query, CoreResponse(**ctx["cached"]), "hit")
+
+    def _not_found_response(self, ctx: Dict[str, Any], user_query: str) -> CoreResponse:
+        response = CoreResponse(
+            answer=NOT_FOUND_ANSWER,
+            citations=[],
+            confidence_score=0.0,
+            metadata=ctx["metadata"]
+        )
+        return self._observe(ctx, user_query, response, "miss")
+
+    def _observe(self, ctx: Dict[str, Any], user_query: str, response: CoreResponse, cache: str) -> CoreResponse:
+        """
+        Completa la metadata de ejecución (caché, tiempos, request ID) y registra la consulta
+        en métricas y trazas.
+        """
+        ctx["timings"]["total_ms"] = round((time.perf_counter() - ctx["started"]) * 1000, 3)
+        response.metadata.update({
+            "cache": cache, "timings": ctx["timings"], "request_id": current_request_id(), **self.cache.stats()
+        })
+        record_query(user_query, response.metadata)
+        return response
+
+    async def route_query(self, user_query: str, project_context: Dict[str, Any] = None,
+                          stores: Optional[List[str]] = None, top_k: Optional[int] = None,
+                          timeout: float = ROUTER_STORE_TIMEOUT) -> CoreResponse:
+        """
+        Orquesta la consulta a los Stores adecuados.
+
+        Los Stores se consultan en paralelo (cada uno con su top_k y timeout), los rankings se
+        combinan con Reciprocal Rank Fusion y la síntesis con Gemini corre fuera del event loop.
+
+        Args:
+            user_query: Pregunta del usuario.
+            project_context: Contexto del proyecto activo (si incluye `project_id` se consulta el Store D).
+            stores: Stores a consultar explícitamente; por defecto se infieren de la consulta.
+            top_k: Resultados por Store y resultados finales tras la fusión (por defecto ROUTER_TOP_K).
+            timeout: Tiempo máximo de búsqueda por Store (segundos).
+        """
+        loop = asyncio.get_running_loop()
+        ctx = await self._retrieve(user_query, project_context, stores, top_k, timeout)
+        if ctx["cached"] is not None:
+            return self._cached_response(ctx, user_query)
+        if not ctx["results"]:
+            return self._not_found_response(ctx, user_query)
+
+        # Procesar resultados y generar respuesta (Synthesis) con Gemini Pro
+        prompt, context = self._build_prompt(user_query, ctx["results"])
+        citations = self._citations(context["selected"])
+        ctx["metadata"].update(self._context_metadata(prompt, context))
+
+        # Llamada real a Gemini 1.5 Pro (bloqueante, se ejecuta en thread pool)
+        synthesis_started = time.perf_counter()
         try:
-            model = genai.GenerativeModel('gemini-1.5-pro')
-            
-            system_instruction = """
-            Eres un asistente técnico experto en construcción y normativa BIM.
-            Responde a la consulta del usuario basándote EXCLUSIVAMENTE en el contexto proporcionado.
-            SIEMPRE cita el nombre del archivo y el número de página al final de cada afirmación relevante.
-            Si la información no está en el contexto, indícalo claramente.
-            """
-            
-            prompt = f"""
-            {system_instruction}
-            
-            CONTEXTO RECUPERADO:
-            {context_text}
-            
-            CONSULTA DEL USUARIO:
-            {user_query}
-            """
-            
-            response = model.generate_content(prompt)
-            synthesized_answer = response.text
+            synthesized_answer = await loop.run_in_executor(None, self._generate, prompt)
             confidence = 0.9 # Estimado
-            
+
         except Exception as e:
             print(f"Error generando respuesta con Gemini: {e}")
-            synthesized_answer = f"Error al generar respuesta detallada. Contexto encontrado:\n\n{context_text}"
+            synthesized_answer = f"Error al generar respuesta detallada. Contexto encontrado:\n\n{context['text']}"
             confidence = 0.5
-        
-        return CoreResponse(
+        ctx["timings"]["synthesis_ms"] = round((time.perf_counter() - synthesis_started) * 1000, 3)
+
+        response = CoreResponse(
             answer=synthesized_answer,
             citations=citations,
             confidence_score=confidence,
-            metadata={"intent": intent, "store_used": target_store}
+            metadata=ctx["metadata"]
         )
+        return await self._finish(ctx, user_query, response)
+
+    @staticmethod
+    def _generate(prompt: str) -> str:
+        """
+        Respuesta completa de Gemini. Corre en un hilo: la primera llamada también importa el
+        SDK y crea el modelo (ver clients.get_model), que no debe bloquear el event loop.
+        """
+        return get_model(SYNTHESIS_MODEL).generate_content(prompt).text
+
+    @staticmethod
+    async def _generate_stream(prompt: str) -> AsyncGenerator[str, None]:
+        """
+        Fragmentos de texto de Gemini a medida que se generan. El iterador del SDK es
+        bloqueante, así que se consume en un hilo y se entrega al event loop por una cola; si
+        el consumidor se va (p.ej. el cliente se desconecta), el hilo deja de leer el stream.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        done = object()
+        cancelled = threading.Event()
+
+        def pump():
+            try:
+                model = get_model(SYNTHESIS_MODEL)
+                for chunk in model.generate_content(prompt, stream=True):
+                    if cancelled.is_set():
+                        return
+                    text = getattr(chunk, "text", "")
+                    if text:
+                        loop.call_soon_threadsafe(queue.put_nowait, text)
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+            except Exception as e:
+                if not cancelled.is_set():
+                    loop.call_soon_threadsafe(queue.put_nowait, e)
+
+        loop.run_in_executor(None, pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancelled.set()
+
+    async def stream_query(self, user_query: str, project_context: Dict[str, Any] = None,
+                           stores: Optional[List[str]] = None, top_k: Optional[int] = None,
+                           timeout: float = ROUTER_STORE_TIMEOUT) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Variante en streaming de `route_query`.
+
+        Emite frames en orden: `citations` apenas termina la búsqueda, `token` por cada
+        fragmento de la respuesta y `metadata` al final (confianza, intención y tiempos). Si
+        la consulta falla (p.ej. en la búsqueda), el último frame es `error`.
+        """
+        try:
+            async for frame in self._stream_frames(user_query, project_context, stores, top_k, timeout):
+                yield frame
+        except Exception as e:
+            print(f"ERROR: Streaming query failed: {e}")
+            yield {"type": "error", "error": str(e)}
+
+    async def _stream_frames(self, user_query: str, project_context: Optional[Dict[str, Any]],
+                             stores: Optional[List[str]], top_k: Optional[int],
+                             timeout: float) -> AsyncGenerator[Dict[str, Any], None]:
+        ctx = await self._retrieve(user_query, project_context, stores, top_k, timeout)
+        if ctx["cached"] is not None:
+            response = self._cached_response(ctx, user_query)
+        elif not ctx["results"]:
+            response = self._not_found_response(ctx, user_query)
+        else:
+            response = None
+
+        if response is not None:
+            yield {"type": "citations", "citations": [c.model_dump(mode="json") for c in response.citations]}
+            yield {"type": "token", "text": response.answer}
+            yield {"type": "metadata", "confidence_score": response.confidence_score, "metadata": response.metadata}
+            return
+
+        prompt, context = self._build_prompt(user_query, ctx["results"])
+        citations = self._citations(context["selected"])
+        ctx["metadata"].update(self._context_metadata(prompt, context))
+        ctx["timings"]["first_frame_ms"] = round((time.perf_counter() - ctx["started"]) * 1000, 3)
+        yield {"type": "citations", "citations": [c.model_dump(mode="json") for c in citations]}
+
+        synthesis_started = time.perf_counter()
+        parts = []
+        try:
+            async for text in self._generate_stream(prompt):
+                if not parts:
+                    ctx["timings"]["first_token_ms"] = round((time.perf_counter() - ctx["started"]) * 1000, 3)
+                parts.append(text)
+                yield {"type": "token", "text": text}
+            confidence = 0.9 # Estimado
+        except Exception as e:
+            print(f"Error generando respuesta con Gemini: {e}")
+            fallback = f"Error al generar respuesta detallada. Contexto encontrado:\n\n{context['text']}"
+            # Lo ya emitido se conserva; el respaldo se agrega como un último fragmento
+            parts.append(fallback)
+            yield {"type": "token", "text": fallback}
+            confidence = 0.5
+        ctx["timings"]["synthesis_ms"] = round((time.perf_counter() - synthesis_started) * 1000, 3)
+
+        response = await self._finish(ctx, user_query, CoreResponse(
+            answer="".join(parts),
+            citations=citations,
+            confidence_score=confidence,
+            metadata=ctx["metadata"]
+        ))
+        yield {"type": "metadata", "confidence_score": response.confidence_score, "metadata": response.metadata}
@@ -0,0 +1,146 @@
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.services.data_core.index.text import fold_accents
+
+# Puntaje mínimo para consultar un Store
+INTENT_MIN_SCORE = float(os.getenv("INTENT_MIN_SCORE", "0.5"))
+
+# Intención principal por Store (compatible con las claves de caché y la metadata existentes)
+STORE_INTENTS = {"B": "NORMATIVA", "C": "ESPECIFICACION", "A": "GENERAL", "D": "GENERAL"}
+# Desempate cuando dos Stores tienen el mismo puntaje
+STORE_PRIORITY = ("B", "C", "A", "D")
+
+# Términos por Store, ya sin tildes (la consulta se pliega antes de buscar); aceptan plural
+STORE_TERMS: Dict[str, List[str]] = {
+    # Normativa (RNE, leyes, reglamentos)
+    "B": [
+        "norma", "normativa", "reglamento", "rne", "ley", "decreto", "decreto supremo",
+        "resolucion ministerial", "articulo", "inciso", "capitulo", "disposicion", "ntp",
+        "norma tecnica", "reglamentario", "exigencia", "segun la norma", "minimo exigido",
+    ],
+    # Especificaciones (fichas técnicas, catálogos, proveedores)
+    "C": [
+        "ficha tecnica", "hoja tecnica", "especificacion tecnica", "resistencia", "dosificacion",
+        "rendimiento", "catalogo", "proveedor", "precio", "costo", "cotizacion", "fabricante",
+        "marca", "producto", "aditivo", "slump", "mpa", "kg/cm2",
+    ],
+    # Metodología (guías, BEP, ISO 19650)
+    "A": [
+        "metodologia", "bim", "bep", "plan de ejecucion bim", "iso 19650", "lod", "loi", "cde",
+        "entorno comun de datos", "flujo de trabajo", "guia", "procedimiento", "interoperabilidad",
+        "ifc", "clash", "deteccion de interferencia", "coordinacion", "modelado", "estandar",
+    ],
+    # Contexto del proyecto activo (memorias, estudios de suelos)
+    "D": [
+        "mi proyecto", "nuestro proyecto", "este proyecto", "del proyecto", "memoria descriptiva",
+        "estudio de suelo", "expediente tecnico", "plano", "metrado", "presupuesto de obra",
+        "cronograma", "este edificio",
+    ],
+}
+
+# Patrones (regex sobre texto plegado) con su peso; un código de norma es evidencia fuerte
+STORE_PATTERNS: Dict[str, List[Tuple[str, float]]] = {
+    "B": [
+        (r"(?:ge|th|ce|os|is|ec|em|g|a|e)\.\s?\d{3}", 2.0),
+        (r"d\.?\s?s\.?\s?n?\s?\d{1,4}-\d{4}", 2.0),
+    ],
+    "C": [
+        (r"f'?c\s?=?\s?\d{3}", 1.0),
+    ],
+    "A": [],
+    "D": [],
+}
+
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """
+    Regex compacta para un conjunto de literales, factorizando prefijos comunes en un trie
+    (el costo de la alternancia crece con la profundidad, no con la cantidad de términos).
+    """
+    trie: Dict = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        optional = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if optional:
+            body = f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+
+class IntentClassifier:
+    """
+    Clasificador de intención en una sola pasada.
+
+    Todas las reglas se combinan en una única regex precompilada con un grupo con nombre por
+    regla; la consulta se pliega (minúsculas, sin tildes) y se recorre una sola vez con
+    `finditer`. El resultado son puntajes por Store (multi-etiqueta), no una sola intención.
+    """
+
+    def __init__(self, terms: Dict[str, List[str]] = STORE_TERMS,
+                 patterns: Dict[str, List[Tuple[str, float]]] = STORE_PATTERNS,
+                 min_score: float = INTENT_MIN_SCORE):
+        self.min_score = min_score
+        self._weights: Dict[str, Tuple[str, float]] = {}
+        groups = []
+        for store in STORE_PRIORITY:
+            store_terms = [fold_accents(t) for t in terms.get(store, [])]
+            if store_terms:
+                # Plurales: "zapatas", "normas", "planos"
+                groups.append(self._group(store, 1.0, f"{_trie_pattern(store_terms)}(?:e?s)?"))
+            for pattern, weight in patterns.get(store, []):
+                groups.append(self._group(store, weight, pattern))
+        self.pattern = re.compile(r"(?<![\w.])(?:" + "|".join(groups) + r")(?![\w])")
+
+    def _group(self, store: str, weight: float, pattern: str) -> str:
+        name = f"r{len(self._weights)}"
+        self._weights[name] = (store, weight)
+        return f"(?P<{name}>{pattern})"
+
+    def scores(self, query: str) -> Dict[str, float]:
+        """
+        Puntaje por Store entre 0 y 1: cada coincidencia (ponderada) reduce a la mitad la
+        distancia a 1 (una coincidencia = 0.5, dos = 0.75...).
+        """
+        hits = {store: 0.0 for store in STORE_PRIORITY}
+        for match in self.pattern.finditer(fold_accents(query)):
+            store, weight = self._weights[match.lastgroup]
+            hits[store] += weight
+        return {store: round(1.0 - 0.5 ** hit, 4) for store, hit in hits.items()}
+
+    def stores(self, scores: Dict[str, float]) -> List[str]:
+        """
+        Stores que superan el umbral, del más al menos probable.
+        """
+        selected = [s for s in STORE_PRIORITY if scores.get(s, 0.0) >= self.min_score]
+        return sorted(selected, key=lambda s: -scores[s])
+
+    def classify(self, query: str) -> Tuple[str, Dict[str, float]]:
+        """
+        Intención principal (NORMATIVA / ESPECIFICACION / GENERAL) y puntajes por Store.
+        """
+        scores = self.scores(query)
+        selected = self.stores(scores)
+        intent = STORE_INTENTS[selected[0]] if selected else "GENERAL"
+        return intent, scores
+
+
+_classifier: Optional[IntentClassifier] = None
+
+
+def get_intent_classifier() -> IntentClassifier:
+    global _classifier
+    if _classifier is None:
+        _classifier = IntentClassifier()
+    return _classifier
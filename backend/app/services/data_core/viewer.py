@@ -0,0 +1,269 @@
+import os
+import re
+import time
+import difflib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from app.services.data_core.observability import metrics
+
+# Caché en disco de páginas renderizadas (PNG) y su tamaño máximo
+PAGE_CACHE_PATH = Path(os.getenv("PAGE_CACHE_PATH", "./data/cache/pages"))
+PAGE_CACHE_MAX_MB = int(os.getenv("PAGE_CACHE_MAX_MB", "512"))
+# Resolución de render admitida (72 dpi = 1 px por punto PDF)
+VIEWER_DEFAULT_DPI = int(os.getenv("VIEWER_DEFAULT_DPI", "110"))
+VIEWER_MIN_DPI = 36
+VIEWER_MAX_DPI = int(os.getenv("VIEWER_MAX_DPI", "300"))
+# Palabras seguidas que deben coincidir para resaltar un tramo del fragmento
+VIEWER_HIGHLIGHT_MIN_RUN = int(os.getenv("VIEWER_HIGHLIGHT_MIN_RUN", "3"))
+
+_WORD_RE = re.compile(r"\w+")
+
+metrics.describe("viewer_page_cache_total", "Peticiones de páginas renderizadas por resultado de caché")
+metrics.describe("viewer_render_seconds", "Duración del render de una página")
+
+
+class PageCache:
+    """
+    Caché LRU en disco acotada por tamaño para las páginas renderizadas.
+
+    Cada entrada es un archivo en `root`; el orden de uso se lleva en memoria y se
+    reconstruye al arrancar a partir de la fecha de modificación (que se actualiza en cada
+    acierto). Al superar `max_bytes` se borran las entradas menos usadas.
+    """
+
+    def __init__(self, root: Path = PAGE_CACHE_PATH, max_bytes: int = PAGE_CACHE_MAX_MB * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        files = []
+        for path in self.root.iterdir():
+            if path.name.endswith(".tmp"):
+                path.unlink(missing_ok=True)
+            elif path.is_file():
+                stat = path.stat()
+                files.append((stat.st_mtime, path.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        path = self.root / key
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            # Borrada por fuera (o desalojada entre medio): se olvida la entrada
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+            return None
+        return data
+
+    def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = self.root / key
+        tmp_path = path.with_name(f"{key}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            (self.root / key).unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes}
+
+
+class DocumentViewer:
+    """
+    Servicio de páginas para el visor de citas: imágenes de página a una resolución dada
+    (con caché en disco), texto por página y rectángulos a resaltar para un fragmento.
+
+    Las citas usan la numeración del documento original (1-based); el PDF saneado puede
+    haber descartado páginas separadoras, así que se traduce con el `page_map` del registro.
+    """
+
+    def __init__(self, registry, cache: Optional[PageCache] = None):
+        self.registry = registry
+        self.cache = cache if cache is not None else PageCache()
+        self._render_locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def document(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Registro del documento si existe y su PDF saneado sigue en disco.
+        """
+        record = self.registry.get(document_id)
+        if record is None or not record.get("local_path") or not Path(record["local_path"]).exists():
+            return None
+        return record
+
+    @staticmethod
+    def page_index(record: Dict[str, Any], page_number: int) -> int:
+        """
+        Índice (0-based) en el PDF saneado de una página del documento original.
+
+        Raises:
+            LookupError: Si la página no existe o fue descartada al sanear.
+        """
+        page_map = record.get("page_map")
+        if page_map:
+            try:
+                return page_map.index(page_number - 1)
+            except ValueError:
+                raise LookupError(f"Página {page_number} no disponible en {record['original_name']}")
+        if page_number < 1:
+            raise LookupError(f"Página {page_number} no disponible en {record['original_name']}")
+        return page_number - 1
+
+    @staticmethod
+    def clamp_dpi(dpi: Optional[int]) -> int:
+        return max(VIEWER_MIN_DPI, min(VIEWER_MAX_DPI, dpi or VIEWER_DEFAULT_DPI))
+
+    @staticmethod
+    def etag(record: Dict[str, Any], *parts: Any) -> str:
+        """
+        ETag fuerte derivado del hash del PDF saneado (el contenido nunca cambia para un hash).
+        """
+        suffix = "".join(f"-{part}" for part in parts)
+        return f'"{record["clean_hash"][:32]}{suffix}"'
+
+    @staticmethod
+    def _open_page(record: Dict[str, Any], page_index: int) -> Tuple[fitz.Document, fitz.Page]:
+        doc = fitz.open(record["local_path"])
+        if page_index >= doc.page_count:
+            doc.close()
+            raise LookupError(f"Página fuera de rango en {record['original_name']}")
+        return doc, doc[page_index]
+
+    def render_page(self, record: Dict[str, Any], page_number: int, dpi: Optional[int] = None) -> bytes:
+        """
+        PNG de la página a la resolución pedida. Las páginas ya renderizadas salen de la
+        caché; las peticiones simultáneas de la misma página esperan a un único render.
+        """
+        dpi = self.clamp_dpi(dpi)
+        page_index = self.page_index(record, page_number)
+        key = f"{record['clean_hash']}-{page_index}-{dpi}.png"
+
+        data = self.cache.get(key)
+        if data is not None:
+            metrics.inc("viewer_page_cache_total", result="hit")
+            return data
+
+        with self._locks_guard:
+            lock = self._render_locks.setdefault(key, threading.Lock())
+        try:
+            with lock:
+                data = self.cache.get(key)
+                if data is not None:
+                    metrics.inc("viewer_page_cache_total", result="hit")
+                    return data
+                metrics.inc("viewer_page_cache_total", result="miss")
+                started = time.perf_counter()
+                doc, page = self._open_page(record, page_index)
+                try:
+                    data = page.get_pixmap(dpi=dpi, annots=False).tobytes("png")
+                finally:
+                    doc.close()
+                metrics.observe("viewer_render_seconds", time.perf_counter() - started)
+                self.cache.put(key, data)
+        finally:
+            with self._locks_guard:
+                self._render_locks.pop(key, None)
+        return data
+
+    def page_text(self, record: Dict[str, Any], page_number: int) -> Dict[str, Any]:
+        """
+        Texto de la página y sus dimensiones en puntos PDF.
+        """
+        doc, page = self._open_page(record, self.page_index(record, page_number))
+        try:
+            return {
+                "page_number": page_number,
+                "width": page.rect.width,
+                "height": page.rect.height,
+                "text": page.get_text("text"),
+            }
+        finally:
+            doc.close()
+
+    @staticmethod
+    def _word_rects(page: fitz.Page, words: List[str]) -> List[fitz.Rect]:
+        """
+        Rectángulos de los tramos de la página que coinciden palabra a palabra con el
+        fragmento (sin puntuación ni mayúsculas), unidos por línea.
+        """
+        page_words = page.get_text("words", sort=True)
+        # Un token por palabra del fragmento; "E.030" aporta dos tokens de la misma palabra
+        page_tokens, owners = [], []
+        for position, w in enumerate(page_words):
+            for token in _WORD_RE.findall(w[4].lower()):
+                page_tokens.append(token)
+                owners.append(position)
+        matcher = difflib.SequenceMatcher(None, page_tokens, words, autojunk=False)
+        min_run = min(VIEWER_HIGHLIGHT_MIN_RUN, len(words))
+        lines: Dict[Tuple[int, int], fitz.Rect] = {}
+        for block in matcher.get_matching_blocks():
+            if block.size < min_run:
+                continue
+            for position in sorted(set(owners[block.a:block.a + block.size])):
+                w = page_words[position]
+                line_key = (w[5], w[6])
+                rect = fitz.Rect(w[:4])
+                lines[line_key] = lines[line_key] | rect if line_key in lines else rect
+        return list(lines.values())
+
+    def highlights(self, record: Dict[str, Any], page_number: int, text: str) -> Dict[str, Any]:
+        """
+        Rectángulos (en puntos PDF, origen arriba a la izquierda) donde aparece el fragmento.
+
+        Primero se busca el fragmento completo; si no aparece tal cual (guiones de corte,
+        espacios, puntuación, texto recortado), se resaltan los tramos de al menos
+        VIEWER_HIGHLIGHT_MIN_RUN palabras seguidas que coinciden con la página.
+        Para dibujarlos sobre la imagen basta escalar por dpi / 72.
+        """
+        snippet = re.sub(r"\s+", " ", text or "").strip()
+        doc, page = self._open_page(record, self.page_index(record, page_number))
+        try:
+            rects: List[fitz.Rect] = []
+            if snippet:
+                rects = page.search_for(snippet)
+                if not rects:
+                    rects = self._word_rects(page, _WORD_RE.findall(snippet.lower()))
+            seen = set()
+            result = []
+            for rect in rects:
+                coords = tuple(round(v, 2) for v in (rect.x0, rect.y0, rect.x1, rect.y1))
+                if coords not in seen:
+                    seen.add(coords)
+                    result.append(coords)
+            return {
+                "page_number": page_number,
+                "width": page.rect.width,
+                "height": page.rect.height,
+                "rects": result,
+            }
+        finally:
+            doc.close()
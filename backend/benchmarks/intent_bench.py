@@ -0,0 +1,87 @@
+"""
+Micro-benchmark y evaluación del clasificador de intención del Router.
+
+Uso (desde backend/):
+    python -m benchmarks.intent_bench [--iterations 20000] [--extra-terms 500]
+
+Mide la exactitud contra el set etiquetado (benchmarks/intent_queries.jsonl) y la latencia
+por consulta, también con cientos de términos sintéticos agregados para verificar que el
+costo se mantiene en microsegundos a medida que crecen las reglas.
+"""
+import json
+import time
+import random
+import string
+import argparse
+from pathlib import Path
+
+from app.services.data_core.router.intent import IntentClassifier, STORE_TERMS, STORE_PATTERNS
+
+QUERIES_PATH = Path(__file__).parent / "intent_queries.jsonl"
+
+
+def load_queries(path: Path = QUERIES_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(classifier: IntentClassifier, queries):
+    exact, primary, errors = 0, 0, []
+    for item in queries:
+        predicted = classifier.stores(classifier.scores(item["query"]))
+        expected = item["stores"]
+        if set(predicted) == set(expected):
+            exact += 1
+        if (predicted[:1] or [None])[0] in (expected or [None]):
+            primary += 1
+        if set(predicted) != set(expected):
+            errors.append({"query": item["query"], "expected": expected, "predicted": predicted})
+    return {"exact": exact / len(queries), "primary": primary / len(queries), "errors": errors}
+
+
+def time_per_query_us(classifier: IntentClassifier, queries, iterations: int) -> dict:
+    texts = [item["query"] for item in queries]
+    samples = []
+    for i in range(iterations):
+        text = texts[i % len(texts)]
+        started = time.perf_counter_ns()
+        classifier.classify(text)
+        samples.append((time.perf_counter_ns() - started) / 1000)
+    samples.sort()
+    return {
+        "p50_us": round(samples[len(samples) // 2], 2),
+        "p99_us": round(samples[int(len(samples) * 0.99)], 2),
+        "mean_us": round(sum(samples) / len(samples), 2),
+    }
+
+
+def synthetic_terms(count: int, seed: int = 7):
+    rng = random.Random(seed)
+    terms = {store: list(values) for store, values in STORE_TERMS.items()}
+    stores = list(terms)
+    for i in range(count):
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 10)))
+        terms[stores[i % len(stores)]].append(f"{word}{i}")
+    return terms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--extra-terms", type=int, default=500)
+    args = parser.parse_args()
+
+    queries = load_queries()
+    base = IntentClassifier()
+    grown = IntentClassifier(synthetic_terms(args.extra_terms), STORE_PATTERNS)
+    result = {
+        "queries": len(queries),
+        "accuracy": evaluate(base, queries),
+        "latency": time_per_query_us(base, queries, args.iterations),
+        "latency_with_extra_terms": {"extra_terms": args.extra_terms, **time_per_query_us(grown, queries, args.iterations)},
+    }
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
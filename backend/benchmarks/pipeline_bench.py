@@ -0,0 +1,457 @@
+"""
+Benchmark reproducible de los caminos críticos de ingesta y consulta.
+
+Uso (desde backend/):
+    python -m benchmarks.pipeline_bench [--sizes 10,100,1000] [--mixes text,image,mixed]
+        [--upload-latency 0.2] [--search-latency 0.02] [--llm-latency 0.5]
+        [--output benchmarks/results/<commit>.json] [--compare benchmarks/results/<base>.json]
+
+Genera PDFs sintéticos con PyMuPDF (texto denso, imágenes y separadores en blanco) y mide:
+
+- `sanitize`: `clean_document_to_path` aislado (páginas/s, páginas conservadas, pico de RSS).
+- `ingest`: `DataCoreEngine.process_document` completo, con el Files API simulado
+  (`FakeFilesAPI`) y la duración de cada etapa tomada de su traza.
+- `query`: `DataCoreRouter.route_query` sobre el corpus ingerido, con latencia configurable
+  en la búsqueda y un modelo Gemini simulado (p50/p99 con caché fría y caliente).
+- `upload`: throughput del `GeminiUploader` a distintos niveles de concurrencia.
+
+No usa red ni API Key: todo el estado (registro, índice, almacenamiento) vive en un
+directorio temporal. El resultado es un JSON comparable entre commits; con `--compare` se
+listan las métricas que empeoraron más allá de `--tolerance` y el proceso termina con código 1.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, Any, List, Optional
+
+RESULTS_DIR = Path(__file__).parent / "results"
+QUERIES_PATH = Path(__file__).parent / "intent_queries.jsonl"
+
+# Vocabulario de las normas sintéticas
+_WORDS = (
+    "diseño sismorresistente zonificación suelo perfil estrato factor amplificación periodo "
+    "fundamental estructura concreto armado resistencia compresión acero refuerzo muro "
+    "albañilería confinada columna viga losa cimentación zapata carga muerta viva sismo "
+    "deriva desplazamiento lateral rigidez irregularidad torsional análisis dinámico modal "
+    "espectral cortante basal edificación categoría importancia uso ocupación"
+).split()
+
+
+# ---------------------------------------------------------------------------
+# PDFs sintéticos
+# ---------------------------------------------------------------------------
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _noise_images(count: int, width: int = 240, height: int = 180, seed: int = 11) -> List[bytes]:
+    """
+    Imágenes de ruido (no comprimen bien, como un escaneo o una foto de obra).
+    """
+    import fitz
+
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        samples = bytes(rng.getrandbits(8) for _ in range(width * height * 3))
+        images.append(fitz.Pixmap(fitz.csRGB, width, height, samples, False).tobytes("png"))
+    return images
+
+
+def _page_kind(mix: str, page_number: int) -> str:
+    if mix == "text":
+        return "text"
+    if mix == "image":
+        return "image"
+    # mixed: un separador en blanco cada 10 páginas y una lámina cada 4
+    if page_number % 10 == 9:
+        return "blank"
+    if page_number % 4 == 3:
+        return "image"
+    return "text"
+
+
+def make_pdf(path: Path, pages: int, mix: str, seed: int = 7) -> Dict[str, int]:
+    """
+    Genera una norma sintética de `pages` páginas: encabezado y pie repetidos (los quita el
+    sanitizador), artículos numerados con texto denso, láminas con imágenes y separadores.
+
+    Returns:
+        dict: cantidad de páginas por tipo.
+    """
+    import fitz
+
+    rng = random.Random(seed)
+    images = _noise_images(8)
+    image_xrefs: Dict[int, int] = {}
+    kinds = {"text": 0, "image": 0, "blank": 0}
+    article = 1
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page(width=595, height=842)
+        kind = _page_kind(mix, page_number)
+        kinds[kind] += 1
+        if kind == "blank":
+            continue
+        page.insert_text((50, 40), "NORMA E.030 DISEÑO SISMORRESISTENTE", fontsize=8)
+        page.insert_text((270, 815), f"Página {page_number + 1}", fontsize=8)
+        if kind == "text":
+            y = 80
+            while y < 760:
+                page.insert_text((50, y), f"Artículo {article}.- {rng.choice(_WORDS).capitalize()}", fontsize=11)
+                box = fitz.Rect(50, y + 8, 545, y + 110)
+                page.insert_textbox(box, _paragraph(rng, 70), fontsize=9)
+                article += 1
+                y += 125
+        else:
+            slot = page_number % len(images)
+            for row in range(2):
+                for col in range(2):
+                    rect = fitz.Rect(60 + col * 250, 90 + row * 330, 290 + col * 250, 390 + row * 330)
+                    if slot in image_xrefs:
+                        page.insert_image(rect, xref=image_xrefs[slot])
+                    else:
+                        image_xrefs[slot] = page.insert_image(rect, stream=images[slot])
+                    slot = (slot + 1) % len(images)
+            page.insert_text((60, 760), f"Figura {page_number + 1}. {_paragraph(rng, 8)}", fontsize=9)
+    doc.save(str(path), garbage=1, deflate=True)
+    doc.close()
+    return kinds
+
+
+# ---------------------------------------------------------------------------
+# Memoria
+# ---------------------------------------------------------------------------
+
+def reset_peak_rss() -> bool:
+    """
+    Reinicia el pico de RSS del proceso (Linux: escribir 5 en /proc/self/clear_refs).
+    Sin soporte, el pico reportado es el acumulado desde el inicio del proceso.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50_ms": 0.0, "p99_ms": 0.0, "mean_ms": 0.0}
+    return {
+        "p50_ms": round(ordered[len(ordered) // 2], 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Backends simulados
+# ---------------------------------------------------------------------------
+
+class DelayedSearch:
+    """
+    Envuelve el índice de búsqueda real agregando la latencia de red de un servicio de búsqueda.
+    """
+
+    def __init__(self, index, latency: float):
+        self.index = index
+        self.latency = latency
+
+    def search(self, query: str, store_id: str, top_k: int = 5, exclude=None):
+        time.sleep(self.latency)
+        return self.index.search(query, store_id, top_k, exclude)
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+
+class FakeGenerativeModel:
+    """
+    Sustituto del modelo de síntesis (`clients.get_model`): responde tras `latency` segundos.
+    """
+
+    latency = 0.0
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        time.sleep(self.latency)
+        text = f"Respuesta simulada ({len(prompt)} caracteres de prompt) [1]."
+        if stream:
+            return iter([SimpleNamespace(text=part) for part in text.split(" ")])
+        return SimpleNamespace(text=text)
+
+
+# ---------------------------------------------------------------------------
+# Casos
+# ---------------------------------------------------------------------------
+
+def bench_sanitize(pdf: Path, pages: int, work_dir: Path, workers: Optional[int]) -> Dict[str, Any]:
+    import fitz
+    from app.services.data_core.librarian.sanitizer import clean_document_to_path
+
+    output = work_dir / f"{pdf.stem}.clean.pdf"
+    reset_peak_rss()
+    started = time.perf_counter()
+    clean_document_to_path(str(pdf), output, workers=workers)
+    elapsed = time.perf_counter() - started
+    with fitz.open(str(output)) as doc:
+        kept = doc.page_count
+    output.unlink()
+    return {
+        "seconds": round(elapsed, 4),
+        "pages_per_sec": round(pages / elapsed, 2),
+        "pages_kept": kept,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+async def bench_ingest(engine, pdf: Path, pages: int) -> Dict[str, Any]:
+    from app.services.data_core.observability import traces
+
+    reset_peak_rss()
+    started = time.perf_counter()
+    status = "ERROR"
+    async for line in engine.process_document(str(pdf), pdf.name):
+        if line.startswith("SUCCESS") or line.startswith("ERROR"):
+            status = line.split(":", 1)[0]
+    elapsed = time.perf_counter() - started
+    trace = next(iter(traces.recent(limit=1, kind="ingest")), {"spans": []})
+    return {
+        "status": status,
+        "seconds": round(elapsed, 4),
+        "pages_per_sec": round(pages / elapsed, 2),
+        "peak_rss_mb": peak_rss_mb(),
+        "stages_ms": {span["stage"]: span["duration_ms"] for span in trace["spans"]},
+    }
+
+
+def _query_set(limit: int) -> List[str]:
+    queries = []
+    if QUERIES_PATH.exists():
+        with open(QUERIES_PATH, "r", encoding="utf-8") as f:
+            queries = [json.loads(line)["query"] for line in f if line.strip()]
+    rng = random.Random(3)
+    # Consultas que sí encuentran el corpus sintético (llegan a la síntesis)
+    for i in range(limit):
+        queries.append(f"artículo {rng.randint(1, 200)} norma E.030 {rng.choice(_WORDS)} {rng.choice(_WORDS)}")
+    return queries
+
+
+async def bench_query(router, iterations: int) -> Dict[str, Any]:
+    queries = _query_set(iterations)
+    router.cache.backend.clear()
+    cold, warm, synthesized = [], [], 0
+    for query in queries:
+        started = time.perf_counter()
+        response = await router.route_query(query)
+        cold.append((time.perf_counter() - started) * 1000)
+        synthesized += "synthesis_ms" in response.metadata.get("timings", {})
+    for query in queries:
+        started = time.perf_counter()
+        await router.route_query(query)
+        warm.append((time.perf_counter() - started) * 1000)
+    return {
+        "queries": len(queries),
+        "synthesized": synthesized,
+        "cold": percentiles(cold),
+        "warm": percentiles(warm),
+    }
+
+
+async def bench_upload(files: int, concurrency_levels: List[int], latency: float, processing: float) -> Dict[str, Any]:
+    from app.services.data_core.librarian.uploader import GeminiUploader, FakeFilesAPI
+
+    results = {}
+    for concurrency in concurrency_levels:
+        uploader = GeminiUploader(FakeFilesAPI(latency, processing), max_concurrency=concurrency,
+                                  backoff_base=0.05, backoff_max=0.5)
+        started = time.perf_counter()
+        await asyncio.gather(*(uploader.upload(Path(f"doc_{i}.pdf")) for i in range(files)))
+        elapsed = time.perf_counter() - started
+        results[str(concurrency)] = {"seconds": round(elapsed, 3), "files_per_sec": round(files / elapsed, 2)}
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Comparación
+# ---------------------------------------------------------------------------
+
+def _comparable(result: Dict[str, Any]) -> Dict[str, tuple]:
+    """
+    Métricas comparables entre corridas: nombre -> (valor, True si más alto es mejor).
+    """
+    metrics = {}
+    for case, values in result.get("sanitize", {}).items():
+        metrics[f"sanitize.{case}.pages_per_sec"] = (values["pages_per_sec"], True)
+        metrics[f"sanitize.{case}.peak_rss_mb"] = (values["peak_rss_mb"], False)
+    for case, values in result.get("ingest", {}).items():
+        metrics[f"ingest.{case}.pages_per_sec"] = (values["pages_per_sec"], True)
+        metrics[f"ingest.{case}.peak_rss_mb"] = (values["peak_rss_mb"], False)
+    for phase in ("cold", "warm"):
+        for key in ("p50_ms", "p99_ms"):
+            value = result.get("query", {}).get(phase, {}).get(key)
+            if value is not None:
+                metrics[f"query.{phase}.{key}"] = (value, False)
+    for level, values in result.get("upload", {}).items():
+        metrics[f"upload.c{level}.files_per_sec"] = (values["files_per_sec"], True)
+    return metrics
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """
+    Métricas que empeoraron más de `tolerance` (fracción) respecto de la línea base.
+    """
+    base_metrics = _comparable(baseline)
+    regressions = []
+    for name, (value, higher_is_better) in _comparable(current).items():
+        if name not in base_metrics or not base_metrics[name][0]:
+            continue
+        base = base_metrics[name][0]
+        change = (value - base) / base
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append({"metric": name, "baseline": base, "current": value, "change": round(change, 3)})
+    return regressions
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short=12", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _configure_environment(data_dir: Path):
+    """
+    Estado aislado en un directorio temporal y modo sin API Key (Files API y tagger locales).
+    Debe ejecutarse antes de importar los módulos de la app, que leen el entorno al cargarse.
+    """
+    os.environ["GOOGLE_API_KEY"] = ""
+    os.environ["LOCAL_STORAGE_PATH"] = str(data_dir / "storage")
+    os.environ["REGISTRY_PATH"] = str(data_dir / "registry.json")
+    os.environ["REGISTRY_DB_PATH"] = str(data_dir / "registry.db")
+    os.environ["LEXICAL_INDEX_PATH"] = str(data_dir / "index" / "lexical")
+    os.environ["VECTOR_INDEX_PATH"] = str(data_dir / "index" / "vector")
+    os.environ["PROJECTS_DB_PATH"] = str(data_dir / "projects.db")
+    os.environ.pop("REDIS_URL", None)
+
+
+async def run(args) -> Dict[str, Any]:
+    work_dir = Path(tempfile.mkdtemp(prefix="bimai-bench-"))
+    _configure_environment(work_dir / "data")
+
+    from app.services.data_core.engine import DataCoreEngine
+    from app.services.data_core.librarian.uploader import GeminiUploader, FakeFilesAPI
+    from app.services.data_core.router import engine as router_module
+
+    result: Dict[str, Any] = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "sanitize": {},
+        "ingest": {},
+    }
+
+    engine = DataCoreEngine()
+    engine.uploader = GeminiUploader(FakeFilesAPI(args.upload_latency, args.processing_time))
+    for mix in args.mixes:
+        for pages in args.sizes:
+            case = f"{mix}_{pages}"
+            pdf = work_dir / f"{case}.pdf"
+            started = time.perf_counter()
+            kinds = make_pdf(pdf, pages, mix)
+            print(f"INFO: {case}: generated in {time.perf_counter() - started:.2f}s ({pdf.stat().st_size / 1e6:.1f} MB)")
+            result["sanitize"][case] = {"page_kinds": kinds, **bench_sanitize(pdf, pages, work_dir, args.workers)}
+            result["ingest"][case] = await bench_ingest(engine, pdf, pages)
+            print(f"INFO: {case}: sanitize {result['sanitize'][case]['pages_per_sec']} p/s, "
+                  f"ingest {result['ingest'][case]['pages_per_sec']} p/s")
+            pdf.unlink()
+
+    FakeGenerativeModel.latency = args.llm_latency
+    router_module.get_model = FakeGenerativeModel
+    router = router_module.DataCoreRouter()
+    router.search_client = DelayedSearch(router.search_client, args.search_latency)
+    result["query"] = await bench_query(router, args.queries)
+    print(f"INFO: query cold {result['query']['cold']}, warm {result['query']['warm']}")
+
+    result["upload"] = await bench_upload(args.upload_files, args.upload_concurrency,
+                                          args.upload_latency, args.processing_time)
+    print(f"INFO: upload {result['upload']}")
+    return result
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=_int_list, default=[10, 100, 1000], help="Páginas por PDF sintético")
+    parser.add_argument("--mixes", type=lambda v: v.split(","), default=["text", "image", "mixed"])
+    parser.add_argument("--workers", type=int, default=None, help="Procesos del sanitizador (SANITIZER_WORKERS)")
+    parser.add_argument("--upload-latency", type=float, default=0.2, help="Segundos por subida simulada")
+    parser.add_argument("--processing-time", type=float, default=0.5, help="Segundos en PROCESSING simulado")
+    parser.add_argument("--search-latency", type=float, default=0.02, help="Segundos por búsqueda en un Store")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Segundos por respuesta del modelo")
+    parser.add_argument("--queries", type=int, default=60, help="Consultas sintéticas además del set etiquetado")
+    parser.add_argument("--upload-files", type=int, default=64)
+    parser.add_argument("--upload-concurrency", type=_int_list, default=[1, 4, 16, 64])
+    parser.add_argument("--output", type=Path, default=None, help="JSON de resultados (por defecto results/<commit>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="JSON de una corrida anterior para detectar regresiones")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Empeoramiento tolerado (fracción)")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+
+    output = args.output or RESULTS_DIR / f"{result['commit'] or time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"INFO: Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, result, args.tolerance)
+        for item in regressions:
+            print(f"WARN: Regression in {item['metric']}: {item['baseline']} -> {item['current']} ({item['change']:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"INFO: No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
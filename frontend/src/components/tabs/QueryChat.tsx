@@ -1,5 +1,8 @@
 import { Send, ShieldCheck, ExternalLink } from 'lucide-react';
-import { useState } from 'react';
+import { useEffect, useState } from 'react';
+
+const API_URL = 'http://127.0.0.1:8000/api/v1';
+const PAGE_DPI = 110;
 
 interface Message {
   id: string;
@@ -7,6 +10,7 @@ interface Message {
   content: string;
   confidence?: number;
   sources?: string[];
+  evidence?: Citation[];
   timestamp: Date;
 }
 
@@ -14,6 +18,56 @@ interface Citation {
   code: string;
   article: string;
   text: string;
+  documentId?: string;
+  pageNumber?: number;
+}
+
+interface CitationFrame {
+  document_id: string | null;
+  source_file: string;
+  article_id: string | null;
+  page_number: number;
+  text_snippet: string;
+}
+
+interface PageHighlights {
+  width: number;
+  height: number;
+  rects: [number, number, number, number][];
+}
+
+// Cited page rendered by the backend (cached PNG) with the snippet highlighted on top
+function CitationPage({ citation }: { citation: Citation }) {
+  const [highlights, setHighlights] = useState<PageHighlights | null>(null);
+  const pageUrl = `${API_URL}/documents/${citation.documentId}/pages/${citation.pageNumber}`;
+
+  useEffect(() => {
+    const controller = new AbortController();
+    setHighlights(null);
+    fetch(`${pageUrl}/highlights?text=${encodeURIComponent(citation.text)}`, { signal: controller.signal })
+      .then((res) => (res.ok ? res.json() : null))
+      .then(setHighlights)
+      .catch(() => undefined);
+    return () => controller.abort();
+  }, [pageUrl, citation.text]);
+
+  return (
+    <div className="relative border-b border-slate-700 bg-white">
+      <img src={`${pageUrl}/image?dpi=${PAGE_DPI}`} alt={`${citation.code} p.${citation.pageNumber}`} className="w-full" />
+      {highlights?.rects.map(([x0, y0, x1, y1], idx) => (
+        <div
+          key={idx}
+          className="absolute bg-yellow-400/40 rounded-sm"
+          style={{
+            left: `${(x0 / highlights.width) * 100}%`,
+            top: `${(y0 / highlights.height) * 100}%`,
+            width: `${((x1 - x0) / highlights.width) * 100}%`,
+            height: `${((y1 - y0) / highlights.height) * 100}%`,
+          }}
+        />
+      ))}
+    </div>
+  );
 }
 
 export default function QueryChat() {
@@ -24,7 +78,9 @@ export default function QueryChat() {
     text: 'Los establecimientos de salud del segundo y tercer nivel de atención deberán contar con sistemas de climatización que garanticen las condiciones de temperatura y humedad relativa apropiadas para cada ambiente según su función específica. Las salas de operaciones mantendrán una temperatura entre 20°C y 24°C, con humedad relativa entre 50% y 60%.',
   });
 
-  const [messages] = useState<Message[]>([
+  const [input, setInput] = useState('');
+  const [isStreaming, setIsStreaming] = useState(false);
+  const [messages, setMessages] = useState<Message[]>([
     {
       id: '1',
       type: 'user',
@@ -45,6 +101,83 @@ export default function QueryChat() {
     setSelectedCitation(citation);
   };
 
+  const handleSend = async () => {
+    const query = input.trim();
+    if (!query || isStreaming) return;
+
+    const now = Date.now();
+    const replyId = `${now}-reply`;
+    setInput('');
+    setIsStreaming(true);
+    setMessages((prev) => [
+      ...prev,
+      { id: `${now}-user`, type: 'user', content: query, timestamp: new Date() },
+      { id: replyId, type: 'system', content: '', timestamp: new Date() },
+    ]);
+
+    const updateReply = (update: (message: Message) => Message) =>
+      setMessages((prev) => prev.map((m) => (m.id === replyId ? update(m) : m)));
+
+    try {
+      const response = await fetch(`${API_URL}/query/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ query }),
+      });
+
+      if (!response.ok) {
+        const errorText = await response.text();
+        throw new Error(`Server responded with ${response.status}: ${errorText}`);
+      }
+
+      if (!response.body) throw new Error('No response body');
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || ''; // Keep the last incomplete line in buffer
+
+        for (const line of lines) {
+          if (line.trim() === '') continue;
+          const frame = JSON.parse(line);
+
+          // Citations arrive first, right after retrieval
+          if (frame.type === 'citations') {
+            const evidence: Citation[] = frame.citations.map((c: CitationFrame) => ({
+              code: c.source_file,
+              article: c.article_id || `Página ${c.page_number}`,
+              text: c.text_snippet,
+              documentId: c.document_id ?? undefined,
+              pageNumber: c.page_number,
+            }));
+            updateReply((m) => ({
+              ...m,
+              evidence,
+              sources: evidence.map((c) => `${c.code} - ${c.article}`),
+            }));
+            if (evidence.length > 0) setSelectedCitation(evidence[0]);
+          } else if (frame.type === 'token') {
+            updateReply((m) => ({ ...m, content: m.content + frame.text }));
+          } else if (frame.type === 'metadata') {
+            updateReply((m) => ({ ...m, confidence: frame.confidence_score }));
+          }
+        }
+      }
+    } catch (error) {
+      console.error('Query failed:', error);
+      updateReply((m) => ({ ...m, content: `Error: ${error instanceof Error ? error.message : String(error)}` }));
+    } finally {
+      setIsStreaming(false);
+    }
+  };
+
   return (
     <div className="flex h-full">
       <div className="w-64 border-r border-slate-800 bg-slate-900/50 flex flex-col">
@@ -136,11 +269,13 @@ export default function QueryChat() {
                             <button
                               key={idx}
                               onClick={() =>
-                                handleCitationClick({
-                                  code: source.split(' - ')[0],
-                                  article: source.split(' - ')[1] || '',
-                                  text: selectedCitation.text,
-                                })
+                                handleCitationClick(
+                                  message.evidence?.[idx] ?? {
+                                    code: source.split(' - ')[0],
+                                    article: source.split(' - ')[1] || '',
+                                    text: selectedCitation.text,
+                                  }
+                                )
                               }
                               className="px-2 py-1 bg-slate-700 hover:bg-slate-600 text-slate-300 text-xs rounded border border-slate-600 transition-colors flex items-center gap-1"
                             >
@@ -183,10 +318,17 @@ export default function QueryChat() {
           <div className="flex gap-2">
             <input
               type="text"
+              value={input}
+              onChange={(e) => setInput(e.target.value)}
+              onKeyDown={(e) => e.key === 'Enter' && handleSend()}
               placeholder="Ask about regulations, specifications, or project context..."
               className="flex-1 px-4 py-2.5 bg-slate-800 text-slate-200 rounded-lg border border-slate-700 focus:outline-none focus:border-blue-500 text-sm"
             />
-            <button className="px-4 py-2.5 bg-blue-600 hover:bg-blue-700 text-white rounded-lg transition-colors flex items-center gap-2">
+            <button
+              onClick={handleSend}
+              disabled={isStreaming}
+              className="px-4 py-2.5 bg-blue-600 hover:bg-blue-700 disabled:opacity-50 text-white rounded-lg transition-colors flex items-center gap-2"
+            >
               <Send className="w-4 h-4" />
               Send
             </button>
@@ -205,12 +347,21 @@ export default function QueryChat() {
                 <span className="text-xs font-mono font-semibold text-blue-400">
                   {selectedCitation.code}
                 </span>
-                <button className="p-1 hover:bg-slate-800 rounded transition-colors">
+                <button
+                  onClick={() =>
+                    selectedCitation.documentId &&
+                    window.open(`${API_URL}/documents/${selectedCitation.documentId}/file`, '_blank')
+                  }
+                  className="p-1 hover:bg-slate-800 rounded transition-colors"
+                >
                   <ExternalLink className="w-3.5 h-3.5 text-slate-400" />
                 </button>
               </div>
               <span className="text-xs text-slate-400">{selectedCitation.article}</span>
             </div>
+            {selectedCitation.documentId && selectedCitation.pageNumber && (
+              <CitationPage citation={selectedCitation} />
+            )}
             <div className="p-4">
               <p className="text-sm text-slate-300 leading-relaxed">{selectedCitation.text}</p>
             </div>